@@ -0,0 +1,109 @@
+"""Measures decode time and peak memory for large gzipped API responses,
+comparing the old read-everything-then-gunzip approach with the streaming
+ResponseDecoder. Each method runs in a forked child, so that peak memory
+can be read from the child's maximum resident set size.
+
+    python benchmarks/bench_decode.py [recorded response files...]
+
+Without arguments, large categorymembers and revisions responses are
+generated instead. Recorded files may be gzipped or plain JSON.
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import resource
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cerabot.wiki.decoding import ResponseDecoder, ijson
+
+class Reply(object):
+    """Stands in for an HTTP reply, serving *body* from memory."""
+
+    def __init__(self, body, gzipped=True):
+        self._stream = StringIO(body)
+        self.headers = {"Content-Encoding": "gzip"} if gzipped else {}
+
+    def read(self, amt=None):
+        return self._stream.read() if amt is None else self._stream.read(amt)
+
+def compress(data):
+    stream = StringIO()
+    zipper = gzip.GzipFile(fileobj=stream, mode="wb")
+    zipper.write(data)
+    zipper.close()
+    return stream.getvalue()
+
+def categorymembers(count=300000):
+    members = [{"pageid": i, "ns": 0, "title": u"Page number {0}".format(i)}
+               for i in xrange(count)]
+    return json.dumps({"batchcomplete": "",
+                       "query": {"categorymembers": members}})
+
+def revisions(pages=50, size=400000):
+    text = u"Lorem ipsum [[dolor]] sit {{amet}}, consectetur.\n" * (size / 50)
+    result = {}
+    for i in xrange(pages):
+        result[str(i)] = {"pageid": i, "ns": 0, "title": u"Page {0}".format(i),
+                          "revisions": [{"user": u"Someone", "*": text}]}
+    return json.dumps({"batchcomplete": "", "query": {"pages": result}})
+
+def old_decode(reply):
+    result = reply.read()
+    if reply.headers.get("Content-Encoding") == "gzip":
+        stream = StringIO(result)
+        zipper = gzip.GzipFile(fileobj=stream)
+        result = zipper.read()
+    return json.loads(result)
+
+def new_decode(reply):
+    return ResponseDecoder().decode(reply)
+
+def new_iter(reply):
+    return sum(1 for item in ResponseDecoder().iter_items(
+        reply, ["query", "categorymembers"]))
+
+def measure(method, body, gzipped):
+    """Runs *method* in a child process, returning (seconds, peak KiB)."""
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.time()
+        method(Reply(body, gzipped))
+        elapsed = time.time() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+        os.write(write, json.dumps([elapsed, peak]))
+        os._exit(0)
+    os.close(write)
+    data = os.read(read, 4096)
+    os.waitpid(pid, 0)
+    return json.loads(data)
+
+def main(paths):
+    if paths:
+        samples = []
+        for path in paths:
+            with open(path, "rb") as fp:
+                body = fp.read()
+            samples.append((os.path.basename(path), body,
+                            body[:2] == "\x1f\x8b"))
+    else:
+        samples = [("categorymembers", compress(categorymembers()), True),
+                   ("revisions", compress(revisions()), True)]
+    methods = [("old", old_decode), ("streaming", new_decode)]
+    if ijson:
+        methods.append(("ijson items", new_iter))
+    for name, body, gzipped in samples:
+        print "{0}: {1:.1f} KiB on the wire".format(name, len(body) / 1024.0)
+        for label, method in methods:
+            elapsed, peak = measure(method, body, gzipped)
+            print "  {0:>12}: {1:8.1f} ms, peak +{2:.1f} MiB".format(
+                label, elapsed * 1000, peak / 1024.0)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,44 @@
+"""Measures how long it takes to create a Site and have it ready for use,
+without a siteinfo snapshot (cold) and with one (warm).
+
+    python benchmarks/bench_startup.py [runs] [latency in ms]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cerabot.wiki.api import Site
+from cerabot.wiki.fakeapi import FakeAPIServer
+
+CONFIG = {"throttle": 0, "read_throttle": 0}
+
+def run(server, runs, snapshot=None):
+    requests = server.requests
+    start = time.time()
+    for i in xrange(runs):
+        site = Site(base_url=server.base_url, config=CONFIG,
+                    snapshot=snapshot)
+        site.opener.close()
+    elapsed = (time.time() - start) / runs
+    return elapsed, float(server.requests - requests) / runs
+
+def main(runs=50, latency=100):
+    server = FakeAPIServer(connect_delay=latency / 1000.0,
+                       latency=latency / 1000.0).start()
+    directory = tempfile.mkdtemp()
+    snapshot = os.path.join(directory, "siteinfo.json")
+    Site(base_url=server.base_url, config=CONFIG).save_snapshot(snapshot)
+    print "{0} startups, {1} ms latency".format(runs, latency)
+    for name, path in (("cold", None), ("warm", snapshot)):
+        elapsed, requests = run(server, runs, path)
+        print "{0:>6}: {1:8.2f} ms per startup, {2} requests".format(
+            name, elapsed * 1000, requests)
+    shutil.rmtree(directory)
+    server.shutdown()
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,44 @@
+"""Measures API requests per second through Site.query with the default
+keep-alive PooledOpener against a plain urllib2 opener, which opens a new
+connection for every request.
+
+    python benchmarks/bench_transport.py [requests] [connect delay in ms]
+"""
+import os
+import sys
+import time
+from cookielib import CookieJar
+from urllib2 import build_opener, HTTPCookieProcessor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cerabot.wiki.api import Site
+from cerabot.wiki.fakeapi import FakeAPIServer
+
+CONFIG = {"throttle": 0, "read_throttle": 0, "maxlag": 10, "max_retries": 3}
+QUERY = {"action": "query", "meta": "userinfo"}
+
+def run(server, site, count):
+    connections = server.connections
+    start = time.time()
+    for i in xrange(count):
+        site.query(dict(QUERY))
+    rate = count / (time.time() - start)
+    return rate, server.connections - connections
+
+def main(count=500, delay=10):
+    server = FakeAPIServer(connect_delay=delay / 1000.0).start()
+    urllib2_site = Site(base_url=server.base_url, config=CONFIG,
+                        opener=build_opener(HTTPCookieProcessor(CookieJar())))
+    pooled_site = Site(base_url=server.base_url, config=CONFIG)
+    print "{0} requests to {1}, {2} ms per new connection".format(
+        count, server.base_url, delay)
+    for name, site in (("urllib2", urllib2_site), ("pooled", pooled_site)):
+        rate, connections = run(server, site, count)
+        print "{0:>10}: {1:8.1f} req/s over {2} connections".format(
+            name, rate, connections)
+    pooled_site.opener.close()
+    server.shutdown()
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,286 @@
+"""Benchmarks the hot paths of the library offline, and compares them with
+a stored baseline so that regressions are caught before they reach the
+bots.
+
+    python benchmarks/run.py [--save FILE] [--compare FILE] [names...]
+
+A FakeWiki is built from generated fixtures (or --fixture, a JSON file
+in the format FakeWiki takes), each benchmark is run once against a local
+FakeAPIServer with a RecordingOpener, and then measured against a
+ReplayOpener serving those recorded responses, so that neither the
+network nor the fake server count towards the results.
+
+Every benchmark runs in a forked child and reports:
+
+    ops/s     operations per second, the best of --repeat runs
+    objects   gc-tracked objects left behind by one operation before the
+              collector runs (garbage cycles and anything retained);
+              Python 2 has no allocation tracer to count them all
+    peak KiB  growth of the child's peak resident set size over the run
+
+With --compare, results more than --threshold percent worse than the
+baseline are flagged and the exit status is 1. The baseline kept in
+benchmarks/baseline.json was saved with --min-time 0.5; rates depend on
+the machine, so save a fresh one before comparing on another.
+"""
+import os
+import gc
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import resource
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cerabot.wiki.api import Site
+from cerabot.wiki.page import Page
+from cerabot.wiki.category import Category
+from cerabot.wiki.cache import ParseCache
+from cerabot.wiki.fakeapi import FakeWiki, FakeAPIServer
+from cerabot.wiki.replay import RecordingOpener, ReplayOpener
+
+CONFIG = {"throttle": 0, "read_throttle": 0}
+ARTICLE = u"Article 1"
+CATEGORY = u"Category:Large"
+USER = u"User 1"
+FILES = [u"File:Member {0}.png".format(i) for i in xrange(50)]
+CONTENT_QUERY = {"action": "query", "prop": "revisions|langlinks|extlinks",
+                 "titles": ARTICLE, "rvprop": "ids|user|content|timestamp",
+                 "rvdir": "older"}
+LIST_QUERY = {"action": "query", "list": "allpages", "aplimit": "max"}
+
+def article(rand, index, paragraphs=60):
+    """Returns the wikitext of a long, link heavy article."""
+    parts = [u"'''Article {0}''' is a made up article.".format(index)]
+    for i in xrange(paragraphs):
+        if i % 10 == 0:
+            parts.append(u"\n== Section {0} ==\n".format(i / 10))
+        words = []
+        for j in xrange(40):
+            pick = rand.random()
+            if pick < 0.08:
+                words.append(u"[[Target {0}|link {1}]]".format(
+                    rand.randint(1, 500), j))
+            elif pick < 0.1:
+                words.append(u"{{{{Cite web|url=http://example.org/{0}|"
+                             u"title=Source {0}}}}}".format(rand.randint(1,
+                                                                     999)))
+            else:
+                words.append(u"word{0}".format(rand.randint(1, 5000)))
+        parts.append(u" ".join(words) + u"\n")
+        if i % 15 == 0:
+            parts.append(u"[[File:Image {0}.jpg|thumb|A caption]]\n".format(i))
+    parts.append(u"{{Infobox|name=Article|value=[[Nested link]]}}\n")
+    for i in xrange(12):
+        parts.append(u"[[Category:Topic {0}]]\n".format(i))
+    return u"".join(parts)
+
+def make_fixture(seed=1, articles=20, members=2000):
+    """Returns generated fixture data for FakeWiki."""
+    rand = random.Random(seed)
+    pages = {}
+    for i in xrange(1, articles + 1):
+        revisions = [{"text": article(rand, i), "user": u"User {0}".format(r),
+                      "timestamp": u"2015-01-0{0}T00:00:00Z".format(r)}
+                     for r in xrange(1, 4)]
+        langlinks = dict((lang, u"Article {0}".format(i)) for lang in
+                         ("de", "fr", "es", "it", "nl", "pl", "sv", "ja"))
+        pages[u"Article {0}".format(i)] = {"revisions": revisions,
+                                           "langlinks": langlinks}
+    pages[CATEGORY] = u"A large category."
+    for i in xrange(members):
+        pages[u"Member {0}".format(i)] = u"[[{0}]]".format(CATEGORY)
+    for i in xrange(50):
+        pages[u"Category:Sub {0}".format(i)] = u"[[{0}]]".format(CATEGORY)
+    files = dict((u"File:Member {0}.png".format(i),
+                  {"text": u"[[{0}]]".format(CATEGORY), "size": 1024})
+                 for i in xrange(50))
+    users = dict((u"User {0}".format(i), {"groups": ["bot"],
+                  "editcount": i * 100, "emailable": True,
+                  "registration": "2015-01-01T00:00:00Z"})
+                 for i in xrange(1, 4))
+    return {"pages": pages, "files": files, "users": users}
+
+def bench_page_load(site):
+    return lambda: Page(site, ARTICLE, load_content=False).load()
+
+def bench_page_load_content(site):
+    return lambda: Page(site, ARTICLE).load()
+
+def bench_parse_content(site):
+    page = Page(site, ARTICLE, load_content=False)
+    page.load()
+    res = site.query(dict(CONTENT_QUERY), query_continue=True,
+                     prefix=("rv", "ll", "el"))
+    def run():
+        page._load_content(res)
+        return page.templates
+    return run
+
+def bench_parse_cached(site):
+    site.parse_cache = ParseCache()
+    return bench_parse_content(site)
+
+def bench_category_load(site):
+    return lambda: Category(site, CATEGORY).load_attributes(
+        get_all_members=True)
+
+def bench_file_load(site):
+    return lambda: site.load_files(FILES)
+
+def bench_user_load(site):
+    return lambda: site.user(USER)
+
+def bench_query_decode(site):
+    return lambda: site._query(dict(LIST_QUERY))
+
+BENCHMARKS = [("page_load", bench_page_load),
+              ("page_load_content", bench_page_load_content),
+              ("parse_content", bench_parse_content),
+              ("parse_cached", bench_parse_cached),
+              ("category_load", bench_category_load),
+              ("file_load", bench_file_load),
+              ("user_load", bench_user_load),
+              ("query_decode", bench_query_decode)]
+
+def record(fixture, path, names):
+    """Runs each benchmark once against a FakeAPIServer, recording the
+    session to *path*."""
+    server = FakeAPIServer(FakeWiki(fixture)).start()
+    opener = RecordingOpener(path)
+    site = Site(base_url=server.base_url, config=CONFIG, opener=opener)
+    for name, bench in BENCHMARKS:
+        if name in names:
+            bench(site)()
+    opener.close()
+    server.shutdown()
+    server.server_close()
+
+def measure(bench, path, min_time, repeat):
+    """Measures *bench* against the replies recorded at *path*, in a child
+    process, taking the best rate of *repeat* runs sharing *min_time*
+    seconds between them. Returns a dict of results."""
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        try:
+            site = Site(base_url="//replay.invalid", config=CONFIG,
+                        opener=ReplayOpener(path))
+            op = bench(site)
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            op()
+            gc.collect()
+            gc.disable()
+            before = gc.get_count()[0]
+            op()
+            objects = gc.get_count()[0] - before
+            gc.enable()
+            gc.collect()
+            best = 0
+            for i in xrange(repeat):
+                count = 0
+                start = time.time()
+                while True:
+                    op()
+                    count += 1
+                    elapsed = time.time() - start
+                    if elapsed >= min_time / repeat:
+                        break
+                best = max(best, count / elapsed)
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - peak
+            result = {"ops": best, "objects": objects, "peak_kib": peak}
+        except Exception as error:
+            result = {"error": "{0}: {1}".format(type(error).__name__, error)}
+        os.write(write, json.dumps(result))
+        os._exit(0)
+    os.close(write)
+    data = []
+    while True:
+        chunk = os.read(read, 4096)
+        if not chunk:
+            break
+        data.append(chunk)
+    os.close(read)
+    os.waitpid(pid, 0)
+    return json.loads("".join(data))
+
+def compare(results, baseline, threshold):
+    """Prints *results* next to *baseline*. Returns the names of the
+    benchmarks that got worse by more than *threshold* (a fraction)."""
+    regressions = []
+    row = "{0:<20} {1:>10} {2:>9} {3:>9}  {4}"
+    print row.format("benchmark", "ops/s", "objects", "peak KiB",
+                     "vs baseline")
+    for name, result in results:
+        if "error" in result:
+            print "{0:<20} {1}".format(name, result["error"])
+            regressions.append(name)
+            continue
+        notes = []
+        old = baseline.get(name)
+        if old:
+            speed = result["ops"] / old["ops"]
+            notes.append("{0:+.1f}% ops/s".format((speed - 1) * 100))
+            worse = speed < 1 - threshold
+            for key, slack in (("objects", 16), ("peak_kib", 1024)):
+                # Small numbers are noisy; peak memory grows by pages.
+                if result[key] > old[key] * (1 + threshold) + slack:
+                    notes.append("{0} {1} -> {2}".format(key, old[key],
+                                                         result[key]))
+                    worse = True
+            if worse:
+                notes.append("REGRESSION")
+                regressions.append(name)
+        print row.format(name, "{0:.1f}".format(result["ops"]),
+                         result["objects"], result["peak_kib"],
+                         ", ".join(notes))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("names", nargs="*", help="benchmarks to run")
+    parser.add_argument("--fixture", help="JSON fixture for FakeWiki")
+    parser.add_argument("--min-time", type=float, default=1.0,
+                        help="seconds to run each benchmark for")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="runs to take the best rate of")
+    parser.add_argument("--save", help="write the results to this file")
+    parser.add_argument("--compare", help="baseline file to compare with")
+    parser.add_argument("--threshold", type=float, default=15,
+                        help="percent change counted as a regression")
+    args = parser.parse_args()
+
+    names = args.names or [name for name, bench in BENCHMARKS]
+    if args.fixture:
+        with open(args.fixture) as fp:
+            fixture = json.load(fp)
+    else:
+        fixture = make_fixture()
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "session.jsonl")
+        record(fixture, path, names)
+        results = [(name, measure(bench, path, args.min_time,
+                                       args.repeat))
+                   for name, bench in BENCHMARKS if name in names]
+    finally:
+        shutil.rmtree(directory)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)
+    regressions = compare(results, baseline, args.threshold / 100.0)
+    if args.save:
+        with open(args.save, "w") as fp:
+            json.dump(dict(results), fp, indent=2, sort_keys=True)
+    if regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -70,6 +70,21 @@ class FilteredError(EditError):
     """An abuse filter has tripped and rejected
     our edit."""
 
+class EditConflictError(EditError):
+    """Someone else edited the page since we
+    loaded it."""
+
+class UploadError(EditError):
+    """An upload failed. For chunked uploads, the
+    `filekey` and `offset` attributes tell where to
+    resume from, when known."""
+    filekey = None
+    offset = None
+
+class DownloadError(CerabotError):
+    """A downloaded file didn't have the size or
+    SHA-1 the wiki has for it."""
+
 class InvalidOptionError(CerabotError):
     """An option or options provided are invalid."""
 
@@ -1,29 +1,54 @@
+import os
 import re
 import sys
 import time
+import zlib
 import itertools
 try:
     import json
 except Exception:
     import simplejson as json
-try:
-    import gzip
-except Exception:
-    gzip = False
-from threading import Lock
+from threading import Lock, Thread
 from copy import deepcopy
-from StringIO import StringIO
 from cookielib import CookieJar
 from urllib import quote_plus
 from cerabot import exceptions
 from urlparse import urlparse
 from platform import python_version as pyv
-from urllib2 import build_opener, HTTPCookieProcessor, URLError
+from urllib2 import URLError, Request
 
 from .page import Page
 from .category import Category
 from .user import User
 from .file import File
+from .connection import PooledOpener
+from .scheduler import RequestScheduler, is_write
+from .cache import make_key
+from .tokens import TokenManager
+from .workers import Future, WorkerPool
+from .decoding import ResponseDecoder
+from .instrumentation import Instrumentation, CountingReply
+from .title import NamespaceIndex
+from .multipart import FilePart, MultipartBody
+from .exclusion import ExclusionChecker
+from .editqueue import EditQueue
+from .revision import Revision
+
+def _merge_results(into, res):
+    """Merges the API result *res* into *into*, combining dicts key by key
+    and extending lists, so that partial per-page data from several
+    continuation rounds adds up instead of being overwritten. The
+    "continue" token is always replaced by the newer one."""
+    for key, val in res.iteritems():
+        old = into.get(key)
+        if key == "continue":
+            into[key] = val
+        elif isinstance(old, dict) and isinstance(val, dict):
+            _merge_results(old, val)
+        elif isinstance(old, list) and isinstance(val, list):
+            old.extend(val)
+        else:
+            into[key] = val
 
 class Site(object):
     """Main point for which interaction with a MediaWiki
@@ -32,13 +57,20 @@ class Site(object):
     USER_AGENT = "Cerabot/{0!r} (wikibot; Python/{1!r}; {2!r})"
     USER_AGENT = USER_AGENT.format("0.1", pyv(), GITHUB)
     config = {"throttle":10,
+              "read_throttle":1,
               "maxlag":10,
-              "max_retries":3}
+              "max_retries":3,
+              "snapshot_ttl":86400,
+              "upload_chunk_size":4 * 2 ** 20}
+    ACTION_RIGHTS = {"email":"sendemail", "unblock":"block",
+                     "watch":"editmywatchlist", "options":"editmyoptions"}
 
     def __init__(self, name=None, base_url="//en.wikipedia.org",
-            project=None, lang=None, namespaces={}, login=(None, None),
+            project=None, lang=None, namespaces=None, login=(None, None),
             secure=False, config=None, user_agent=None, article_path=None,
-            script_path="/w"):
+            script_path="/w", opener=None, scheduler=None, cache=None,
+            snapshot=None, decoder=None, instrumentation=None,
+            parse_cache=None, content_store=None):
         self._name = name
         if not project and not lang:
             self._base_url = base_url
@@ -51,24 +83,49 @@ class Site(object):
                     self._project)
         self._article_path = article_path
         self._script_path = script_path
-        self._namespaces = namespaces
+        self._namespaces = dict(namespaces) if namespaces else {}
+        self._ns_index = None
+        self._general = {}
+        self._snapshot = snapshot
+        self._config = dict(self.config)
         if config:
-            self._config = config
-        else:
-            self._config = self.config
+            self._config.update(config)
         self._login_data = login
         self._secure = secure
-        self._tokens = {}
+        self.tokens = TokenManager(self)
+        self._userinfo = None
+        self._exclusion = None
         if user_agent:
             self._user_agent = user_agent
         else:
             self._user_agent = self.USER_AGENT
 
-        self._throttle, self._maxlag, self._max_retries = self._config.values()
-        self._last_query_time = 0
+        self._throttle = self._config["throttle"]
+        self._maxlag = self._config["maxlag"]
+        self._max_retries = self._config["max_retries"]
+        if scheduler:
+            self.scheduler = scheduler
+        else:
+            self.scheduler = RequestScheduler.from_throttle(
+                self._config["read_throttle"], self._throttle)
+        self.cache = cache
+        self.parse_cache = parse_cache
+        self.content_store = content_store
+        self.decoder = decoder if decoder else ResponseDecoder()
+        if instrumentation:
+            self.instrumentation = instrumentation
+        else:
+            self.instrumentation = Instrumentation()
         self.cookie_jar = CookieJar()
         self.api_lock = Lock()
-        self.opener = build_opener(HTTPCookieProcessor(self.cookie_jar))
+        self._inflight = {}
+        self._inflight_lock = Lock()
+        if opener:
+            self.opener = opener
+            if getattr(opener, "cookie_jar", False) is None:
+                opener.cookie_jar = self.cookie_jar
+        else:
+            self.opener = PooledOpener(self.cookie_jar)
         self.opener.addheaders = [("User-Agent", self._user_agent),
                                   ("Accept-Encoding", "gzip")]
         if self._login_data[0] and self._login_data[1]:
@@ -87,30 +144,33 @@ class Site(object):
         return "&".join(args)
 
     def _query(self, params, query_continue=False, tries=0, idle=5, 
-            non_stop=False, prefix=None):
+            non_stop=False, prefix=None, record=None):
         """Queries the site's API."""
-        last_query = time.time() - self._last_query_time
-        if last_query < self._throttle:
-            throttle = self._throttle - last_query
-            print "Throttling: waiting {0} seconds".format(round(throttle, 2))
-            time.sleep(throttle)
-        params.setdefault("maxlag", self._maxlag)
-        params.setdefault("format", "json")
-        params["continue"] = ""
-        try:
-            if type(prefix).__name__ in ["tuple", "list"]:
-                for p in prefix:
-                    params[p + "limit"] = "max"
-            else:
-                params[prefix + "limit"] = "max"
-        except TypeError:
-            pass
-        protocol = "https:" if self._secure else "http:"
-        url = ''.join((protocol, self._base_url, self._script_path, "/api.php"))
-        data = self.urlencode(params)
+        if record is None:
+            # Retries share the record of the first attempt.
+            record = self.instrumentation.start(params)
+            try:
+                return self._query(params, query_continue, tries, idle,
+                    non_stop, prefix, record)
+            except exceptions.APIError as error:
+                record.error = getattr(error, "code", None) or str(error)
+                raise
+            finally:
+                self.instrumentation.finish(record)
+        record.retries = tries
+        self._wait_turn(params, record)
+        start = time.time()
         try:
-            reply = self.opener.open(url, data)
+            reply, body = self._fetch(params, prefix, record)
         except URLError as e:
+            record.wall_time += time.time() - start
+            if getattr(e, "code", None) in (429, 503) and \
+                    tries < self._max_retries:
+                # The server is overloaded; back off and try again.
+                retry_after = self._retry_after(getattr(e, "hdrs", None))
+                self.scheduler.backoff(retry_after=retry_after or idle)
+                return self._query(params, query_continue, tries + 1,
+                    idle * 2, non_stop, prefix, record)
             if hasattr(e, "code"):
                 exc = "API query could not be completed: Error code: {0}"
                 exc = exc.format(e.code)
@@ -120,36 +180,53 @@ class Site(object):
             else:
                 exc = "API query could not be completed."
             raise exceptions.APIError(exc)
-        
-        result = reply.read()
-        if reply.headers.get("Content-Encoding") == "gzip":
-            stream = StringIO(result)
-            zipper = gzip.GzipFile(fileobj=stream)
-            result = zipper.read()
-        
+        except zlib.error:
+            record.wall_time += time.time() - start
+            e = "API query failed: the reply could not be decompressed"
+            raise exceptions.APIError(e)
+
+        decoding = time.time()
         try:
-            res = json.loads(result)
+            res = self.decoder.loads(body)
         except ValueError:
             e = "API query failed: JSON could not be loaded"
             raise exceptions.APIError(e)
+        finally:
+            now = time.time()
+            record.wall_time += now - start
+        record.decode_time += now - decoding
+        record.bytes_body += len(body)
         
         try:
             code = res["error"]["code"]
             info = res["error"]["info"]
         except (TypeError, ValueError, KeyError):
+            self.scheduler.success()
             if "continue" in res and query_continue:
-                continue_data = self._handle_query_continue(params, res, 
-                    max_continues=5 if not non_stop else "max")
-                res.update(continue_data)
+                rounds = self._query_rounds(self._query, params,
+                    res["continue"], prefix)
+                for count, more in enumerate(rounds, 1):
+                    _merge_results(res, more)
+                    if count >= 5 and not non_stop:
+                        break
+                else:
+                    res.pop("continue", None)
             return res
         
         if code == "maxlag":
             if tries >= self._max_retries:
                 e = "Maximum amount of allowed retries has been exhausted."
-                raise exception.APIError(e)
-            tries += 1
-            time.sleep(idle)
-            return self._query(params, tries=tries, idle=idle*2)
+                raise exceptions.APIError(e)
+            lag = res["error"].get("lag")
+            if lag is None:
+                match = re.search(r"([\d.]+) seconds? lagged", info)
+                lag = float(match.group(1)) if match else None
+            retry_after = self._retry_after(reply.headers)
+            if not lag and not retry_after:
+                retry_after = idle
+            self.scheduler.backoff(lag, retry_after)
+            return self._query(params, query_continue, tries + 1, idle * 2,
+                non_stop, prefix, record)
         else:
             e = "An unknown error occured. Here is the data from the API: {0}"
             return_data = "({0}, {1})".format(code, info)
@@ -157,38 +234,166 @@ class Site(object):
             error.code, error.info = code, info
             raise error
     
+    def _wait_turn(self, params, record=None):
+        """Waits until the scheduler lets the request *params* go. The time
+        spent waiting is added to *record*, if given. No lock is held
+        meanwhile, so a throttled write doesn't hold back other reads."""
+        delay = self.scheduler.reserve(is_write(params))
+        if delay > 0:
+            if record:
+                record.throttle_time += delay
+            self.scheduler.wait(delay)
+
+    def _connection_slot(self):
+        """Returns the lock held while a request is sent and its reply is
+        read. A Site sends one request at a time."""
+        return self.api_lock
+
+    def _fetch(self, params, prefix, record):
+        """Sends the request *params* and reads its reply, holding the
+        connection slot only meanwhile. Returns the reply and its body."""
+        with self._connection_slot():
+            reply = self._open(params, prefix)
+            counted = CountingReply(reply)
+            try:
+                body = self.decoder.read(counted)
+            except zlib.error:
+                reply.close()
+                raise
+            finally:
+                record.bytes_wire += counted.count
+        return reply, body
+
+    def _open(self, params, prefix=None):
+        """Sends the request *params* and returns the reply, ready to be
+        read. Callers wait for the scheduler first, with _wait_turn()."""
+        params.setdefault("maxlag", self._maxlag)
+        params.setdefault("format", "json")
+        params.setdefault("continue", "")
+        try:
+            if type(prefix).__name__ in ["tuple", "list"]:
+                for p in prefix:
+                    params[p + "limit"] = "max"
+            else:
+                params[prefix + "limit"] = "max"
+        except TypeError:
+            pass
+        protocol = "https:" if self._secure else "http:"
+        url = ''.join((protocol, self._base_url, self._script_path, "/api.php"))
+        if any(isinstance(val, FilePart) for val in params.itervalues()):
+            # Files are streamed from disk in a multipart body.
+            body = MultipartBody(params)
+            request = Request(url, body, {"Content-Type": body.content_type})
+            return self.opener.open(request)
+        data = self.urlencode(params)
+        return self.opener.open(url, data)
+
+    def query_items(self, params, path, prefix=None):
+        """Yields each item of the list at *path* in the result of the
+        query *params*, where *path* is a list of keys like ["query",
+        "categorymembers"]. With ijson installed, the reply is parsed as
+        it streams in, so even huge lists never sit in memory at once.
+        Continuations are not followed; see iter_query for that."""
+        record = self.instrumentation.start(params)
+        request = dict(params)
+        start = time.time()
+        try:
+            self._wait_turn(request, record)
+            start = time.time()
+            with self._connection_slot():
+                try:
+                    reply = self._open(request, prefix)
+                except URLError as error:
+                    reply = None
+                    record.error = str(error)
+            if reply is not None:
+                record.error = reply.headers.get("MediaWiki-API-Error")
+                if not record.error:
+                    counted = CountingReply(reply)
+                    try:
+                        for item in self.decoder.iter_items(counted, path):
+                            yield item
+                    except zlib.error:
+                        record.error = "zlib.error"
+                        e = "API query failed: the reply could not be " \
+                            "decompressed"
+                        raise exceptions.APIError(e)
+                    finally:
+                        # Also when the caller stops early, so that the
+                        # connection isn't left half read.
+                        reply.close()
+                        record.bytes_wire = counted.count
+                    return
+                # Error replies are short; reading this one to the end
+                # lets its connection be reused.
+                reply.read()
+                reply.close()
+        finally:
+            # Wall time here includes the time spent by the caller
+            # between items, as the reply is read while they are used.
+            record.wall_time = time.time() - start
+            self.instrumentation.finish(record)
+        # Let the usual path deal with errors and retries. It keeps a
+        # record of its own.
+        result = self.query(params, prefix=prefix)
+        for key in path:
+            result = result.get(key, {})
+        for item in result:
+            yield item
+
+    def _retry_after(self, headers):
+        """Returns the number of seconds in the Retry-After header of
+        *headers*, or None if there isn't one we understand."""
+        try:
+            return float(headers.get("Retry-After"))
+        except (AttributeError, TypeError, ValueError):
+            return None
+
     def _load(self, force=False):
-        """Loads the sites attributes. Called automatically on initiation."""
+        """Loads the sites attributes. Called automatically on initiation.
+        If the site has a snapshot file, it is used instead of querying
+        the API, and refreshed in the background once it gets stale."""
+        if self._snapshot and not force and self._load_snapshot():
+            return
         attrs = [self._name, self._project, self._lang, self._base_url,
                 self._script_path, self._article_path]
         query = {"action":"query", "meta":"siteinfo", "siprop":"general"}
 
         if not self._namespaces or force:
             query["siprop"] += "|namespaces|namespacealiases"
-            result = self._query(query)
+            result = self._dispatch(query, False, False, None)
+            namespaces = {}
             for item in result["query"]["namespaces"].values():
                 ns_id = item["id"]
                 name = item["*"]
                 try:
                     canonical = item["canonical"]
                 except KeyError:
-                    self._namespaces[ns_id] = [name]
+                    namespaces[ns_id] = [name]
                 else:
                     if name != canonical:
-                        self._namespaces[ns_id] = [name, canonical]
+                        namespaces[ns_id] = [name, canonical]
                     else:
-                        self._namespaces[ns_id] = [name]
+                        namespaces[ns_id] = [name]
             
             for item in result["query"]["namespacealiases"]:
                 ns_id = item["id"]
                 alias = item["*"]
-                self._namespaces[ns_id].append(alias)
+                namespaces[ns_id].append(alias)
+            self._namespaces = namespaces
         elif all(attrs):
             return
         else:
             result = self.query(query)
         
-        result = result["query"]["general"]
+        self._load_general(result["query"]["general"])
+        if self._snapshot:
+            self.save_snapshot()
+
+    def _load_general(self, result):
+        """Sets the site's attributes from siteinfo's general info."""
+        self._general = result
+        self._ns_index = None
         self._name = result["wikiid"]
         self._project = result["sitename"].lower()
         self._lang = result["lang"]
@@ -196,31 +401,346 @@ class Site(object):
         self._script_path = result["scriptpath"]
         self._article_path = result["articlepath"]
 
-    def _handle_query_continue(self, request, data, max_continues=5):
-        """Handle \'query-continues\' in API queries."""
-        all_data = {}
-        count = 0
-        last_continue = {}
-        if max_continues == "max":
-            # I solemnly doubt there will ever be this many continues
-            max_continues = 10000
-        while "continue" in data and count < max_continues:
-            query = deepcopy(request)
-            query.update(last_continue)
-            res = self._query(query)
-            if "continue" in res:
-                last_continue = res["continue"]
-            try:
-                if not all_data:
-                    all_data = res
+    def _load_snapshot(self):
+        """Loads the site's attributes from its snapshot file. Returns False
+        if there is no usable snapshot."""
+        try:
+            with open(self._snapshot, "rb") as fp:
+                data = json.loads(fp.read())
+            namespaces = dict((int(ns_id), names) for ns_id, names in
+                              data["namespaces"].iteritems())
+            general, saved = data["general"], data["saved"]
+        except (IOError, ValueError, KeyError, AttributeError):
+            return False
+        self._namespaces = namespaces
+        self._load_general(general)
+        if time.time() - saved > self._config["snapshot_ttl"]:
+            thread = Thread(target=self._refresh_snapshot)
+            thread.daemon = True
+            thread.start()
+        return True
+
+    def _refresh_snapshot(self):
+        """Reloads the site's attributes from the API, which also rewrites
+        the snapshot. Failures are ignored, as the old snapshot will do."""
+        try:
+            self._load(force=True)
+        except (exceptions.APIError, IOError, OSError):
+            pass
+
+    def save_snapshot(self, path=None):
+        """Writes the site's general info and namespaces to *path*, or to
+        the site's snapshot file, so that later Site objects can start up
+        without querying siteinfo."""
+        path = path if path else self._snapshot
+        data = {"saved": time.time(), "general": self._general,
+                "namespaces": self._namespaces}
+        with open(path + ".tmp", "wb") as fp:
+            fp.write(json.dumps(data))
+        os.rename(path + ".tmp", path)
+
+    def _query_rounds(self, query, params, token=None, prefix=None):
+        """Yields the raw result of each round of the continued query
+        *params*, sent through *query*, starting from the continuation
+        *token* if one is given."""
+        while True:
+            request = dict(params)
+            if token:
+                request.update(token)
+            res = query(request, prefix=prefix)
+            yield res
+            token = res.get("continue")
+            if not token:
+                return
+
+    def iter_query(self, params, continue_from=None, prefix=None):
+        """Yields the result of the query *params* one batch at a time,
+        following continuations as it goes, so that only one batch is held
+        in memory at once. Rounds that only complete the per-page data
+        (like revisions or langlinks) of the current batch are merged into
+        it before it is yielded.
+
+        Each batch carries the "continue" token for the rest of the query,
+        unless it is the last one; pass it as *continue_from* to resume
+        the query later from that point."""
+        batch = None
+        for res in self._query_rounds(self.query, params, continue_from,
+                prefix):
+            if batch is None:
+                batch = res
+            else:
+                _merge_results(batch, res)
+            if "continue" not in res:
+                batch.pop("continue", None)
+                yield batch
+            elif "batchcomplete" in res:
+                yield batch
+                batch = None
+
+    def iter_revisions(self, titles_or_pageids, start=None, end=None,
+            content=False, props=None, newer=False):
+        """Yields the revisions of every page in *titles_or_pageids*, which
+        may mix titles, page ids and Page objects, as Revision records.
+        See Page.revisions() for the other arguments.
+
+        The API only gives the history of one page per request, so pages
+        are walked one after the other, as many revisions per request as
+        it allows. Only one batch of revisions is held in memory at once,
+        and the records share one string per page title and user name."""
+        props = list(props or Page.REVISION_PROPS)
+        if content and "content" not in props:
+            props.append("content")
+        params = {"action":"query", "prop":"revisions", "rvlimit":"max",
+                  "rvprop":"|".join(props),
+                  "rvdir":"newer" if newer else "older"}
+        for key, value in (("rvstart", start), ("rvend", end)):
+            if value is not None:
+                if hasattr(value, "strftime"):
+                    value = value.strftime("%Y-%m-%dT%H:%M:%SZ")
+                params[key] = value
+        flags = "flags" in props
+        names = {}
+        for item in titles_or_pageids:
+            query = dict(params)
+            if isinstance(item, Page):
+                if item._title:
+                    query["titles"] = item._title
                 else:
-                    all_data.update(res)
-            except (KeyError, IndexError):
-                pass
-            count += 1
-            data = res
-        data.update(all_data)
-        return data
+                    query["pageids"] = item._pageid
+            elif isinstance(item, (int, long)):
+                query["pageids"] = item
+            else:
+                query["titles"] = item
+            for res in self._query_rounds(self.query, query):
+                for data in res.get("query", {}).get("pages", {}).values():
+                    if "missing" in data or "invalid" in data:
+                        continue
+                    title = data["title"]
+                    for revision in data.get("revisions", []):
+                        yield Revision.from_api(title, revision, flags,
+                                                names)
+
+    def _title_limit(self):
+        """Returns how many titles or page ids the API accepts in a single
+        request: 500 if we have `apihighlimits`, 50 otherwise."""
+        return 500 if "apihighlimits" in self.get_rights() else 50
+
+    def _query_pages(self, params):
+        """Queries the API with *params*, following continuations and
+        merging every round's per-page results into the first one."""
+        res = None
+        for more in self._query_rounds(self.query, params):
+            if res is None:
+                res = more
+            else:
+                _merge_results(res, more)
+        res.pop("continue", None)
+        return res
+
+    def load_pages(self, titles_or_pageids, content=True, fields=None):
+        """Loads many pages at once, sending one combined query for every
+        chunk of titles or page ids the API allows per request, instead of
+        several queries per page. *titles_or_pageids* may mix titles, page
+        ids and Page objects. If *content* is True, each page's content,
+        langlinks and extlinks are loaded as well. *fields* can instead
+        name just the groups of attributes to load, as in Page.FIELDS;
+        anything else is loaded by each page when first asked for.
+
+        Returns a list of loaded Page objects, in the order given. The
+        creator of each page is not loaded, as the API cannot give the
+        first revision of more than one page per request."""
+        groups = self._batch_groups(Page, fields, content)
+        return self._load_batched(Page, titles_or_pageids, groups,
+                                  "Site.load_pages", self._run_chunks)
+
+    def load_files(self, files, content=False, fields=None):
+        """Loads many files at once, like load_pages(), fetching each
+        file's imageinfo together with its page info, for as many files
+        per request as the API allows. *files* may mix File objects and
+        titles, as in the files of a Category. If *content* is True, the
+        content of each description page is loaded as well.
+
+        Returns a list of loaded File objects, in the order given."""
+        groups = self._batch_groups(File, fields, content)
+        if not fields:
+            groups.add("imageinfo")
+        return self._load_batched(File, files, groups, "Site.load_files",
+                                  self._run_chunks)
+
+    def edit_queue(self, workers=4, retries=3, check_exclusion=True):
+        """Returns an EditQueue for editing many pages in the background,
+        with up to *workers* at once, retrying each up to *retries* times
+        on edit conflicts."""
+        return EditQueue(self, workers, retries, check_exclusion)
+
+    def download_files(self, files, directory="", workers=4, verify=True,
+            force=False):
+        """Downloads many files at once into *directory*, by default the
+        home directory, with up to *workers* downloads running at a time.
+        *files* may mix File objects and titles, as in the files of a
+        Category. Each file is downloaded as by File.download().
+
+        Returns a dict mapping each file's title to what download() gave
+        for it, True or False, or the DownloadError it raised, so that one
+        bad file doesn't stop the rest."""
+        directory = os.path.expanduser(directory or "~")
+        files = [f if isinstance(f, File) else File(self, f) for f in files]
+        self.load_files([f for f in files if "imageinfo" not in f._loaded],
+                        fields=("info", "imageinfo"))
+        pool = WorkerPool(workers)
+        results = {}
+        try:
+            futures = []
+            for f in files:
+                local = os.path.join(directory, self.title(f.title).text)
+                futures.append((f, pool.submit(f.download, local, verify,
+                                               force)))
+            for f, future in futures:
+                try:
+                    results[f.title] = future.result()
+                except exceptions.DownloadError as error:
+                    results[f.title] = error
+        finally:
+            pool.shutdown()
+        return results
+
+    def _batch_groups(self, cls, fields, content):
+        """Returns the groups of attributes of *cls* a batch load asks for:
+        those named by *fields*, or else the page info and latest revision,
+        with the content if *content* is True."""
+        if fields:
+            groups = cls._groups(fields)
+        else:
+            groups = set(["info", "revision"])
+            if content:
+                groups.update(["content", "langlinks", "extlinks"])
+        groups.discard("creator")
+        return groups
+
+    def _page_chunks(self, titles_or_pageids, groups, cls=Page):
+        """Turns *titles_or_pageids* into *cls* objects and splits them
+        into chunks of the size allowed per request, each with a query for
+        the attribute *groups*. Returns the pages and a list of (query,
+        [(title or id, Page), ...]) tuples."""
+        pages = []
+        for item in titles_or_pageids:
+            if isinstance(item, Page):
+                pages.append(item)
+            elif isinstance(item, (int, long)):
+                pages.append(cls(self, pageid=item, fields=groups))
+            else:
+                pages.append(cls(self, item, fields=groups))
+
+        query = cls._fields_query(groups)
+        limit = self._title_limit()
+        chunks = []
+        batches = (("titles", [p for p in pages if p._title]),
+                   ("pageids", [p for p in pages if not p._title]))
+        for key, batch in batches:
+            for i in xrange(0, len(batch), limit):
+                chunk = batch[i:i+limit]
+                if key == "titles":
+                    ids = [p._title for p in chunk]
+                else:
+                    ids = [unicode(p._pageid) for p in chunk]
+                params = dict(query)
+                params[key] = u"|".join(ids)
+                chunks.append((params, zip(ids, chunk)))
+        return pages, chunks
+
+    def _consult_store(self, pageid=None):
+        """Tells whether loading content should go through the content
+        store: not if there is none, or it has nothing for the page
+        *pageid*, if given, in which case asking for the content along
+        with everything else saves a request."""
+        store = self.content_store
+        if store is None or not len(store):
+            return False
+        return not pageid or store.has_page(pageid)
+
+    def _load_stored(self, pages):
+        """Loads the content of *pages*, whose info and latest revision are
+        loaded already, from the content store where it has that revision,
+        and asks the API for the rest by revision id, storing them."""
+        store = self.content_store
+        wanted = {}
+        for page in pages:
+            if page._exists is False:
+                content = None
+            elif page._exists and page._revid:
+                content = store.get(page._pageid, page._revid)
+                if content is None:
+                    wanted[page._revid] = page
+                    continue
+            else:
+                continue
+            page._set_content(content)
+            page._loaded.add("content")
+        revids = sorted(wanted)
+        limit = self._title_limit()
+        for i in xrange(0, len(revids), limit):
+            params = {"action": "query", "prop": "revisions",
+                      "rvprop": "ids|content", "revids": u"|".join(
+                          unicode(revid) for revid in revids[i:i+limit])}
+            res = self._query_pages(params)
+            for data in res.get("query", {}).get("pages", {}).values():
+                for revision in data.get("revisions", []):
+                    page = wanted.get(revision.get("revid"))
+                    content = revision.get("*")
+                    if page is None or content is None:
+                        continue
+                    page._set_content(content)
+                    page._loaded.add("content")
+                    store.put(page._pageid, page._revid, page._content)
+
+    def _load_batched(self, cls, titles_or_pageids, groups, label, run):
+        """The body of load_pages() and load_files(): loads the attribute
+        *groups* of *titles_or_pageids* as *cls* objects, in chunks that
+        *run* loads. Content goes through the content store, if any.
+
+        *run* is called with *label*, the chunks, the groups and a
+        function to call once they are loaded, giving the pages; what it
+        returns is returned."""
+        stored = "content" in groups and self._consult_store()
+        if stored:
+            # Content comes from the store, or else by revision id.
+            groups = (groups - set(["content"])) | set(["info", "revision"])
+        pages, chunks = self._page_chunks(titles_or_pageids, groups, cls)
+
+        def finish():
+            if stored:
+                self._load_stored(pages)
+            return pages
+        return run(label, chunks, groups, finish)
+
+    def _run_chunks(self, label, chunks, groups, finish):
+        """Loads *chunks* one after the other, then returns *finish*()."""
+        with self.instrumentation.label(label):
+            for params, chunk in chunks:
+                self._load_chunk(params, chunk, groups)
+            return finish()
+
+    def _load_chunk(self, params, pages, groups):
+        """Runs one chunk's query from _page_chunks() and loads its pages."""
+        self._fan_out(self._query_pages(params), pages, groups)
+
+    def _fan_out(self, res, pages, groups):
+        """Hands each page's part of the batched result *res* to the Page
+        it belongs to, which loads the attribute *groups* from it. *pages*
+        is a list of (title or id, Page) tuples."""
+        result = res["query"]
+        normalized = {}
+        for item in result.get("normalized", []):
+            normalized[item["from"]] = item["to"]
+        found = {}
+        for key, data in result["pages"].items():
+            found[key] = data
+            if "title" in data:
+                found[data["title"]] = data
+        for ident, page in pages:
+            data = found.get(normalized.get(ident, ident))
+            if data:
+                page._fill(data, groups)
 
     def page(self, title="", pageid=0, follow_redirects=False):
         """Returns an instance of Page for *title* with *follow_redirects* 
@@ -235,22 +755,58 @@ class Site(object):
 
     def user(self, name=None):
         """Returns an instance of User for *username*."""
-        return User(name)
+        return User(self, name)
 
     def file(self, title, pageid=0, follow_redirects=False):
         """Returns an instance of File for *title* or *pageid*."""
-        return File(title, pageid, follow_redirects)
+        return File(self, title, pageid, follow_redirects)
 
     @property
     def domain(self):
         """Returns the site's web domain, like \"en.wikipedia.org\""""
         return urlparse(self._base_url).netloc
 
-    def get_username(self):
+    def _get_userinfo(self, refresh=False):
+        """Returns the name and the set of rights of the logged in user,
+        asked for once per session, unless *refresh* is True."""
+        if self._userinfo is None or refresh:
+            data = self.query({"action":"query", "meta":"userinfo",
+                               "uiprop":"rights"})
+            info = data["query"]["userinfo"]
+            self._userinfo = (info["name"],
+                              frozenset(info.get("rights", [])))
+        return self._userinfo
+
+    def get_username(self, refresh=False):
         """Gets the name of the user that is currently logged into the site's API.
-        Simple way to ensure that we are logged in."""
-        data = self.query({"action":"query", "meta":"userinfo"})
-        return data["query"]["userinfo"]["name"]
+        Simple way to ensure that we are logged in. The name is only asked
+        for once per session, unless *refresh* is True."""
+        return self._get_userinfo(refresh)[0]
+
+    def get_rights(self, refresh=False):
+        """Returns the set of rights the logged in user has, like "edit"
+        or "apihighlimits", asked for once per session."""
+        return self._get_userinfo(refresh)[1]
+
+    def has_right(self, action):
+        """Tells whether the logged in user's rights allow *action*, like
+        "edit" or "block"."""
+        right = self.ACTION_RIGHTS.get(action, action)
+        return right in self.get_rights()
+
+    @property
+    def exclusion(self):
+        """The ExclusionChecker for the logged in user, telling which pages
+        {{bots}} and {{nobots}} keep us off. It can be replaced by one with
+        the types of message the bot leaves, for optout=."""
+        username = self.get_username()
+        if self._exclusion is None or self._exclusion.username != username:
+            self._exclusion = ExclusionChecker(username)
+        return self._exclusion
+
+    @exclusion.setter
+    def exclusion(self, checker):
+        self._exclusion = checker
 
     def get_cookies(self, name, domain):
         for cookie in self.cookie_jar:
@@ -270,12 +826,85 @@ class Site(object):
 
     def query(self, params, query_continue=False, non_stop=False, 
             prefix=None):
-        """Queries the site's API."""
-        with self.api_lock:
-            i = self._query(params, query_continue, non_stop=non_stop,
-                prefix=prefix)
+        """Queries the site's API. If the site has a cache, read queries
+        are answered from it when possible. A query identical to one that
+        is already in flight from another thread waits for that one's
+        result instead of being sent again."""
+        if params.get("action") != "query":
+            i = self._send(params, query_continue, non_stop, prefix)
+            if self.cache and is_write(params):
+                for name in ("title", "from", "to"):
+                    if params.get(name):
+                        self.cache.invalidate(params[name])
+                if params["action"] == "upload" and params.get("filename"):
+                    # Uploads name the file without its namespace.
+                    self.cache.invalidate(self.title(params["filename"],
+                                                     6).full)
+            return i
+
+        key = make_key(params, query_continue, non_stop, prefix)
+        cacheable = self.cache and self.cache.cacheable(params)
+        if cacheable:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+            request = dict(params)
+        i = self._coalesce(key, params, query_continue, non_stop, prefix)
+        if cacheable:
+            self.cache.put(key, request, i)
+        return i
+
+    def _coalesce(self, key, params, query_continue, non_stop, prefix):
+        """Sends a query, unless one with the same *key* is already in
+        flight, in which case this waits for it and returns a copy of its
+        result. Followers copy from a snapshot taken before the leader's
+        caller gets the result, so none of them see another's changes."""
+        with self._inflight_lock:
+            entry = self._inflight.get(key)
+            leader = entry is None
+            if leader:
+                entry = self._inflight[key] = [Future(), 0]
+            else:
+                entry[1] += 1
+        future = entry[0]
+        if not leader:
+            return deepcopy(future.result())
+        try:
+            i = self._send(params, query_continue, non_stop, prefix)
+        except Exception:
+            with self._inflight_lock:
+                del self._inflight[key]
+            future.set_error()
+            raise
+        with self._inflight_lock:
+            del self._inflight[key]
+            followers = entry[1]
+        if followers:
+            future.set_result(deepcopy(i))
+        else:
+            future.set_result(None)
         return i
 
+    def _send(self, params, query_continue, non_stop, prefix):
+        """Sends a query, getting a new token and trying once more if the
+        one in *params* has expired."""
+        try:
+            return self._dispatch(params, query_continue, non_stop, prefix)
+        except exceptions.APIError as error:
+            if getattr(error, "code", None) != "badtoken":
+                raise
+            token = self.tokens.refresh(params.get("token"))
+            if not token:
+                raise
+            params["token"] = token
+            return self._dispatch(params, query_continue, non_stop, prefix)
+
+    def _dispatch(self, params, query_continue, non_stop, prefix):
+        """Sends a query through _query. Requests still go out one at a
+        time, but throttle waits and backoffs happen outside the lock."""
+        return self._query(params, query_continue, non_stop=non_stop,
+            prefix=prefix)
+
     def _login(self, login, token=None, attempts=0):
         """Logs into the site's API."""
         username, password = login
@@ -289,6 +918,7 @@ class Site(object):
 
         res = i["login"]["result"]
         if res == "Success":
+            self._session_changed()
             self.save_cookie_jar()
         elif res == "NeedToken" and attempts == 0:
             token = i["login"]["token"]
@@ -324,50 +954,25 @@ class Site(object):
     def logout(self):
         """Attempts to logout out the API and clear the cookie jar."""
         self.query({"action":"logout"})
+        self._session_changed()
         self.cookie_jar.clear()
         self.save_cookie_jar()
 
+    def _session_changed(self):
+        """Forgets everything that depends on who is logged in: the user's
+        name and rights, tokens, and cached results."""
+        self._userinfo = None
+        self.tokens.clear()
+        if self.cache:
+            self.cache.clear(backend=True)
+
     def tokener(self, args=[]):
-        i = re.compile("Action (.*?) is not allowed for the current user")
+        """Returns a dict of tokens for the actions in *args*, or for every
+        common action if none are given. Kept for compatibility; use the
+        site's token manager, Site.tokens, instead."""
         valid_args = ["block", "delete", "edit", "email", "import", "move",
                       "options", "patrol", "protect", "unblock", "watch"]
-        if not args:
-            args = valid_args
-        if self._tokens:
-            m = {}
-            for token in args:
-                try:
-                    m[token] = self._tokens[token]
-                except (KeyError, IndexError):
-                    m[token] = None
-                    continue
-            return m
-
-        if not type(args) == list:
-            return
-        query = {"action":"query", "prop":"info", "titles":"Main Page",
-                 "intoken":"|".join(args)}
-        result = self.query(query)
-        res = result["query"]["pages"]
-        _tokens = {}
-        c = res.keys()[0]
-        possible_tokens = res[c]
-        for key, val in possible_tokens.items():
-            if key.endswith("token"):
-                name = key[:key.find("token")]
-                _tokens[name] = val
-                args.pop(args.index(name))
-        
-        if "warnings" in result:
-            a = result["warnings"]["info"]["*"].split("\n")
-            if len(a) > 1:
-                a = [b for b in a if b.lower().startswith("action")]
-            for item in a:
-                name = i.findall(item)
-                name = name[0].strip("'")
-                _tokens[name] = None
-        self._tokens.update(_tokens)
-        return _tokens
+        return self.tokens.fetch(*(args if args else valid_args))
 
     def iterator(self, **kwargs):
         """Iterates over result of api query with *kwargs* as arguments
@@ -396,14 +1001,30 @@ class Site(object):
             result = (i for i in res["query"][list(res["query"])[0]])
         return result 
 
+    @property
+    def namespaces(self):
+        """The site's NamespaceIndex, built from its namespaces the first
+        time it is needed."""
+        index = self._ns_index
+        if index is None:
+            case = self._general.get("case", "first-letter")
+            index = NamespaceIndex(self._namespaces, case)
+            self._ns_index = index
+        return index
+
+    def title(self, title, default_ns=0):
+        """Returns the normalized Title for *title*, taken to be in the
+        namespace *default_ns* if it has no namespace prefix. No queries
+        are made. Raises InvalidPageError for invalid titles."""
+        return self.namespaces.parse(title, default_ns)
+
     def name_to_id(self, name):
         """Returns the associated id to the namespace *name*."""
-        for ns_id, names in self._namespaces.items():
-            if name.lower() in [i.lower() for i in names]:
-                return ns_id
-
-        error = "No such namespace with name {0}."
-        raise exceptions.APIError(error)
+        ns_id = self.namespaces.id_of(name)
+        if ns_id is None:
+            error = "No such namespace with name {0}."
+            raise exceptions.APIError(error.format(name))
+        return ns_id
 
     def id_to_name(self, ns_id, get_all=False):
         """Returns the associated name to the namespace id *ns_id*."""
@@ -411,10 +1032,10 @@ class Site(object):
             if get_all:
                 return self._namespaces[ns_id]
             else:
-                return self._namespaces[ns_id][0]
+                return self.namespaces.name_of(ns_id)
         except KeyError:
             error = "No such id with namespace {0}."
-            raise exceptions.APIError(error)
+            raise exceptions.APIError(error.format(ns_id))
 
     def __repr__(self):
         """Returns a coanonical string representation of Site."""
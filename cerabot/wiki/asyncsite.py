@@ -0,0 +1,87 @@
+from threading import BoundedSemaphore
+
+from .api import Site
+from .page import Page
+from .workers import Future, WorkerPool, gather
+
+__all__ = ["AsyncSite"]
+
+class AsyncSite(Site):
+    """A Site that can have up to *workers* API requests in flight at
+    once. The *_async methods return a Future straight away instead of
+    blocking; call result() on it to wait for the outcome. Queries still
+    go through Site._query, so the configured throttle and maxlag policy
+    apply to each of them."""
+
+    def __init__(self, *args, **kwargs):
+        workers = kwargs.pop("workers", 4)
+        self._slots = BoundedSemaphore(workers)
+        self.pool = WorkerPool(workers)
+        super(AsyncSite, self).__init__(*args, **kwargs)
+
+    def _connection_slot(self):
+        """Unlike Site, this lets up to *workers* requests be sent at once.
+        Throttle waits happen before a slot is taken."""
+        return self._slots
+
+    def query_async(self, params, query_continue=False, non_stop=False,
+            prefix=None):
+        """Queries the site's API in the background. Returns a Future."""
+        return self.pool.submit(self.query, params, query_continue,
+            non_stop, prefix)
+
+    def load_pages_async(self, titles_or_pageids, content=True,
+            fields=None):
+        """Like Site.load_pages, but the chunks are loaded concurrently.
+        Returns a Future holding the list of loaded Page objects."""
+        groups = self._batch_groups(Page, fields, content)
+        return self._load_batched(Page, titles_or_pageids, groups,
+                                  "Site.load_pages", self._run_chunks_async)
+
+    def _run_chunks_async(self, label, chunks, groups, finish):
+        """Loads *chunks* in the background, then *finish*es. Returns a
+        Future holding what *finish* gives."""
+        def labelled(func, *args):
+            with self.instrumentation.label(label):
+                return func(*args)
+
+        futures = [self.pool.submit(labelled, self._load_chunk, params,
+                   chunk, groups) for params, chunk in chunks]
+        result = Future()
+
+        def on_done(future):
+            if future.exc_info():
+                result.set_error(future.exc_info())
+                return
+            try:
+                result.set_result(labelled(finish))
+            except Exception:
+                result.set_error()
+
+        gather(futures).add_done_callback(on_done)
+        return result
+
+    def iter_list(self, params, prefix=None):
+        """Yields every item of a list (or generator) query made with
+        *params*. The next continuation round is fetched in the background
+        while the caller works through the current one."""
+        params = dict(params)
+        params["action"] = "query"
+        future = self.query_async(dict(params), prefix=prefix)
+        while future:
+            res = future.result()
+            if "continue" in res:
+                query = dict(params)
+                query.update(res["continue"])
+                future = self.query_async(query, prefix=prefix)
+            else:
+                future = None
+            for items in res.get("query", {}).values():
+                if isinstance(items, dict):
+                    items = items.values()
+                for item in items:
+                    yield item
+
+    def close(self):
+        """Stops the worker threads once their queued calls are done."""
+        self.pool.shutdown()
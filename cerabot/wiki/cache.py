@@ -0,0 +1,378 @@
+import os
+import time
+import hashlib
+from threading import RLock
+from collections import OrderedDict
+try:
+    import json
+except Exception:
+    import simplejson as json
+
+__all__ = ["LRUCache", "DiskBackend", "ResponseCache", "ParseCache",
+           "make_key"]
+
+def make_key(params, *extra):
+    """Returns a string identifying the API request *params* regardless of
+    the order its keys were given in. *extra* is mixed into the key, for
+    options that change the result but are not parameters."""
+    items = sorted((unicode(key), unicode(val)) for key, val in
+                   params.iteritems() if key not in ("format", "maxlag"))
+    return json.dumps([items, list(extra)], separators=(",", ":"))
+
+
+class LRUCache(object):
+    """A mapping that holds at most *max_size* worth of values, as measured
+    by *sizeof*, throwing away the least recently used ones to make room.
+    *on_evict*, if given, is called with the key and value of each one
+    thrown away, while the cache is locked."""
+
+    def __init__(self, max_size, sizeof=len, on_evict=None):
+        self._max_size = max_size
+        self._sizeof = sizeof
+        self._on_evict = on_evict
+        self._data = OrderedDict()
+        self._size = 0
+        self._lock = RLock()
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, size = self._data.pop(key)
+            except KeyError:
+                return default
+            self._data[key] = value, size
+            return value
+
+    def set(self, key, value):
+        size = self._sizeof(value)
+        with self._lock:
+            self.pop(key)
+            if size > self._max_size:
+                return
+            self._data[key] = value, size
+            self._size += size
+            while self._size > self._max_size:
+                old_key, (old, old_size) = self._data.popitem(last=False)
+                self._size -= old_size
+                self.evictions += 1
+                if self._on_evict:
+                    self._on_evict(old_key, old)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            try:
+                value, size = self._data.pop(key)
+            except KeyError:
+                return default
+            self._size -= size
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+
+class DiskBackend(object):
+    """Keeps cache entries as files in *directory*, one per key, so that
+    they outlive the process."""
+
+    def __init__(self, directory):
+        self._directory = os.path.expanduser(directory)
+        if not os.path.isdir(self._directory):
+            os.makedirs(self._directory)
+
+    def _path(self, key):
+        name = hashlib.sha1(key.encode("utf8")).hexdigest()
+        return os.path.join(self._directory, name)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as fp:
+                entry = json.loads(fp.read())
+        except (IOError, ValueError):
+            return None
+        if entry.get("key") != key:
+            return None
+        return entry
+
+    def set(self, key, entry):
+        entry = dict(entry, key=key)
+        path = self._path(key)
+        with open(path + ".tmp", "wb") as fp:
+            fp.write(json.dumps(entry))
+        os.rename(path + ".tmp", path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        """Deletes every entry."""
+        for name in os.listdir(self._directory):
+            try:
+                os.remove(os.path.join(self._directory, name))
+            except OSError:
+                pass
+
+
+class ResponseCache(object):
+    """Caches the results of read queries, keyed on their parameters.
+
+    Results are kept as JSON, in an LRU holding at most *max_bytes* of it,
+    and optionally in *backend* (like a DiskBackend) as well. How long a
+    result stays fresh depends on the modules it used: *ttls* maps names
+    like "prop=info" to seconds, falling back on *ttl*. A query using
+    several modules gets the shortest of their lifetimes.
+
+    Every entry mentioning a title is dropped when invalidate() is called
+    for it, which Site does after a successful write to that title, and
+    when a newer lastrevid than before is seen for it in a result. When
+    that happened is remembered for the *max_invalidated* titles
+    invalidated last, so that older results in *backend* aren't used."""
+    default_ttls = {"meta=siteinfo": 86400, "list=users": 300,
+                    "prop=categoryinfo": 300, "prop=info": 60}
+    modules = ("meta", "prop", "list", "generator")
+    # Modules whose results depend on who is logged in.
+    user_modules = frozenset(["meta=tokens", "meta=userinfo",
+                              "meta=notifications", "list=watchlist",
+                              "list=watchlistraw"])
+
+    def __init__(self, max_bytes=16 * 2 ** 20, ttl=60, ttls=None,
+                 backend=None, max_invalidated=10000):
+        self._memory = LRUCache(max_bytes, lambda entry: len(entry[1]),
+                                self._unindex)
+        self._backend = backend
+        self._ttl = ttl
+        self._ttls = dict(self.default_ttls)
+        if ttls:
+            self._ttls.update(ttls)
+        self._titles = {}
+        self._revids = {}
+        self._invalidated = OrderedDict()
+        self._max_invalidated = max_invalidated
+        self._lock = RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def cacheable(self, params):
+        """Returns True if the result of *params* may be cached. Only
+        queries are, and not those about the logged in user, like tokens
+        or userinfo."""
+        if params.get("action") != "query" or "intoken" in params:
+            return False
+        for module in self.modules:
+            for name in params.get(module, "").split("|"):
+                if "{0}={1}".format(module, name) in self.user_modules:
+                    return False
+        return True
+
+    def ttl_for(self, params):
+        """Returns how many seconds the result of *params* stays fresh."""
+        ttls = [self._ttl]
+        found = False
+        for module in self.modules:
+            for name in params.get(module, "").split("|"):
+                if name:
+                    ttl = self._ttls.get("{0}={1}".format(module, name))
+                    if ttl is not None:
+                        ttls.append(ttl)
+                        found = True
+        return min(ttls[1:]) if found else self._ttl
+
+    def get(self, key):
+        """Returns a fresh copy of the result cached under *key*, or None."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None and self._backend:
+                stored = self._backend.get(key)
+                if stored:
+                    entry = (stored["expires"], stored["value"],
+                             stored["titles"], stored["stored"])
+                    if self._is_fresh(entry):
+                        self._memory.set(key, entry)
+                    if key in self._memory:
+                        for title in entry[2]:
+                            self._titles.setdefault(title, set()).add(key)
+            if entry is None or not self._is_fresh(entry):
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(entry[1])
+
+    def _is_fresh(self, entry):
+        expires, value, titles, stored = entry
+        if expires < time.time():
+            return False
+        for title in titles:
+            if self._invalidated.get(title, 0) > stored:
+                return False
+        return True
+
+    def put(self, key, params, result):
+        """Caches *result*, the outcome of the query *params*, under
+        *key*."""
+        titles = self._titles_in(params, result)
+        now = time.time()
+        entry = (now + self.ttl_for(params), json.dumps(result),
+                 titles, now)
+        with self._lock:
+            old = self._memory.pop(key)
+            if old is not None:
+                self._unindex(key, old)
+            self._memory.set(key, entry)
+            if key in self._memory:
+                for title in titles:
+                    self._titles.setdefault(title, set()).add(key)
+            else:
+                self._unindex(key, entry)
+        if self._backend:
+            self._backend.set(key, {"expires": entry[0], "value": entry[1],
+                                    "titles": titles, "stored": now})
+
+    def _titles_in(self, params, result):
+        """Returns every title *result* is about, invalidating the older
+        entries of those with a newer lastrevid than we have seen."""
+        titles = set(t for t in params.get("titles", "").split("|") if t)
+        try:
+            query = result["query"]
+        except (KeyError, TypeError):
+            return sorted(titles)
+        for item in query.get("normalized", []):
+            titles.add(item["to"])
+        pages = query.get("pages", {})
+        for page in (pages.values() if isinstance(pages, dict) else pages):
+            title = page.get("title")
+            if not title:
+                continue
+            titles.add(title)
+            revid = page.get("lastrevid")
+            if revid:
+                if revid > self._revids.get(title, revid):
+                    self.invalidate(title)
+                self._revids[title] = revid
+        return sorted(titles)
+
+    def _unindex(self, key, entry):
+        """Forgets that the result cached under *key*, *entry*, mentions
+        its titles, and what we know of titles no result mentions now."""
+        with self._lock:
+            for title in entry[2]:
+                keys = self._titles.get(title)
+                if keys is not None:
+                    keys.discard(key)
+                    if keys:
+                        continue
+                    del self._titles[title]
+                self._revids.pop(title, None)
+
+    def invalidate(self, title):
+        """Drops every cached result mentioning *title*."""
+        with self._lock:
+            self._invalidated.pop(title, None)
+            self._invalidated[title] = time.time()
+            while len(self._invalidated) > self._max_invalidated:
+                self._invalidated.popitem(last=False)
+            self._revids.pop(title, None)
+            for key in list(self._titles.get(title, ())):
+                entry = self._memory.pop(key)
+                if entry is not None:
+                    self._unindex(key, entry)
+                if self._backend:
+                    self._backend.delete(key)
+            self._titles.pop(title, None)
+
+    def clear(self, backend=False):
+        """Drops every result held in memory, and those in the backend as
+        well if *backend* is True, as Site does when the user changes."""
+        with self._lock:
+            self._memory.clear()
+            self._titles.clear()
+            self._revids.clear()
+            if backend and self._backend:
+                self._backend.clear()
+
+    def stats(self):
+        """Returns the cache's hit and miss counts and its memory use."""
+        return {"hits": self.hits, "misses": self.misses,
+                "entries": len(self._memory), "bytes": self._memory.size,
+                "max_bytes": self._memory.max_size,
+                "evictions": self._memory.evictions}
+
+
+class ParseCache(object):
+    """Keeps what was parsed out of the wikitext of page revisions, keyed
+    on title and revision id, so that a revision is only parsed once.
+
+    Parse trees (a page's templates and links) are held in an LRU of at
+    most *max_bytes* of the wikitext they were parsed from. They are shared
+    by every page loading that revision, so should not be changed in place.
+
+    The categories and files of each revision are small, and are kept in
+    *backend* (like a DiskBackend) as well if given, so that later runs
+    need not parse the revision to know them. The trees themselves are
+    not written out: unpickling one costs about as much as parsing the
+    wikitext again."""
+
+    def __init__(self, max_bytes=32 * 2 ** 20, backend=None):
+        self._memory = LRUCache(max_bytes, lambda entry: entry[0])
+        self._backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, title, revid):
+        return u"{0}|{1}".format(revid, title)
+
+    def get(self, title, revid):
+        """Returns a dict with the "categories" and "files" of the revision
+        *revid* of *title*, and its "tree" if it is still in memory, or
+        None if nothing is known about it."""
+        key = self._key(title, revid)
+        entry = self._memory.get(key)
+        if entry is not None:
+            self.hits += 1
+            size, tree, categories, files = entry
+            return {"tree": tree, "categories": categories, "files": files}
+        stored = self._backend.get(key) if self._backend else None
+        if stored is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {"categories": stored["categories"], "files": stored["files"]}
+
+    def put(self, title, revid, size, tree, categories, files):
+        """Stores what was parsed out of the revision *revid* of *title*,
+        *size* characters of wikitext."""
+        key = self._key(title, revid)
+        self._memory.set(key, (size, tree, categories, files))
+        if self._backend:
+            self._backend.set(key, {"categories": categories,
+                                    "files": files})
+
+    def clear(self):
+        """Drops every parse tree held in memory."""
+        self._memory.clear()
+
+    def stats(self):
+        """Returns the cache's hit and miss counts and its memory use."""
+        return {"hits": self.hits, "misses": self.misses,
+                "entries": len(self._memory), "bytes": self._memory.size,
+                "max_bytes": self._memory.max_size,
+                "evictions": self._memory.evictions}
@@ -4,24 +4,49 @@ from .page import Page
 from .file import File
 
 class Category(Page):
-    """Object that represents a single category on a wiki."""
+    """Object that represents a single category on a wiki. Its member
+    counts come in the same query as its page info."""
+    FIELDS = dict(Page.FIELDS, categoryinfo=("size",))
 
-    def load_attributes(self, res=None, get_all_members=False):
-        super(Category, self).load(res)
+    def __init__(self, *args, **kwargs):
+        super(Category, self).__init__(*args, **kwargs)
         self._members = []
         self._subcats = []
-        self._files = []
+        self._file_members = []
         self._count = {}
         self._is_empty = False
 
-        self._load_attributes(res, get_all_members)
+    @classmethod
+    def _fields_query(cls, groups):
+        query = super(Category, cls)._fields_query(groups)
+        if "categoryinfo" in groups:
+            props = query["prop"].split("|") if query["prop"] else []
+            query["prop"] = "|".join(props + ["categoryinfo"])
+        return query
+
+    def _fill(self, data, groups):
+        if "categoryinfo" in groups:
+            info = data.get("categoryinfo", {})
+            self._count = dict((key, info.get(key, 0)) for key in
+                               ("size", "pages", "files", "subcats"))
+        super(Category, self)._fill(data, groups)
+
+    def load_attributes(self, res=None, get_all_members=False):
+        """Loads the category's page attributes and its members. *res* may
+        be an already fetched categorymembers result."""
+        self.load()
+        self._members = []
+        self._subcats = []
+        self._file_members = []
+        self._is_empty = False
+
+        with self.site.instrumentation.label("Category.load_attributes"):
+            self._load_attributes(res, get_all_members)
 
     def _load_attributes(self, res=None, get_all_members=False):
         """Loads attributes about our current category."""
         query_one = {"action":"query", "generator":"categorymembers",
             "gcmtitle":self.title}
-        query_two = {"action":"query", "prop":"categoryinfo", "titles":
-            self.title}
         a = res if res else self.site.query(query_one, prefix="gcm",
             non_stop=get_all_members)
         try:
@@ -34,18 +59,12 @@ class Category(Page):
                 self._subcats.append(c)
             elif cat["ns"] == 6:
                 f = File(self.site, cat["title"])
-                self._files.append(f)
+                self._file_members.append(f)
             else:
                 p = Page(self.site, cat["title"])
                 self._members.append(p)
-        a = self.site.query(query_two)
-        result = a["query"]["pages"].values()[0]["categoryinfo"]
-        self._count.update({"size":result["size"],
-                            "pages":result["pages"],
-                            "files":result["files"],
-                            "subcats":result["subcats"]
-                        })
-        size = len(self._subcats) + len(self._members) + len(self._files)
+        size = len(self._subcats) + len(self._members) + \
+            len(self._file_members)
         if size == 0:
             self._is_empty = True
 
@@ -59,7 +78,7 @@ class Category(Page):
 
     @property
     def files(self):
-        return self._files
+        return self._file_members
 
     @property
     def categories(self):
@@ -71,6 +90,7 @@ class Category(Page):
 
     def size(self, member_type):
         """Gets the amount of *member_type* in our category."""
+        self._require("categoryinfo")
         try:
             count = self._count[member_type]
         except KeyError:
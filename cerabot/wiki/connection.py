@@ -0,0 +1,253 @@
+import socket
+import select
+import itertools
+from threading import Lock
+from httplib import HTTPConnection, HTTPSConnection, HTTPException
+from urllib2 import Request, URLError, HTTPError
+from urlparse import urljoin, parse_qsl
+
+from .scheduler import is_write
+
+__all__ = ["ConnectionPool", "PooledOpener"]
+
+class PooledResponse(object):
+    """Wraps an httplib response so that it looks like the object returned
+    by a urllib2 opener. The underlying connection is handed back to its
+    pool once the body has been read to the end."""
+
+    def __init__(self, response, url, release):
+        self._response = response
+        self._release = release
+        self.url = url
+        self.code = response.status
+        self.msg = response.reason
+        self.headers = response.msg
+
+    def read(self, amt=None):
+        if amt is None:
+            data = self._response.read()
+        else:
+            data = self._response.read(amt)
+        if self._response.isclosed():
+            self._finish(self._response.will_close)
+        return data
+
+    def readline(self):
+        """Reads up to and including the next newline. Only here because
+        HTTPError needs it of the responses it wraps."""
+        chunks = []
+        while True:
+            char = self.read(1)
+            chunks.append(char)
+            if not char or char == "\n":
+                return "".join(chunks)
+
+    def _finish(self, discard):
+        if self._release:
+            release, self._release = self._release, None
+            release(discard)
+
+    def close(self):
+        """Closes the response. A connection whose response was not read
+        to the end can't be reused, so it gets thrown away."""
+        discard = not self._response.isclosed()
+        self._response.close()
+        self._finish(discard)
+
+    def info(self):
+        return self.headers
+
+    def geturl(self):
+        return self.url
+
+    def getcode(self):
+        return self.code
+
+
+class ConnectionPool(object):
+    """Keeps idle HTTP(S) connections alive, per host, so that they can be
+    reused by later requests instead of opening a new socket each time."""
+
+    def __init__(self, maxsize=4, timeout=None):
+        self._maxsize = maxsize
+        self._timeout = timeout
+        self._idle = {}
+        self._lock = Lock()
+
+    def get(self, scheme, host):
+        """Returns an idle connection to *host*, or a new one if there are
+        none. The second item of the result tells if it was reused. Idle
+        connections the server has closed meanwhile are thrown away."""
+        key = (scheme, host)
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                conn = idle.pop() if idle else None
+            if conn is None:
+                return self.connect(scheme, host), False
+            if self._alive(conn):
+                return conn, True
+            conn.close()
+
+    @staticmethod
+    def _alive(conn):
+        """Tells whether the idle *conn* can still be used. An idle socket
+        has nothing to read, unless the server closed its end."""
+        if conn.sock is None:
+            return True
+        try:
+            readable = select.select([conn.sock], [], [], 0)[0]
+        except (socket.error, select.error, ValueError):
+            return False
+        return not readable
+
+    def connect(self, scheme, host):
+        """Opens a brand new connection to *host*."""
+        cls = HTTPSConnection if scheme == "https" else HTTPConnection
+        if self._timeout is None:
+            return cls(host)
+        return cls(host, timeout=self._timeout)
+
+    def put(self, scheme, host, conn):
+        """Hands *conn* back to the pool once we are done with it."""
+        with self._lock:
+            idle = self._idle.setdefault((scheme, host), [])
+            if len(idle) < self._maxsize:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def clear(self):
+        """Closes every idle connection in the pool."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    @property
+    def size(self):
+        with self._lock:
+            return sum(len(conns) for conns in self._idle.values())
+
+
+class PooledOpener(object):
+    """Drop-in replacement for the opener returned by urllib2.build_opener()
+    that keeps connections alive between requests. It shares *cookie_jar*
+    with the rest of the site and follows redirects like urllib2 does."""
+    max_redirects = 10
+
+    def __init__(self, cookie_jar=None, pool=None, maxsize=4, timeout=None):
+        self.cookie_jar = cookie_jar
+        self.pool = pool if pool else ConnectionPool(maxsize, timeout)
+        self.addheaders = [("User-Agent", "Python-urllib/2.7")]
+
+    def open(self, fullurl, data=None):
+        """Opens *fullurl*, which can either be a string or a Request
+        object, POSTing *data* if given."""
+        if isinstance(fullurl, basestring):
+            req = Request(fullurl, data)
+        else:
+            req = fullurl
+            if data is not None:
+                req.add_data(data)
+        for redirect in xrange(self.max_redirects + 1):
+            response = self._open(req)
+            if response.code not in (301, 302, 303, 307):
+                break
+            location = response.headers.get("Location")
+            response.close()
+            if not location:
+                break
+            url = urljoin(req.get_full_url(), location)
+            if response.code == 307:
+                req = Request(url, req.get_data(), req.headers)
+            else:
+                # urllib2 turns a redirected POST into a GET, so do we.
+                headers = dict((k, v) for k, v in req.headers.items()
+                               if k.lower() not in ("content-length",
+                                                    "content-type"))
+                req = Request(url, headers=headers)
+        else:
+            raise HTTPError(response.url, response.code,
+                            "Too many redirects", response.headers, None)
+        if response.code >= 400:
+            raise HTTPError(response.url, response.code, response.msg,
+                            response.headers, response)
+        return response
+
+    def _open(self, req):
+        scheme = req.get_type()
+        host = req.get_host()
+        if not host:
+            raise URLError("no host given")
+        headers = {}
+        for key, val in itertools.chain(self.addheaders,
+                req.headers.items(), req.unredirected_hdrs.items()):
+            headers[key.title()] = val
+        body = req.get_data()
+        if body is not None:
+            headers.setdefault("Content-Type",
+                               "application/x-www-form-urlencoded")
+            if isinstance(body, basestring):
+                headers.setdefault("Content-Length", str(len(body)))
+        if self.cookie_jar is not None:
+            self.cookie_jar.add_cookie_header(req)
+            if req.has_header("Cookie"):
+                headers["Cookie"] = req.get_header("Cookie")
+        method = "POST" if body is not None else "GET"
+
+        conn, reused = self.pool.get(scheme, host)
+        sent = False
+        try:
+            conn.request(method, req.get_selector(), body, headers)
+            sent = True
+            raw = conn.getresponse()
+        except (socket.error, HTTPException) as e:
+            conn.close()
+            rewindable = body is None or isinstance(body, basestring) or \
+                hasattr(body, "seek")
+            # A write that went out whole may have been acted on even if
+            # no reply came back, so it is never sent twice.
+            if not reused or not rewindable or \
+                    (sent and not self._is_read(method, body)):
+                raise URLError(e)
+            # The server dropped a kept-alive connection under us; this
+            # is expected now and then, so retry once on a fresh one.
+            if hasattr(body, "seek"):
+                body.seek(0)
+            conn = self.pool.connect(scheme, host)
+            try:
+                conn.request(method, req.get_selector(), body, headers)
+                raw = conn.getresponse()
+            except (socket.error, HTTPException) as e:
+                conn.close()
+                raise URLError(e)
+
+        def release(discard):
+            if discard:
+                conn.close()
+            else:
+                self.pool.put(scheme, host, conn)
+
+        response = PooledResponse(raw, req.get_full_url(), release)
+        if self.cookie_jar is not None:
+            self.cookie_jar.extract_cookies(response, req)
+        if raw.length == 0:
+            response.read()
+        return response
+
+    @staticmethod
+    def _is_read(method, body):
+        """Tells whether a request can safely be sent again: a GET, or
+        an API query POSTed as a form, which only reads from the wiki."""
+        if method == "GET":
+            return True
+        if not isinstance(body, basestring):
+            return False
+        params = dict(parse_qsl(body, keep_blank_values=True))
+        return params.get("action") == "query" and not is_write(params)
+
+    def close(self):
+        """Closes every idle connection held by this opener."""
+        self.pool.clear()
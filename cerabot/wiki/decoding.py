@@ -0,0 +1,101 @@
+import zlib
+try:
+    import json
+except Exception:
+    import simplejson as json
+try:
+    import ujson
+except ImportError:
+    ujson = None
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+__all__ = ["ResponseDecoder", "iter_body"]
+
+CHUNK_SIZE = 64 * 1024
+
+def iter_body(reply, chunk_size=CHUNK_SIZE):
+    """Yields the body of *reply* in chunks as it comes off the socket,
+    gunzipping it on the way if it was sent compressed."""
+    inflater = None
+    if reply.headers.get("Content-Encoding") == "gzip":
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    while True:
+        chunk = reply.read(chunk_size)
+        if not chunk:
+            break
+        if inflater:
+            chunk = inflater.decompress(chunk)
+        if chunk:
+            yield chunk
+    if inflater:
+        chunk = inflater.flush()
+        if chunk:
+            yield chunk
+
+
+class _ChunkReader(object):
+    """File-like view of an iterator of strings, for ijson."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._buffer = ""
+
+    def read(self, size=-1):
+        if size < 0:
+            data = self._buffer + "".join(self._chunks)
+            self._buffer = ""
+            return data
+        while len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class ResponseDecoder(object):
+    """Turns API replies into Python objects.
+
+    The body is gunzipped a chunk at a time as it is read, so the whole
+    compressed body is never held next to the decompressed one. *loads*
+    is the JSON decoder to use; by default that is ujson if it is
+    installed, and the json module otherwise. With ijson installed,
+    iter_items() can walk a list in a huge reply without decoding all of
+    it at once."""
+
+    def __init__(self, loads=None, chunk_size=CHUNK_SIZE):
+        if loads:
+            self.loads = loads
+        else:
+            self.loads = ujson.loads if ujson else json.loads
+        self.chunk_size = chunk_size
+
+    def read(self, reply):
+        """Returns the whole, decompressed body of *reply*."""
+        return "".join(iter_body(reply, self.chunk_size))
+
+    def decode(self, reply):
+        """Returns the decoded body of *reply*. Raises ValueError if it
+        isn't valid JSON."""
+        return self.loads(self.read(reply))
+
+    def iter_items(self, reply, path):
+        """Yields each item of the list found at *path* in the body of
+        *reply*, where *path* is a list of keys like ["query",
+        "categorymembers"]. Items are parsed one by one if ijson is
+        installed; otherwise the whole body is decoded first."""
+        if ijson:
+            prefix = ".".join(path + ["item"])
+            reader = _ChunkReader(iter_body(reply, self.chunk_size))
+            for item in ijson.items(reader, prefix):
+                yield item
+            return
+        result = self.decode(reply)
+        for key in path:
+            result = result.get(key, {}) if isinstance(result, dict) else {}
+        for item in (result if isinstance(result, list) else []):
+            yield item
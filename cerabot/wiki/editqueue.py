@@ -0,0 +1,84 @@
+from cerabot import exceptions
+from .page import Page
+from .workers import WorkerPool, gather
+
+__all__ = ["EditQueue"]
+
+class EditQueue(object):
+    """Edits many pages in the background, with up to *workers* of them
+    being worked on at once. Edits still go through the site's scheduler,
+    so they are sent no faster than its write throttle allows, while the
+    loading and transforming of other pages carries on meanwhile.
+
+    Each job is a page and a *transform*, a function called with the
+    loaded Page that returns its new text, or None to leave it alone. If
+    someone else edits the page before we save, it is loaded again and
+    transformed again, up to *retries* times. Pages that {{bots}} or
+    {{nobots}} keep us off are skipped, unless *check_exclusion* is False.
+
+        >>> queue = site.edit_queue()
+        >>> future = queue.submit(u"Foo", fix_dates, u"Fixing dates")
+        >>> queue.close()
+        >>> future.result()
+
+    Create one through Site.edit_queue()."""
+
+    def __init__(self, site, workers=4, retries=3, check_exclusion=True):
+        self.site = site
+        self.retries = retries
+        self.check_exclusion = check_exclusion
+        self.pool = WorkerPool(workers)
+
+    def submit(self, page, transform, summary="", callback=None, **kwargs):
+        """Queues an edit of *page*, a Page or a title, made by calling
+        *transform* with it. *kwargs* (bot, minor, ...) are passed on to
+        Page.edit().
+
+        Returns a Future holding the result of the edit, or None if there
+        was nothing to change or the page is excluded. *callback*, if
+        given, is called with that Future once it is done."""
+        if not isinstance(page, Page):
+            page = self.site.page(page)
+        future = self.pool.submit(self._run, page, transform, summary,
+                                  kwargs)
+        if callback:
+            future.add_done_callback(callback)
+        return future
+
+    def submit_many(self, pages, transform, summary="", callback=None,
+                    **kwargs):
+        """Queues an edit of every page in *pages* with the same
+        *transform*. Returns a list of their Futures, in order."""
+        return [self.submit(page, transform, summary, callback, **kwargs)
+                for page in pages]
+
+    def _run(self, page, transform, summary, kwargs):
+        """Loads, transforms and saves *page*, starting over on edit
+        conflicts."""
+        attempt = 0
+        while True:
+            page.load(fields=("info", "content"))
+            if self.check_exclusion and page.is_excluded:
+                return None
+            text = transform(page)
+            if text is None or text == page.content:
+                return None
+            try:
+                return page.edit(text, summary, **kwargs)
+            except exceptions.EditConflictError:
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+
+    def wait(self, futures):
+        """Returns a Future that is done once all of *futures* are."""
+        return gather(futures)
+
+    def close(self, wait=True):
+        """Stops the workers once the edits already queued are done."""
+        self.pool.shutdown(wait)
+
+    @property
+    def pending(self):
+        """How many queued edits no worker has started on yet."""
+        return self.pool.queue_depth
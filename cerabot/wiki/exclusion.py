@@ -0,0 +1,95 @@
+import re
+
+__all__ = ["ExclusionChecker"]
+
+_TEMPLATE = re.compile(ur"\{\{\s*(no)?bots\s*(\|[^{}]*)?\}\}",
+                       re.IGNORECASE | re.UNICODE)
+_NAME = re.compile(ur"[ _\u00a0]+", re.UNICODE)
+
+def _names(value):
+    """Splits a comma separated list of names into a set of normalized
+    ones."""
+    names = (_NAME.sub(u" ", name).strip().lower()
+             for name in value.split(u","))
+    return set(name for name in names if name)
+
+
+class ExclusionChecker(object):
+    """Tells whether the bot *username* is kept off a page by the
+    {{bots}} and {{nobots}} templates in its wikitext:
+
+        {{nobots}}                  no bots at all
+        {{bots}}                    any bot
+        {{bots|allow=A,B}}          only A and B; "all" or "none" also work
+        {{bots|deny=A,B}}           every bot but A and B; "all", "none"
+        {{bots|optout=X,Y}}         no messages of type X or Y, or "all"
+
+    *optout* lists the types of message the bot leaves, if any. A page is
+    excluded if any of its templates excludes the bot.
+
+    The wikitext is only scanned for the templates, not parsed, so that
+    checking a page costs next to nothing next to loading it."""
+
+    def __init__(self, username, optout=()):
+        self.username = username
+        self.optout = tuple(optout)
+        self._name = _NAME.sub(u" ", username).strip().lower()
+        self._optout = set(kind.lower() for kind in optout)
+
+    def __repr__(self):
+        return "ExclusionChecker({0!r}, optout={1!r})".format(self.username,
+                                                             self.optout)
+
+    def _excludes(self, nobots, params):
+        """Tells whether a single template, {{nobots}} if *nobots* is
+        True and {{bots}} otherwise, with the parameter string *params*,
+        excludes the bot."""
+        args = {}
+        for param in params.split(u"|"):
+            name, sep, value = param.partition(u"=")
+            if sep:
+                args[name.strip().lower()] = _names(value)
+        if not args:
+            return nobots
+        if "allow" in args:
+            allowed = args["allow"]
+            if "none" in allowed:
+                return True
+            if "all" not in allowed and self._name not in allowed:
+                return True
+        if "deny" in args:
+            denied = args["deny"]
+            if "all" in denied or self._name in denied:
+                return True
+        if "optout" in args and self._optout:
+            kinds = args["optout"]
+            if "all" in kinds or self._optout & kinds:
+                return True
+        return False
+
+    def is_excluded(self, text):
+        """Returns True if the wikitext *text* keeps the bot off the
+        page."""
+        if not text:
+            return False
+        for match in _TEMPLATE.finditer(text):
+            nobots, params = match.group(1), match.group(2) or u""
+            if self._excludes(bool(nobots), params):
+                return True
+        return False
+
+    def check_many(self, texts):
+        """Checks many pages at once. *texts* is either a dict mapping
+        titles to wikitext, giving back a dict of titles to whether the
+        bot is excluded, or any other iterable of wikitext, giving a list
+        of the same."""
+        if isinstance(texts, dict):
+            return dict((title, self.is_excluded(text))
+                        for title, text in texts.iteritems())
+        return [self.is_excluded(text) for text in texts]
+
+    def allowed(self, pages):
+        """Yields the loaded Pages in *pages* that the bot may edit."""
+        for page in pages:
+            if not self.is_excluded(page.content):
+                yield page
@@ -0,0 +1,1096 @@
+"""A stand-in for a wiki's api.php, serving made up pages, users and files
+from fixture data over a local socket, so that Site, Page, Category, File
+and User can be exercised and benchmarked without a network:
+
+    >>> server = FakeAPIServer(FakeWiki.from_file("fixture.json")).start()
+    >>> site = Site(base_url=server.base_url)
+
+It understands enough of the API for this library: siteinfo, userinfo and
+tokens, the common prop, list and generator modules with continuation,
+login, edit, move, delete, watch and (chunked) upload, and maxlag errors
+while set_lag() is in effect."""
+import re
+import sys
+import time
+import errno
+import socket
+import gzip
+import uuid
+import hashlib
+from cgi import FieldStorage
+from Cookie import SimpleCookie
+from StringIO import StringIO
+from threading import Thread, Lock
+from urllib import quote, unquote
+from urlparse import parse_qs, urlparse
+from SocketServer import ThreadingMixIn
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+import mwparserfromhell
+from dateutil.parser import parse
+try:
+    import json
+except Exception:
+    import simplejson as json
+
+__all__ = ["FakeWiki", "FakeAPIServer"]
+
+SITEINFO = {
+    "general": {"wikiid": "fakewiki", "sitename": "Fakewiki", "lang": "en",
+                "base": "", "generator": "MediaWiki 1.25",
+                "scriptpath": "/w", "articlepath": "/wiki/$1"},
+    "namespaces": {
+        "-2": {"id": -2, "*": "Media", "canonical": "Media"},
+        "-1": {"id": -1, "*": "Special", "canonical": "Special"},
+        "0": {"id": 0, "*": "", "content": ""},
+        "1": {"id": 1, "*": "Talk", "canonical": "Talk"},
+        "2": {"id": 2, "*": "User", "canonical": "User"},
+        "3": {"id": 3, "*": "User talk", "canonical": "User talk"},
+        "4": {"id": 4, "*": "Fakewiki", "canonical": "Project"},
+        "5": {"id": 5, "*": "Fakewiki talk", "canonical": "Project talk"},
+        "6": {"id": 6, "*": "File", "canonical": "File"},
+        "7": {"id": 7, "*": "File talk", "canonical": "File talk"},
+        "10": {"id": 10, "*": "Template", "canonical": "Template"},
+        "11": {"id": 11, "*": "Template talk",
+               "canonical": "Template talk"},
+        "14": {"id": 14, "*": "Category", "canonical": "Category"},
+        "15": {"id": 15, "*": "Category talk",
+               "canonical": "Category talk"},
+    },
+    "namespacealiases": [{"id": 6, "*": "Image"},
+                         {"id": 7, "*": "Image talk"}],
+}
+
+RIGHTS = {
+    "*": ["read", "edit", "createpage", "createtalk"],
+    "user": ["move", "upload", "reupload", "minoredit", "writeapi",
+             "editmywatchlist", "viewmywatchlist", "editmyoptions",
+             "sendemail"],
+    "autoconfirmed": ["autoconfirmed", "editsemiprotected"],
+    "bot": ["bot", "apihighlimits", "noratelimit", "autopatrol"],
+    "sysop": ["delete", "block", "protect", "apihighlimits",
+              "editprotected", "rollback", "noratelimit"],
+}
+
+LIMITS = {"low": 500, "high": 5000, "content": 50, "content_high": 500}
+
+INVALID = re.compile(r"[\[\]{}|#<>]")
+LINKS = re.compile(r"\[\[\s*([^\[\]|]+?)\s*(?:\|[^\[\]]*)?\]\]")
+TEMPLATES = re.compile(r"\{\{\s*([^{}|#]+?)\s*(?:\||\}\})")
+EXTLINKS = re.compile(r"https?://[^\s\[\]<>|{}\"]+")
+REDIRECT = re.compile(r"^#REDIRECT\s*\[\[([^\[\]|]+)", re.I)
+
+def _now():
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+def _md5(text):
+    if isinstance(text, unicode):
+        text = text.encode("utf8")
+    return hashlib.md5(text).hexdigest()
+
+def _error(code, info):
+    return {"error": {"code": code, "info": info}}
+
+
+class FakeWiki(object):
+    """The pages, users and files served by a FakeAPIServer.
+
+    Fixtures are dicts (or JSON files, for from_file()) with optional
+    "siteinfo", "pages", "users" and "files" keys. A page is given either
+    as its text, or as a dict with "text" and optionally "user",
+    "timestamp", "comment", "langlinks" (a dict of language to title) and
+    "protection", or as a dict with a list of such "revisions", oldest
+    first. A user is a dict like {"password": ..., "groups": [...]}, and a
+    file a dict of its imageinfo fields, optionally with its "data", which
+    is then served under /images/."""
+
+    def __init__(self, fixture=None):
+        fixture = fixture or {}
+        self.siteinfo = json.loads(json.dumps(fixture.get("siteinfo",
+                                                          SITEINFO)))
+        self.pages = {}
+        self.users = {}
+        self.files = {}
+        self._ids = {}
+        self._last_pageid = 0
+        self._last_revid = 0
+        self._last_userid = 0
+        self._load_namespaces()
+        for name, user in sorted(fixture.get("users", {}).items()):
+            self.add_user(name, **user)
+        for title, page in sorted(fixture.get("pages", {}).items()):
+            if not isinstance(page, dict):
+                page = {"text": page}
+            page = dict(page)
+            revisions = page.pop("revisions", None) or [
+                dict((key, page.pop(key)) for key in
+                     ("text", "user", "timestamp", "comment") if key in page)]
+            for revision in revisions:
+                self.add_page(title, **revision)
+            self.pages[self.normalize(title)[1]].update(page)
+        for title, info in sorted(fixture.get("files", {}).items()):
+            self.add_file(title, **info)
+
+    @classmethod
+    def from_file(cls, path):
+        """Returns a FakeWiki holding the JSON fixture at *path*."""
+        with open(path) as fp:
+            return cls(json.load(fp))
+
+    def _load_namespaces(self):
+        self._namespaces = {}
+        self._ns_names = {}
+        for ns in self.siteinfo["namespaces"].values():
+            self._namespaces[ns["id"]] = ns["*"]
+            for name in (ns["*"], ns.get("canonical")):
+                if name:
+                    self._ns_names[name.lower()] = ns["id"]
+        for alias in self.siteinfo.get("namespacealiases", []):
+            self._ns_names[alias["*"].lower()] = alias["id"]
+
+    def normalize(self, title):
+        """Returns the namespace and the normalized form of *title*, or
+        (None, *title*) if it isn't a valid title."""
+        title = re.sub(r"[ _]+", " ", unicode(title)).strip()
+        if not title or INVALID.search(title):
+            return None, title
+        ns = 0
+        if ":" in title:
+            prefix, rest = title.split(":", 1)
+            found = self._ns_names.get(prefix.strip().lower())
+            if found is not None:
+                ns, title = found, rest.strip()
+                if not title:
+                    return None, title
+        title = title[0].upper() + title[1:]
+        if ns:
+            title = u"{0}:{1}".format(self._namespaces[ns], title)
+        return ns, title
+
+    def add_page(self, title, text=u"", user=u"Example", timestamp=None,
+                 comment=u""):
+        """Saves a new revision of *title*, creating the page if needed,
+        and returns it."""
+        ns, title = self.normalize(title)
+        if ns is None:
+            raise ValueError("invalid title: {0!r}".format(title))
+        page = self.pages.get(title)
+        if page is None:
+            self._last_pageid += 1
+            page = {"pageid": self._last_pageid, "ns": ns, "title": title,
+                    "revisions": [], "langlinks": {}, "protection": []}
+            self.pages[title] = page
+            self._ids[page["pageid"]] = title
+        self._last_revid += 1
+        parent = page["revisions"][-1]["revid"] if page["revisions"] else 0
+        revision = {"revid": self._last_revid, "parentid": parent,
+                    "user": user, "timestamp": timestamp or _now(),
+                    "comment": comment, "*": unicode(text)}
+        page["revisions"].append(revision)
+        return revision
+
+    def add_user(self, name, password=None, groups=None, editcount=0,
+                 registration=None, emailable=False, gender="unknown",
+                 block=None):
+        """Adds a user. *block* is a dict with "by", "reason" and
+        "expiry" if the user is blocked."""
+        self._last_userid += 1
+        groups = ["*", "user", "autoconfirmed"] + list(groups or [])
+        self.users[name] = {"userid": self._last_userid, "name": name,
+                            "password": password, "groups": groups,
+                            "editcount": editcount, "gender": gender,
+                            "registration": registration or _now(),
+                            "emailable": emailable, "block": block}
+
+    def add_file(self, title, text=u"", user=u"Example", timestamp=None,
+                 size=0, width=0, height=0, sha1=None, mime="image/png",
+                 url=None, data=None):
+        """Adds a file, along with its description page. Unless *url* is
+        given, the file is served by the server under /images/, as *data*
+        if given or as a 404 otherwise."""
+        ns, title = self.normalize(title)
+        if ns != 6:
+            title = self.normalize(u"File:" + title)[1]
+        self.add_page(title, text, user, timestamp)
+        name = title.split(":", 1)[1].replace(" ", "_")
+        if data is not None:
+            size, sha1 = len(data), hashlib.sha1(data).hexdigest()
+        self.files[title] = {
+            "timestamp": timestamp or _now(), "user": user, "size": size,
+            "width": width, "height": height, "mime": mime,
+            "sha1": sha1 or hashlib.sha1(name.encode("utf8")).hexdigest(),
+            "url": url, "data": data,
+            "descriptionurl": u"http://fakewiki.invalid/wiki/" +
+                              title.replace(" ", "_")}
+
+    def file_data(self, name):
+        """Returns the data of the file *name*, as in its URL, and its
+        imageinfo, or (None, None) if there is no data for it."""
+        ns, title = self.normalize(u"File:" + name.decode("utf8"))
+        info = self.files.get(title)
+        if info is None or info["data"] is None:
+            return None, None
+        return info["data"], info
+
+    def page(self, title=None, pageid=None):
+        """Returns the page with *title* or *pageid*, or None."""
+        if pageid is not None:
+            title = self._ids.get(int(pageid))
+            return self.pages.get(title) if title else None
+        return self.pages.get(self.normalize(title)[1])
+
+    def text(self, page):
+        return page["revisions"][-1]["*"]
+
+    def delete(self, title):
+        page = self.pages.pop(title)
+        del self._ids[page["pageid"]]
+        self.files.pop(title, None)
+
+    def rights(self, user):
+        """Returns the rights of *user*, a name or None for anonymous."""
+        groups = self.users[user]["groups"] if user in self.users else ["*"]
+        rights = []
+        for group in groups:
+            rights.extend(r for r in RIGHTS.get(group, []) if r not in rights)
+        return rights
+
+    def links(self, page, ns=None):
+        """Returns the titles *page* links to, in namespace *ns* or in any
+        namespace, in order and without duplicates."""
+        found = []
+        for target in LINKS.findall(self.text(page)):
+            if target.startswith(":"):
+                target = target[1:]
+            link_ns, target = self.normalize(target)
+            if link_ns is None or (ns is not None and link_ns != ns):
+                continue
+            if target not in found:
+                found.append(target)
+        return found
+
+    def members(self, category):
+        """Returns the pages in *category*, sorted by title."""
+        return [page for title, page in sorted(self.pages.items())
+                if category in self.links(page, 14)]
+
+    def redirect(self, page):
+        match = REDIRECT.match(self.text(page))
+        return self.normalize(match.group(1))[1] if match else None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        self.timeout = self.server.idle_timeout
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+        if self.server.connect_delay:
+            time.sleep(self.server.connect_delay)
+
+    def log_message(self, *args):
+        pass
+
+    def _decode(self, params):
+        return dict((key.decode("utf8"), val[0].decode("utf8"))
+                    for key, val in params.items())
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith("/images/"):
+            return self._send_file(unquote(url.path[len("/images/"):]))
+        self._reply(self._decode(parse_qs(url.query, keep_blank_values=True)))
+
+    def _send_file(self, name):
+        data, info = self.server.wiki.file_data(name)
+        if data is None:
+            self._send_empty(404)
+            return
+        modified = parse(info["timestamp"])
+        try:
+            since = parse(self.headers.get("If-Modified-Since", ""))
+        except (TypeError, ValueError):
+            since = None
+        if since and since >= modified:
+            self._send_empty(304)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", info["mime"])
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Last-Modified", modified.strftime(
+            "%a, %d %b %Y %H:%M:%S GMT"))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_empty(self, code):
+        self.send_response(code)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        ctype = self.headers.get("Content-Type", "")
+        if ctype.startswith("multipart/form-data"):
+            form = FieldStorage(fp=self.rfile, headers=self.headers,
+                environ={"REQUEST_METHOD": "POST", "CONTENT_TYPE": ctype})
+            params = {}
+            for key in form.keys():
+                field = form[key]
+                # Files are kept as bytes; everything else is text.
+                params[key.decode("utf8")] = field.value if field.filename \
+                    else field.value.decode("utf8")
+        else:
+            length = int(self.headers.get("Content-Length", 0))
+            params = self._decode(parse_qs(self.rfile.read(length),
+                                           keep_blank_values=True))
+        self._reply(params)
+
+    def _session(self):
+        cookie = SimpleCookie(self.headers.get("Cookie", ""))
+        sid = cookie["fakewiki_session"].value if \
+            "fakewiki_session" in cookie else None
+        if sid not in self.server.sessions:
+            sid = uuid.uuid4().hex
+            self.server.sessions[sid] = {"id": sid, "user": None}
+        return self.server.sessions[sid]
+
+    def _reply(self, params):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        session = self._session()
+        result = self.server.respond(params, session)
+        body = json.dumps(result)
+        headers = {"Content-Type": "application/json; charset=utf-8",
+                   "Set-Cookie": "fakewiki_session={0}; path=/".format(
+                       session["id"])}
+        error = result.get("error") if isinstance(result, dict) else None
+        if error:
+            headers["MediaWiki-API-Error"] = error["code"]
+            if error["code"] == "maxlag":
+                headers["Retry-After"] = "5"
+                headers["X-Database-Lag"] = str(int(error["lag"]))
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            stream = StringIO()
+            zipper = gzip.GzipFile(fileobj=stream, mode="wb")
+            zipper.write(body)
+            zipper.close()
+            body = stream.getvalue()
+            headers["Content-Encoding"] = "gzip"
+        headers["Content-Length"] = str(len(body))
+        self.send_response(200)
+        for key, val in headers.items():
+            self.send_header(key, val)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeAPIServer(ThreadingMixIn, HTTPServer):
+    """Serves *wiki*, a FakeWiki, as api.php on a local port.
+
+    *connect_delay* is slept once per new connection, standing in for the
+    TCP and TLS handshakes a real wiki would cost, and *latency* once per
+    request, standing in for the round trip. A kept-alive connection left
+    idle for *idle_timeout* seconds is closed, as web servers do. The
+    number of connections and requests served so far are kept in
+    *connections* and *requests*.
+
+    Subclasses can override respond() to serve anything else."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, wiki=None, port=0, connect_delay=0, latency=0,
+                 idle_timeout=None):
+        HTTPServer.__init__(self, ("127.0.0.1", port), _Handler)
+        self.wiki = wiki or FakeWiki()
+        self.connect_delay = connect_delay
+        self.latency = latency
+        self.idle_timeout = idle_timeout
+        self.connections = 0
+        self.requests = 0
+        self.sessions = {}
+        self.stash = {}
+        self._lag = 0
+        self._lagged = None
+        self._lock = Lock()
+
+    @property
+    def base_url(self):
+        return "//{0}:{1}".format(*self.server_address)
+
+    def handle_error(self, request, client_address):
+        """Ignores clients that hang up before their reply is sent, as
+        they may when they stop reading early."""
+        error = sys.exc_info()[1]
+        if isinstance(error, socket.error) and error.errno in (
+                errno.ECONNRESET, errno.EPIPE):
+            return
+        HTTPServer.handle_error(self, request, client_address)
+
+    def start(self):
+        """Starts serving in a background thread. Returns the server."""
+        thread = Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def set_lag(self, lag, requests=None):
+        """Reports *lag* seconds of replication lag, failing requests
+        with a lower maxlag, for the next *requests* of them or until
+        called again."""
+        self._lag = lag
+        self._lagged = requests
+
+    def respond(self, params, session):
+        """Returns the result of the API request *params*, made in
+        *session*, a dict holding the logged in "user"."""
+        with self._lock:
+            self.requests += 1
+            lag = self._check_lag(params)
+            if lag:
+                return lag
+            action = params.get("action", "help")
+            handler = getattr(self, "_do_" + action, None)
+            if not handler:
+                info = "Unrecognized value for parameter 'action': " + action
+                return _error("unknown_action", info)
+            return handler(params, session)
+
+    def _check_lag(self, params):
+        try:
+            maxlag = float(params["maxlag"])
+        except (KeyError, ValueError):
+            return None
+        if not self._lag or self._lag <= maxlag or self._lagged == 0:
+            return None
+        if self._lagged:
+            self._lagged -= 1
+        result = _error("maxlag", "Waiting for db: {0} seconds lagged".format(
+            self._lag))
+        result["error"].update(host="db", lag=self._lag)
+        return result
+
+    def _token(self, session, kind):
+        salt = "{0}|{1}|{2}".format(session["id"], session["user"], kind)
+        if kind == "csrf" and not session["user"]:
+            return "+\\"
+        return _md5(salt) + "+\\"
+
+    def _check_token(self, params, session, kind="csrf"):
+        if "token" not in params:
+            return _error("notoken", "The token parameter must be set")
+        if params["token"] != self._token(session, kind):
+            return _error("badtoken", "Invalid token")
+        return None
+
+    def _limit(self, params, name, session, content=False):
+        high = "apihighlimits" in self.wiki.rights(session["user"])
+        if content:
+            maximum = LIMITS["content_high" if high else "content"]
+        else:
+            maximum = LIMITS["high" if high else "low"]
+        value = params.get(name, "10")
+        if value == "max":
+            return maximum
+        try:
+            return max(1, min(int(value), maximum))
+        except ValueError:
+            return 10
+
+    # Queries
+
+    def _do_query(self, params, session):
+        result = {"query": {}}
+        cont = {}
+        prop_cont = {}
+        pages = None
+        if "stashimageinfo" in params.get("prop", "").split("|"):
+            stashed = self.stash.get(params.get("siifilekey"))
+            if stashed is None:
+                return _error("siinvalidsessiondata", "Not a valid "
+                              "session key")
+            result["query"]["stashimageinfo"] = [{
+                "size": len(stashed["data"]),
+                "sha1": hashlib.sha1(stashed["data"]).hexdigest()}]
+            return result
+        if params.get("generator"):
+            generated = self._list(params["generator"], params, session,
+                                   "g", cont)
+            if "error" in generated:
+                return generated
+            pages = [self.wiki.page(item["title"]) for item in generated]
+        elif any(key in params for key in ("titles", "pageids")):
+            pages = self._pages(params, result["query"])
+        elif "revids" in params:
+            pages = self._revision_pages(params, result["query"])
+        if pages is not None:
+            props = [p for p in params.get("prop", "").split("|") if p]
+            out = {}
+            for page in pages:
+                if "missing" in page or "invalid" in page:
+                    out[str(page["pageid"])] = page
+                    continue
+                item = {"pageid": page["pageid"], "ns": page["ns"],
+                        "title": page["title"]}
+                for prop in props:
+                    handler = getattr(self, "_prop_" + prop, None)
+                    if handler:
+                        handler(page, item, params, session, len(pages),
+                                prop_cont)
+                out[str(page["pageid"])] = item
+            result["query"]["pages"] = out
+        for name in [m for m in params.get("list", "").split("|") if m]:
+            items = self._list(name, params, session, "", cont)
+            if "error" in items:
+                return items
+            result["query"][name] = items
+        for name in [m for m in params.get("meta", "").split("|") if m]:
+            handler = getattr(self, "_meta_" + name, None)
+            if name == "siteinfo":
+                result["query"].update(handler(params, session))
+            elif handler:
+                result["query"][name] = handler(params, session)
+        if prop_cont:
+            if "generator" in params:
+                # Finish this batch of pages before moving on.
+                key = "g" + self._prefix(params["generator"]) + "continue"
+                cont[key] = params.get(key, "0")
+            cont.update(prop_cont)
+        else:
+            result["batchcomplete"] = ""
+        if cont:
+            cont["continue"] = "-||"
+            result["continue"] = cont
+        if not result["query"]:
+            del result["query"]
+        return result
+
+    def _pages(self, params, query):
+        """Returns the pages asked for by titles or pageids, with
+        placeholders for the missing and invalid ones."""
+        pages = []
+        missing = 0
+        if "titles" in params:
+            normalized = []
+            for title in params["titles"].split("|"):
+                ns, name = self.wiki.normalize(title)
+                if name != title and ns is not None:
+                    normalized.append({"from": title, "to": name})
+                page = self.wiki.pages.get(name) if ns is not None else None
+                if page is None:
+                    missing -= 1
+                    page = {"pageid": missing, "title": title}
+                    if ns is None:
+                        page["invalid"] = ""
+                    else:
+                        page.update(ns=ns, title=name, missing="")
+                pages.append(page)
+            if normalized:
+                query["normalized"] = normalized
+        else:
+            for pageid in params["pageids"].split("|"):
+                page = self.wiki.page(pageid=pageid)
+                if page is None:
+                    page = {"pageid": int(pageid), "missing": ""}
+                pages.append(page)
+        return pages
+
+    def _revision_pages(self, params, query):
+        """Returns the pages the revisions asked for by revids belong to,
+        listing the ids of those that don't exist as bad."""
+        wanted = set(params["revids"].split("|"))
+        pages, bad = [], []
+        owners = {}
+        for page in self.wiki.pages.values():
+            for revision in page["revisions"]:
+                owners[str(revision["revid"])] = page
+        for revid in sorted(wanted, key=int):
+            page = owners.get(revid)
+            if page is None:
+                bad.append({"revid": int(revid)})
+            elif page not in pages:
+                pages.append(page)
+        if bad:
+            query["badrevids"] = dict((str(item["revid"]), item)
+                                      for item in bad)
+        return pages
+
+    def _offset(self, params, key):
+        try:
+            return int(params.get(key, 0))
+        except ValueError:
+            return 0
+
+    def _prop_info(self, page, item, params, session, count, cont):
+        text = self.wiki.text(page)
+        last = page["revisions"][-1]
+        item.update(contentmodel="wikitext", pagelanguage="en",
+                    touched=last["timestamp"], lastrevid=last["revid"],
+                    length=len(text.encode("utf8")))
+        if self.wiki.redirect(page):
+            item["redirect"] = ""
+        if len(page["revisions"]) == 1:
+            item["new"] = ""
+        inprop = params.get("inprop", "").split("|")
+        if "protection" in inprop:
+            item["protection"] = page["protection"]
+        if "url" in inprop:
+            path = self.wiki.siteinfo["general"]["articlepath"]
+            url = "http:" + self.base_url + path.replace(
+                "$1", page["title"].replace(" ", "_"))
+            item.update(fullurl=url, editurl=url + "?action=edit")
+
+    def _prop_revisions(self, page, item, params, session, count, cont):
+        rvprop = params.get("rvprop", "ids|timestamp|flags|comment|user")
+        rvprop = rvprop.split("|")
+        revisions = page["revisions"]
+        single = count == 1 and any(key in params for key in
+                                    ("rvlimit", "rvdir", "rvcontinue",
+                                     "rvstart", "rvend"))
+        if single:
+            older = params.get("rvdir", "older") == "older"
+            if older:
+                revisions = revisions[::-1]
+            # ISO 8601 timestamps sort as strings.
+            start, end = params.get("rvstart"), params.get("rvend")
+            if start:
+                revisions = [rev for rev in revisions if
+                             (rev["timestamp"] <= start if older else
+                              rev["timestamp"] >= start)]
+            if end:
+                revisions = [rev for rev in revisions if
+                             (rev["timestamp"] >= end if older else
+                              rev["timestamp"] <= end)]
+            offset = self._offset(params, "rvcontinue")
+            limit = self._limit(params, "rvlimit", session,
+                                "content" in rvprop)
+            if offset + limit < len(revisions):
+                cont["rvcontinue"] = str(offset + limit)
+            revisions = revisions[offset:offset + limit]
+        elif "revids" in params:
+            wanted = params["revids"].split("|")
+            revisions = [rev for rev in revisions
+                         if str(rev["revid"]) in wanted]
+        else:
+            revisions = revisions[-1:]
+        out = []
+        for revision in revisions:
+            entry = {}
+            if "ids" in rvprop:
+                entry.update(revid=revision["revid"],
+                             parentid=revision["parentid"])
+            for key in ("user", "timestamp", "comment"):
+                if key in rvprop:
+                    entry[key] = revision[key]
+            if "size" in rvprop:
+                entry["size"] = len(revision["*"].encode("utf8"))
+            if "sha1" in rvprop:
+                entry["sha1"] = hashlib.sha1(
+                    revision["*"].encode("utf8")).hexdigest()
+            if "content" in rvprop:
+                entry.update({"contentformat": "text/x-wiki",
+                              "contentmodel": "wikitext",
+                              "*": revision["*"]})
+            out.append(entry)
+        item["revisions"] = out
+
+    def _prop_langlinks(self, page, item, params, session, count, cont):
+        links = [{"lang": lang, "*": title} for lang, title in
+                 sorted(page["langlinks"].items())]
+        if links:
+            item["langlinks"] = links
+
+    def _prop_extlinks(self, page, item, params, session, count, cont):
+        links = [{"*": url} for url in EXTLINKS.findall(self.wiki.text(page))]
+        if links:
+            item["extlinks"] = links
+
+    def _prop_categories(self, page, item, params, session, count, cont):
+        links = [{"ns": 14, "title": t} for t in self.wiki.links(page, 14)]
+        if links:
+            item["categories"] = links
+
+    def _prop_images(self, page, item, params, session, count, cont):
+        links = [{"ns": 6, "title": t} for t in self.wiki.links(page, 6)]
+        if links:
+            item["images"] = links
+
+    def _prop_links(self, page, item, params, session, count, cont):
+        links = []
+        for title in self.wiki.links(page):
+            ns = self.wiki.normalize(title)[0]
+            if ns not in (6, 14):
+                links.append({"ns": ns, "title": title})
+        if links:
+            item["links"] = links
+
+    def _prop_templates(self, page, item, params, session, count, cont):
+        links = []
+        for name in TEMPLATES.findall(self.wiki.text(page)):
+            ns, title = self.wiki.normalize(name if ":" in name else
+                                            u"Template:" + name)
+            entry = {"ns": ns, "title": title}
+            if ns is not None and entry not in links:
+                links.append(entry)
+        if links:
+            item["templates"] = links
+
+    def _prop_categoryinfo(self, page, item, params, session, count, cont):
+        if page["ns"] != 14:
+            return
+        members = self.wiki.members(page["title"])
+        files = sum(1 for member in members if member["ns"] == 6)
+        subcats = sum(1 for member in members if member["ns"] == 14)
+        item["categoryinfo"] = {"size": len(members), "files": files,
+                                "subcats": subcats,
+                                "pages": len(members) - files - subcats}
+
+    def _prop_imageinfo(self, page, item, params, session, count, cont):
+        info = self.wiki.files.get(page["title"])
+        if info is None:
+            return
+        iiprop = params.get("iiprop", "timestamp|user").split("|")
+        entry = {}
+        for key in ("timestamp", "user", "size", "sha1", "mime", "url"):
+            if key in iiprop:
+                entry[key] = info[key]
+        if "url" in iiprop and not info["url"]:
+            name = page["title"].split(":", 1)[1].replace(" ", "_")
+            entry["url"] = "http:{0}/images/{1}".format(self.base_url,
+                quote(name.encode("utf8")))
+        if "size" in iiprop:
+            entry.update(width=info["width"], height=info["height"])
+        if "url" in iiprop:
+            entry["descriptionurl"] = info["descriptionurl"]
+        item["imagerepository"] = "local"
+        item["imageinfo"] = [entry]
+
+    def _prefix(self, name):
+        return {"allpages": "ap", "categorymembers": "cm",
+                "users": "us"}.get(name, "")
+
+    def _list(self, name, params, session, g, cont):
+        """Runs the list module *name*, with its parameters prefixed by
+        *g* if it is used as a generator."""
+        prefix = g + self._prefix(name)
+        handler = getattr(self, "_list_" + name, None)
+        if not handler:
+            return _error("unknown_list", "Unrecognized value for "
+                          "parameter 'list': " + name)
+        items = handler(params, prefix)
+        if "error" in items:
+            return items
+        if name == "users":
+            return items
+        offset = self._offset(params, prefix + "continue")
+        limit = self._limit(params, prefix + "limit", session)
+        if offset + limit < len(items):
+            cont[prefix + "continue"] = str(offset + limit)
+        return items[offset:offset + limit]
+
+    def _entry(self, page):
+        return {"pageid": page["pageid"], "ns": page["ns"],
+                "title": page["title"]}
+
+    def _list_allpages(self, params, prefix):
+        ns = int(params.get(prefix + "namespace", 0))
+        start = params.get(prefix + "from", "")
+        begins = params.get(prefix + "prefix", "")
+        pages = []
+        for title, page in sorted(self.wiki.pages.items()):
+            name = title.split(":", 1)[1] if page["ns"] else title
+            if page["ns"] == ns and name >= start and \
+                    name.startswith(begins):
+                pages.append(self._entry(page))
+        return pages
+
+    def _list_categorymembers(self, params, prefix):
+        ns, title = self.wiki.normalize(params.get(prefix + "title", ""))
+        if ns != 14:
+            return _error("invalidcategory", "The category name you "
+                          "entered is not valid")
+        types = params.get(prefix + "type", "page|subcat|file").split("|")
+        namespaces = params.get(prefix + "namespace")
+        namespaces = [int(n) for n in namespaces.split("|")] if \
+            namespaces else None
+        members = []
+        for page in self.wiki.members(title):
+            kind = {14: "subcat", 6: "file"}.get(page["ns"], "page")
+            if kind in types and (namespaces is None or
+                                  page["ns"] in namespaces):
+                members.append(self._entry(page))
+        return members
+
+    def _list_users(self, params, prefix):
+        props = params.get("usprop", "").split("|")
+        users = []
+        for name in params.get("ususers", "").split("|"):
+            ns, normal = self.wiki.normalize(name)
+            user = self.wiki.users.get(normal)
+            if user is None:
+                users.append({"name": normal, "missing": ""})
+                continue
+            entry = {"userid": user["userid"], "name": user["name"]}
+            if "groups" in props:
+                entry["groups"] = user["groups"]
+            if "rights" in props:
+                entry["rights"] = self.wiki.rights(user["name"])
+            for key in ("editcount", "registration", "gender"):
+                if key in props:
+                    entry[key] = user[key]
+            if "emailable" in props and user["emailable"]:
+                entry["emailable"] = ""
+            if "blockinfo" in props and user["block"]:
+                block = user["block"]
+                entry.update(blockedby=block["by"],
+                             blockreason=block.get("reason", ""),
+                             blockexpiry=block.get("expiry", "infinity"))
+            users.append(entry)
+        return users
+
+    def _meta_siteinfo(self, params, session):
+        result = {}
+        for prop in params.get("siprop", "general").split("|"):
+            if prop in self.wiki.siteinfo:
+                result[prop] = json.loads(json.dumps(
+                    self.wiki.siteinfo[prop]))
+        if "general" in result:
+            result["general"]["server"] = self.base_url
+        return result
+
+    def _meta_userinfo(self, params, session):
+        user = self.wiki.users.get(session["user"])
+        if user:
+            result = {"id": user["userid"], "name": user["name"]}
+        else:
+            result = {"id": 0, "name": self.server_address[0], "anon": ""}
+        uiprop = params.get("uiprop", "").split("|")
+        if "rights" in uiprop:
+            result["rights"] = self.wiki.rights(session["user"])
+        if "groups" in uiprop:
+            result["groups"] = user["groups"] if user else ["*"]
+        return result
+
+    def _meta_tokens(self, params, session):
+        types = params.get("type", "csrf").split("|")
+        return dict((kind + "token", self._token(session, kind))
+                    for kind in types)
+
+    # Actions
+
+    def _do_login(self, params, session):
+        name = self.wiki.normalize(params.get("lgname", ""))[1]
+        token = self._token(session, "login")
+        if "lgtoken" not in params:
+            return {"login": {"result": "NeedToken", "token": token}}
+        if params["lgtoken"] != token:
+            return {"login": {"result": "WrongToken"}}
+        user = self.wiki.users.get(name)
+        if not params.get("lgpassword"):
+            return {"login": {"result": "EmptyPass"}}
+        if user is None:
+            return {"login": {"result": "NotExists"}}
+        if user["password"] != params["lgpassword"]:
+            return {"login": {"result": "WrongPass"}}
+        session["user"] = name
+        return {"login": {"result": "Success", "lguserid": user["userid"],
+                          "lgusername": name}}
+
+    def _do_logout(self, params, session):
+        session["user"] = None
+        return {}
+
+    def _do_edit(self, params, session):
+        error = self._check_token(params, session)
+        if error:
+            return error
+        ns, title = self.wiki.normalize(params.get("title", ""))
+        if ns is None:
+            return _error("invalidtitle", "Bad title")
+        if params.get("assert") == "user" and not session["user"]:
+            return _error("assertuserfailed", "You are no longer logged in")
+        page = self.wiki.pages.get(title)
+        if page and "createonly" in params:
+            return _error("articleexists", "The article you tried to "
+                          "create has been created already")
+        if not page and "nocreate" in params:
+            return _error("missingtitle", "The page you specified doesn't "
+                          "exist")
+        if page and params.get("basetimestamp"):
+            last = page["revisions"][-1]
+            try:
+                conflict = parse(last["timestamp"]) > \
+                    parse(params["basetimestamp"])
+            except (TypeError, ValueError):
+                conflict = False
+            if conflict and last["user"] != session["user"]:
+                return _error("editconflict", "Edit conflict detected")
+        old = self.wiki.text(page) if page else u""
+        if "text" in params:
+            sent = params["text"]
+            text = self._section_edit(old, params, sent)
+            if text is None:
+                return _error("nosuchsection", "There is no section " +
+                              params["section"])
+        else:
+            sent = params.get("prependtext", u"") + \
+                params.get("appendtext", u"")
+            text = params.get("prependtext", u"") + old + \
+                params.get("appendtext", u"")
+        if "md5" in params and params["md5"] != _md5(sent):
+            return _error("badmd5", "The supplied MD5 hash was incorrect")
+        if not page and not text:
+            return _error("emptypage", "Creating new, empty pages is not "
+                          "allowed")
+        result = {"result": "Success", "title": title,
+                  "contentmodel": "wikitext"}
+        if page and text == old:
+            result.update(pageid=page["pageid"], nochange="")
+            return {"edit": result}
+        user = session["user"] or self.server_address[0]
+        revision = self.wiki.add_page(title, text, user,
+                                      comment=params.get("summary", u""))
+        page = self.wiki.pages[title]
+        if "user" in self.wiki.users.get(user, {}).get("groups", []):
+            self.wiki.users[user]["editcount"] += 1
+        result.update(pageid=page["pageid"], oldrevid=revision["parentid"],
+                      newrevid=revision["revid"],
+                      newtimestamp=revision["timestamp"])
+        if not revision["parentid"]:
+            result["new"] = ""
+        return {"edit": result}
+
+    def _section_edit(self, old, params, text):
+        """Returns the page text after replacing, or adding, the section
+        in *params* with *text*, or None if there is no such section."""
+        section = params.get("section")
+        if section is None:
+            return text
+        if section == "new":
+            heading = params.get("sectiontitle") or params.get("summary")
+            if heading:
+                text = u"== {0} ==\n\n{1}".format(heading, text)
+            return (old.rstrip() + u"\n\n" + text) if old else text
+        code = mwparserfromhell.parse(old)
+        flat = code.get_sections(include_lead=True, flat=True)
+        nested = code.get_sections(include_lead=True, flat=False)
+        try:
+            index = int(section)
+            target = nested[index]
+        except (ValueError, IndexError):
+            return None
+        start = sum(len(unicode(part)) for part in flat[:index])
+        end = start + len(unicode(target))
+        if end < len(old):
+            # Like MediaWiki, which trims the new section and leaves a
+            # blank line before the next.
+            text = text.rstrip() + u"\n\n"
+        return old[:start] + text + old[end:]
+
+    def _do_move(self, params, session):
+        error = self._check_token(params, session)
+        if error:
+            return error
+        if "move" not in self.wiki.rights(session["user"]):
+            return _error("cantmove-anon", "Anonymous users can't move "
+                          "pages")
+        page = self.wiki.page(params.get("from"))
+        if page is None:
+            return _error("missingtitle", "The page you specified doesn't "
+                          "exist")
+        ns, target = self.wiki.normalize(params.get("to", ""))
+        if ns is None:
+            return _error("invalidtitle", "Bad title")
+        if target in self.wiki.pages:
+            return _error("articleexists", "The destination article "
+                          "already exists")
+        old = page["title"]
+        self.wiki.delete(old)
+        page.update(title=target, ns=ns)
+        self.wiki.pages[target] = page
+        self.wiki._ids[page["pageid"]] = target
+        if "noredirect" not in params:
+            self.wiki.add_page(old, u"#REDIRECT [[{0}]]".format(target),
+                               session["user"])
+        result = {"from": old, "to": target,
+                  "reason": params.get("reason", u"")}
+        if "noredirect" not in params:
+            result["redirectcreated"] = ""
+        return {"move": result}
+
+    def _do_delete(self, params, session):
+        error = self._check_token(params, session)
+        if error:
+            return error
+        if "delete" not in self.wiki.rights(session["user"]):
+            return _error("permissiondenied", "You don't have permission "
+                          "to delete pages")
+        page = self.wiki.page(params.get("title"))
+        if page is None:
+            return _error("missingtitle", "The page you specified doesn't "
+                          "exist")
+        self.wiki.delete(page["title"])
+        return {"delete": {"title": page["title"],
+                           "reason": params.get("reason", u""), "logid": 0}}
+
+    def _do_watch(self, params, session):
+        error = self._check_token(params, session, "watch")
+        if error:
+            return error
+        ns, title = self.wiki.normalize(params.get("title", ""))
+        key = "unwatched" if "unwatch" in params else "watched"
+        return {"watch": {"title": title, key: ""}}
+
+    def _do_upload(self, params, session):
+        error = self._check_token(params, session)
+        if error:
+            return error
+        if "upload" not in self.wiki.rights(session["user"]):
+            return _error("permissiondenied", "You don't have permission "
+                          "to upload files")
+        ns, title = self.wiki.normalize(u"File:" + params.get("filename",
+                                                              u""))
+        if ns != 6:
+            return _error("invalidtitle", "Bad title")
+        if "chunk" in params:
+            return self._upload_chunk(params, title)
+        if "filekey" in params:
+            stashed = self.stash.pop(params["filekey"], None)
+            if stashed is None:
+                return _error("missingresult", "No such file key")
+            data = stashed["data"]
+        elif "file" in params:
+            data = params["file"]
+        else:
+            return _error("nofilename", "The file parameter must be set")
+        digest = hashlib.sha1(data).hexdigest()
+        old = self.wiki.files.get(title)
+        if old and not params.get("ignorewarnings"):
+            key = "duplicate" if old["sha1"] == digest else "exists"
+            return {"upload": {"result": "Warning", "filekey": "",
+                               "warnings": {key: title}}}
+        self.wiki.add_file(title, params.get("text") or
+                           params.get("comment", u""),
+                           session["user"] or self.server_address[0],
+                           data=data)
+        info = dict((key, val) for key, val in self.wiki.files[title].items()
+                    if key != "data")
+        return {"upload": {"result": "Success", "filename":
+                           title.split(":", 1)[1], "imageinfo": info}}
+
+    def _upload_chunk(self, params, title):
+        filekey = params.get("filekey")
+        if filekey:
+            stashed = self.stash.get(filekey)
+            if stashed is None:
+                return _error("stashfailed", "No such file key")
+        else:
+            filekey = uuid.uuid4().hex[:12] + ".stash"
+            stashed = self.stash[filekey] = {"data": ""}
+        if int(params.get("offset", 0)) != len(stashed["data"]):
+            return _error("stashfailed", "Invalid chunk offset")
+        stashed["data"] += params["chunk"]
+        offset = len(stashed["data"])
+        if offset >= int(params.get("filesize", 0)):
+            return {"upload": {"result": "Success", "filekey": filekey}}
+        return {"upload": {"result": "Continue", "offset": offset,
+                           "filekey": filekey}}
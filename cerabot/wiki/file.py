@@ -1,20 +1,50 @@
 import sys
+import zlib
 from cerabot import exceptions
-from os.path import expanduser, join, exists
-from urllib import urlretrieve
+from os import fstat, remove, rename, utime
+from os.path import expanduser, join, exists, getsize, getmtime
+from hashlib import sha1
+from calendar import timegm
+from email.utils import formatdate
+from urllib2 import Request, URLError, HTTPError
 from .page import Page
+from .multipart import FilePart, BLOCK_SIZE
+from .decoding import iter_body
 from dateutil.parser import parse
 
 class File(Page):
     """Object represents a single file on the wiki."""
+    FIELDS = dict(Page.FIELDS, imageinfo=("repository", "timestamp", "user",
+        "size", "url", "hashed", "mime", "description", "dimensions"))
+    IMAGEINFO = "timestamp|user|url|size|sha1|mime"
 
     def load_attributes(self, res=None):
-        """Loads all attributes of the current file."""
-        query = {"action":"query", "prop":"imageinfo", "iiprop":
-            "timestamp|user|url|size|sha1|mime", "titles":self.title}
-        res = self.site.query(query)
-        res = res["query"]["pages"][list(res["query"]["pages"])[0]]
-        super(File, self).load()
+        """Loads all attributes of the current file, along with those of
+        its description page. The file's imageinfo comes in the same query
+        as the page's info. *res* may be an already fetched result for this
+        file, in which case no query is made for it."""
+        with self.site.instrumentation.label("File.load_attributes"):
+            self.load(res)
+
+    @classmethod
+    def _fields_query(cls, groups):
+        query = super(File, cls)._fields_query(groups)
+        if "imageinfo" in groups:
+            props = query["prop"].split("|") if query["prop"] else []
+            query["prop"] = "|".join(props + ["imageinfo"])
+            query["iiprop"] = cls.IMAGEINFO
+        return query
+
+    def _fill(self, data, groups):
+        if "imageinfo" in groups:
+            self._load_imageinfo(data)
+        super(File, self)._fill(data, groups)
+
+    def _load_imageinfo(self, res):
+        """Loads the file's attributes from its part of a query result."""
+        self._repository = self._timestamp = self._user = None
+        self._size = self._url = self._hashed = self._mime = None
+        self._description = self._dimensions = None
         try:
             result = res["imageinfo"][0]
         except (KeyError, IndexError):
@@ -29,68 +59,241 @@ class File(Page):
         self._description = result["descriptionurl"]
         self._dimensions = result["height"], result["width"]
 
-    def download(self, local=""):
-        """Downloads the current image and stores it at
-        *local*. By default local is '~/<filename>'."""
-        if not self.exists:
+    def download(self, local="", verify=True, force=False):
+        """Downloads the current version of this file and stores it at
+        *local*, by default '~/<filename>'. The file is streamed to disk a
+        block at a time. Returns True if the file is at *local* afterwards,
+        and False if the wiki would not give it to us.
+
+        A file already at *local* is kept if it has the size and SHA-1 the
+        wiki reports, or, if *verify* is False, unless the wiki's copy is
+        newer. *force* downloads it again regardless. With *verify*, a
+        download whose size or SHA-1 doesn't match raises DownloadError
+        and leaves *local* as it was."""
+        if self.url is None:
             error = "File {0!r} doesn't exist."
-            raise exceptions.PageExistsError(error)
-        path = join(expanduser("~"), self.title.split(":")[-1])
+            raise exceptions.PageExistsError(error.format(self.title))
+        if not local:
+            local = join(expanduser("~"), self.site.title(self.title).text)
+        request = Request(self._url)
+        if exists(local) and not force:
+            if verify and self._hashed:
+                if getsize(local) == self._size and \
+                        self._path_sha1(local) == self._hashed:
+                    return True
+            else:
+                request.add_header("If-Modified-Since",
+                                   formatdate(getmtime(local), usegmt=True))
         try:
-            urlretrieve(self.url, local if local else path)
-        except urllib.HTTPError:
+            reply = self.site.opener.open(request)
+        except HTTPError as error:
+            return error.code == 304
+        except URLError:
             return False
-        if not exists(local if local else path):
+        if reply.code == 304:
+            reply.close()
+            return True
+        return self._save(reply, local, verify)
+
+    def _save(self, reply, local, verify):
+        """Streams the body of *reply* into *local*, through a partial
+        file that only replaces it once it is complete and verified."""
+        partial = local + ".part"
+        hashed = sha1()
+        size = 0
+        try:
+            with open(partial, "wb") as fp:
+                for block in iter_body(reply, BLOCK_SIZE):
+                    hashed.update(block)
+                    fp.write(block)
+                    size += len(block)
+        except (IOError, zlib.error):
+            if exists(partial):
+                remove(partial)
             return False
+        finally:
+            reply.close()
+        digest = hashed.hexdigest()
+        if verify and (size != self._size or
+                       (self._hashed and digest != self._hashed)):
+            remove(partial)
+            error = "Downloaded {0} bytes of {1!r} with SHA-1 {2}, " \
+                "expected {3} bytes with SHA-1 {4}."
+            raise exceptions.DownloadError(error.format(size, self.title,
+                digest, self._size, self._hashed))
+        rename(partial, local)
+        if self._timestamp:
+            # So that If-Modified-Since asks about the version we have.
+            stamp = timegm(self._timestamp.utctimetuple())
+            utime(local, (stamp, stamp))
         return True
 
-    def upload(self, fileobj=None, text="", summary="", comment="", 
-            watch=True, key=""):
-        self.assert_ability("edit")
-        path = join(expanduser("~"), self.title.split(":")[-1])
-        if not fileobj or not isinstance(fileobj, file):
-            fileobj = open(path)
-        fileobj.seek(0)
-        contents = fileobj.read()
-        query = {"filename": self.title, "text": text, "comment": summary, 
-                 "watch": watch, "ignorewarnings": True, "file": contents,
-                 "token": self._tokens["edit"]}
+    def upload(self, fileobj=None, text="", summary="", comment="",
+            watch=True, key="", chunk_size=None, filekey=None, offset=None,
+            skip_unchanged=True):
+        """Uploads *fileobj*, an open file or a path, as this file. By
+        default that is the file named like this one in the home directory.
+
+        The file is streamed from disk. Files larger than *chunk_size*
+        bytes (the site's "upload_chunk_size" setting by default) are sent
+        a chunk at a time through the upload stash. If that is interrupted,
+        the UploadError raised has the *filekey* and *offset* to pass back
+        in to resume; without an *offset*, it is asked from the stash.
+
+        If *skip_unchanged* is True and the wiki already has a file with
+        the same SHA-1 under this name, nothing is uploaded, and the result
+        has a "nochange" key."""
+        self.assert_ability("upload")
+        close = False
+        if not fileobj:
+            fileobj = join(expanduser("~"), self.title.split(":")[-1])
+        if isinstance(fileobj, basestring):
+            fileobj, close = open(fileobj, "rb"), True
+        try:
+            return self._upload(fileobj, text, summary or comment, watch,
+                key, chunk_size, filekey, offset, skip_unchanged)
+        finally:
+            if close:
+                fileobj.close()
+
+    def _upload(self, fileobj, text, summary, watch, key, chunk_size,
+            filekey, offset, skip_unchanged):
+        name = self.site.title(self.title).text
+        size = fstat(fileobj.fileno()).st_size
+        if skip_unchanged and not filekey:
+            remote = self._remote_sha1()
+            if remote and remote == self._local_sha1(fileobj):
+                return {"result": "Success", "filename": name,
+                        "nochange": ""}
+        chunk_size = chunk_size or self.site._config["upload_chunk_size"]
+        query = {"action": "upload", "filename": name, "text": text,
+                 "comment": summary, "ignorewarnings": 1}
+        if watch:
+            query["watchlist"] = "watch"
         if key:
             query["sessionkey"] = key
-        result = self.site.query(query).get("upload", 0)
-        if result and result["result"] == "Success":
-            self.dimensions, self._user, self._hashed = (None, None, None)
-            self._exists = True
+        elif filekey or size > chunk_size:
+            query["filekey"] = self._upload_chunks(fileobj, name, size,
+                chunk_size, filekey, offset)
+        else:
+            query["file"] = FilePart(fileobj, name, 0, size)
+        query["token"] = self.site.tokens["upload"]
+        try:
+            result = self.site.query(query).get("upload", {})
+        except exceptions.APIError as error:
+            exc = exceptions.UploadError(str(error))
+            exc.filekey = query.get("filekey")
+            raise exc
+        if result.get("result") == "Success":
+            self._forget()
         return result
 
+    def _upload_chunks(self, fileobj, name, size, chunk_size, filekey,
+            offset):
+        """Sends *fileobj* to the upload stash in chunks, starting at
+        *offset*, and returns the stash's file key for it."""
+        if filekey and offset is None:
+            offset = self._stashed_size(filekey)
+        offset = offset or 0
+        while offset < size:
+            length = min(chunk_size, size - offset)
+            query = {"action": "upload", "stash": 1, "filename": name,
+                     "filesize": size, "offset": offset, "ignorewarnings": 1,
+                     "chunk": FilePart(fileobj, name, offset, length),
+                     "token": self.site.tokens["upload"]}
+            if filekey:
+                query["filekey"] = filekey
+            try:
+                result = self.site.query(query)["upload"]
+            except (exceptions.APIError, KeyError) as error:
+                exc = exceptions.UploadError(str(error))
+                exc.filekey, exc.offset = filekey, offset
+                raise exc
+            filekey = result.get("filekey", filekey)
+            if result.get("result") == "Success":
+                break
+            if result.get("result") != "Continue":
+                error = "Unexpected reply to chunk at {0}: {1}"
+                exc = exceptions.UploadError(error.format(offset, result))
+                exc.filekey, exc.offset = filekey, offset
+                raise exc
+            offset = int(result["offset"])
+        return filekey
+
+    def _stashed_size(self, filekey):
+        """Returns how many bytes of the upload *filekey* are stashed."""
+        query = {"action": "query", "prop": "stashimageinfo",
+                 "siifilekey": filekey, "siiprop": "size"}
+        try:
+            return int(self.site.query(query)["query"]["stashimageinfo"]
+                       [0]["size"])
+        except (exceptions.APIError, KeyError, IndexError) as error:
+            exc = exceptions.UploadError(str(error))
+            exc.filekey = filekey
+            raise exc
+
+    def _remote_sha1(self):
+        """Returns the SHA-1 of the wiki's current version of this file,
+        or None if there isn't one. Loaded imageinfo is used if we have
+        it."""
+        if "imageinfo" in self._loaded:
+            return self._hashed
+        query = {"action": "query", "prop": "imageinfo", "iiprop": "sha1",
+                 "titles": self.title}
+        pages = self.site.query(query)["query"].get("pages", {})
+        for page in pages.values():
+            for info in page.get("imageinfo", []):
+                return info.get("sha1")
+        return None
+
+    def _local_sha1(self, fileobj):
+        """Returns the SHA-1 of *fileobj*, read a block at a time."""
+        hashed = sha1()
+        fileobj.seek(0)
+        for block in iter(lambda: fileobj.read(BLOCK_SIZE), ""):
+            hashed.update(block)
+        return hashed.hexdigest()
+
+    def _path_sha1(self, path):
+        with open(path, "rb") as fileobj:
+            return self._local_sha1(fileobj)
+
     @property
     def user(self):
+        self._require("imageinfo")
         return self._user
 
     @property
     def timestamp(self):
+        self._require("imageinfo")
         return self._timestamp
 
     @property
     def size(self):
+        self._require("imageinfo")
         return self._size
 
     @property
     def url(self):
+        self._require("imageinfo")
         return self._url
 
     @property
     def hashed(self):
+        self._require("imageinfo")
         return self._hashed
 
     @property
     def mime(self):
+        self._require("imageinfo")
         return self._mime
 
     @property
     def description(self):
+        self._require("imageinfo")
         return self._description
 
     @property
     def dimensions(self):
-        self._dimensions
+        self._require("imageinfo")
+        return self._dimensions
@@ -0,0 +1,212 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+try:
+    import json
+except Exception:
+    import simplejson as json
+
+__all__ = ["QueryRecord", "Instrumentation", "HistogramSink",
+           "JSONLinesSink", "CallbackSink"]
+
+def module_name(params):
+    """Returns a short name for the API modules used by *params*, like
+    "query:prop=info|revisions" or "edit"."""
+    action = params.get("action", "")
+    if action != "query":
+        return action
+    parts = []
+    for module in ("prop", "list", "meta", "generator"):
+        if params.get(module):
+            parts.append("{0}={1}".format(module, params[module]))
+    return "query:" + ",".join(parts)
+
+
+class QueryRecord(object):
+    """What it took to run one API request: *wall_time* is the time spent
+    sending it and reading the reply, *throttle_time* the time spent
+    waiting for the scheduler first, and *decode_time* the part of
+    *wall_time* spent decoding JSON. Sizes are in bytes, before
+    (*bytes_wire*) and after (*bytes_body*) decompression."""
+    __slots__ = ("module", "label", "started", "wall_time", "throttle_time",
+                 "decode_time", "bytes_wire", "bytes_body", "retries",
+                 "continuation", "error")
+
+    def __init__(self, module, label=None, continuation=False):
+        self.module = module
+        self.label = label
+        self.started = time.time()
+        self.wall_time = 0.0
+        self.throttle_time = 0.0
+        self.decode_time = 0.0
+        self.bytes_wire = 0
+        self.bytes_body = 0
+        self.retries = 0
+        self.continuation = continuation
+        self.error = None
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+
+class CountingReply(object):
+    """Wraps a reply, counting the bytes read from it."""
+
+    def __init__(self, reply):
+        self._reply = reply
+        self.headers = reply.headers
+        self.count = 0
+
+    def read(self, amt=None):
+        data = self._reply.read() if amt is None else self._reply.read(amt)
+        self.count += len(data)
+        return data
+
+    def close(self):
+        self._reply.close()
+
+
+class HistogramSink(object):
+    """Keeps a histogram of wall times per module, in *buckets* given as
+    upper bounds in seconds."""
+
+    def __init__(self, buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)):
+        self.buckets = list(buckets)
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, record):
+        index = bisect.bisect_left(self.buckets, record.wall_time)
+        with self._lock:
+            counts = self.counts.setdefault(record.module,
+                                            [0] * (len(self.buckets) + 1))
+            counts[index] += 1
+
+    def report(self):
+        """Returns the histograms as text."""
+        labels = ["<={0}s".format(b) for b in self.buckets]
+        labels.append(">{0}s".format(self.buckets[-1]))
+        lines = []
+        for module, counts in sorted(self.counts.items()):
+            lines.append(module)
+            for label, count in zip(labels, counts):
+                if count:
+                    lines.append("  {0:>8} {1}".format(label, count))
+        return "\n".join(lines)
+
+
+class JSONLinesSink(object):
+    """Writes every record as a line of JSON to *fileobj*, which may also
+    be a path to append to."""
+
+    def __init__(self, fileobj):
+        if isinstance(fileobj, basestring):
+            fileobj = open(fileobj, "a")
+        self._file = fileobj
+        self._lock = threading.Lock()
+
+    def record(self, record):
+        line = json.dumps(record.as_dict()) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+
+class CallbackSink(object):
+    """Calls *callback* with every record."""
+
+    def __init__(self, callback):
+        self._callback = callback
+
+    def record(self, record):
+        self._callback(record)
+
+
+class Instrumentation(object):
+    """Collects a QueryRecord for every request a Site makes, keeps totals
+    per module for summary(), and hands each record to its sinks.
+
+    Requests made inside a ``with instrumentation.label(name)`` block are
+    tagged with *name*, so that totals can also be broken down by the
+    Page or Category operation that caused them."""
+    fields = ("wall_time", "throttle_time", "decode_time", "bytes_wire",
+              "bytes_body", "retries")
+
+    def __init__(self, sinks=None):
+        self.sinks = list(sinks) if sinks else []
+        self._totals = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def remove_sink(self, sink):
+        self.sinks.remove(sink)
+
+    @contextmanager
+    def label(self, name):
+        """Tags the requests made in this block, and this thread, with
+        *name*."""
+        stack = self._local.__dict__.setdefault("labels", [])
+        stack.append(name)
+        try:
+            yield
+        finally:
+            stack.pop()
+
+    def start(self, params):
+        """Returns a new record for the request *params*."""
+        stack = getattr(self._local, "labels", None)
+        continued = params.get("continue") not in (None, "")
+        return QueryRecord(module_name(params), stack[-1] if stack else None,
+                           continued)
+
+    def finish(self, record):
+        """Adds *record* to the totals and passes it on to the sinks."""
+        with self._lock:
+            for key in (record.module, record.label):
+                if key is None:
+                    continue
+                totals = self._totals.get(key)
+                if totals is None:
+                    totals = dict.fromkeys(self.fields, 0)
+                    totals.update(requests=0, continuations=0, errors=0)
+                    self._totals[key] = totals
+                totals["requests"] += 1
+                totals["continuations"] += record.continuation
+                totals["errors"] += record.error is not None
+                for field in self.fields:
+                    totals[field] += getattr(record, field)
+        for sink in self.sinks:
+            sink.record(record)
+
+    def summary(self):
+        """Returns the totals collected so far, keyed by module and by
+        label."""
+        with self._lock:
+            return dict((key, dict(val)) for key, val in
+                        self._totals.iteritems())
+
+    def report(self):
+        """Returns the totals as a table, the most expensive first."""
+        rows = sorted(self.summary().items(),
+                      key=lambda item: item[1]["wall_time"], reverse=True)
+        header = "{0:<40} {1:>7} {2:>9} {3:>9} {4:>9} {5:>11} {6:>6} {7:>6}"
+        lines = [header.format("module / label", "reqs", "wall s",
+                               "throttle", "decode s", "wire KiB",
+                               "retry", "cont")]
+        row = "{0:<40} {1:>7} {2:>9.2f} {3:>9.2f} {4:>9.2f} {5:>11.1f} " \
+              "{6:>6} {7:>6}"
+        for key, totals in rows:
+            lines.append(row.format(key[:40], totals["requests"],
+                totals["wall_time"], totals["throttle_time"],
+                totals["decode_time"], totals["bytes_wire"] / 1024.0,
+                totals["retries"], totals["continuations"]))
+        return "\n".join(lines)
+
+    def reset(self):
+        """Forgets the totals, as when starting a new job."""
+        with self._lock:
+            self._totals.clear()
@@ -0,0 +1,101 @@
+import os
+import uuid
+
+__all__ = ["FilePart", "MultipartBody"]
+
+BLOCK_SIZE = 64 * 1024
+
+class FilePart(object):
+    """*length* bytes of *fileobj* from *offset* on, or the rest of it if
+    *length* is None, to be sent as a file in a multipart request under
+    the name *filename*. Nothing is read until the request is sent, and
+    the part can be sent more than once."""
+
+    def __init__(self, fileobj, filename, offset=0, length=None,
+                 content_type="application/octet-stream"):
+        if length is None:
+            length = os.fstat(fileobj.fileno()).st_size - offset
+        self.fileobj = fileobj
+        self.filename = filename
+        self.offset = offset
+        self.length = length
+        self.content_type = content_type
+
+    def read_at(self, position, size):
+        """Returns up to *size* bytes, starting *position* bytes into the
+        part."""
+        size = min(size, self.length - position)
+        if size <= 0:
+            return ""
+        self.fileobj.seek(self.offset + position)
+        return self.fileobj.read(size)
+
+    def __len__(self):
+        return self.length
+
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode("utf8")
+    return str(value)
+
+
+class MultipartBody(object):
+    """A multipart/form-data request body made of *fields*, whose values
+    may be FileParts. It is read a block at a time as it is sent, so files
+    are streamed from disk rather than held in memory. Sending it through
+    a Request needs the Content-Type header from content_type."""
+
+    def __init__(self, fields, boundary=None):
+        self.boundary = boundary or "cerabot-" + uuid.uuid4().hex
+        self.fields = dict((key, val) for key, val in fields.iteritems()
+                           if not isinstance(val, FilePart))
+        self._segments = []
+        for key, val in sorted(fields.iteritems()):
+            head = "--{0}\r\nContent-Disposition: form-data; name=\"{1}\""
+            head = head.format(self.boundary, _encode(key))
+            if isinstance(val, FilePart):
+                head += "; filename=\"{0}\"\r\nContent-Type: {1}".format(
+                    _encode(val.filename).replace("\"", "%22"),
+                    val.content_type)
+                self._segments.extend([head + "\r\n\r\n", val, "\r\n"])
+            else:
+                self._segments.append("{0}\r\n\r\n{1}\r\n".format(
+                    head, _encode(val)))
+        self._segments.append("--{0}--\r\n".format(self.boundary))
+        self._length = sum(len(segment) for segment in self._segments)
+        self.seek(0)
+
+    @property
+    def content_type(self):
+        return "multipart/form-data; boundary=" + self.boundary
+
+    def __len__(self):
+        return self._length
+
+    def seek(self, position):
+        """Rewinds the body, which can only be read again from the start,
+        so that a failed request can be retried."""
+        if position != 0:
+            raise IOError("a multipart body can only be rewound")
+        self._index = 0
+        self._position = 0
+
+    def read(self, size=BLOCK_SIZE):
+        if size is None or size < 0:
+            size = self._length
+        chunks = []
+        while size > 0 and self._index < len(self._segments):
+            segment = self._segments[self._index]
+            if isinstance(segment, FilePart):
+                data = segment.read_at(self._position, size)
+            else:
+                data = segment[self._position:self._position + size]
+            if not data:
+                self._index += 1
+                self._position = 0
+                continue
+            chunks.append(data)
+            self._position += len(data)
+            size -= len(data)
+        return "".join(chunks)
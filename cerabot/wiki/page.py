@@ -2,24 +2,125 @@ import re
 import sys
 import mwparserfromhell
 from time import strftime, gmtime
-from hashlib import md5
+from hashlib import md5, sha1
 from datetime import datetime
 from cerabot import exceptions
 from dateutil.parser import parse
 
 __all__ = ["Page"]
 
+_HEADING = re.compile(ur"^(={1,6})(.+?)(={1,6})[ \t]*$", re.M | re.U)
+# Markup that can hide a heading from MediaWiki or show one that isn't in
+# the wikitext; sections aren't worked out on pages using any of it.
+_SECTION_HAZARDS = (u"<!--", u"<nowiki", u"<pre", u"<includeonly",
+                    u"<noinclude", u"<onlyinclude", u"<source",
+                    u"<syntaxhighlight", u"<math")
+# Templates and extension tags can add headings of their own, which
+# shifts the numbers of the sections after them.
+_EXPANDED = re.compile(ur"\{\{|<(?:ref|references|poem|gallery|imagemap|"
+                       ur"timeline|hiero|score|graph|templatedata|"
+                       ur"templatestyles|inputbox|categorytree|chem|ce|"
+                       ur"section|indicator|mapframe|maplink|tabs?|"
+                       ur"tabber)\b", re.I | re.U)
+
+def _sections(text):
+    """Splits *text* into its lead and sections, at every heading. Returns
+    a list of (level, text) pairs, the lead having level 0."""
+    parts, start, level = [], 0, 0
+    for match in _HEADING.finditer(text):
+        parts.append((level, text[start:match.start()]))
+        start = match.start()
+        level = min(len(match.group(1)), len(match.group(3)))
+    parts.append((level, text[start:]))
+    return parts
+
+def _expands_before_heading(text):
+    """Returns True if a template or an extension tag comes before one of
+    the headings in *text*."""
+    last = None
+    for last in _HEADING.finditer(text):
+        pass
+    return last is not None and bool(_EXPANDED.search(text, 0,
+                                                      last.start()))
+
+def _minimal_edit(old, new):
+    """Returns the smallest set of edit parameters that turns the wikitext
+    *old* into *new*: an appendtext or prependtext, or the text of the one
+    section that changed, or None if the whole text has to be sent."""
+    if len(new) > len(old) and old:
+        if new.startswith(old):
+            return {"appendtext": new[len(old):]}
+        if new.endswith(old):
+            return {"prependtext": new[:-len(old)]}
+    if any(hazard in old or hazard in new for hazard in _SECTION_HAZARDS):
+        return None
+    if _expands_before_heading(old) or _expands_before_heading(new):
+        return None
+    before, after = _sections(old), _sections(new)
+    if len(before) != len(after) or len(before) < 2:
+        return None
+    changed = [i for i, (one, two) in enumerate(zip(before, after))
+               if one != two]
+    if len(changed) != 1:
+        return None
+    index = changed[0]
+    level = after[index][0]
+    if before[index][0] != level or (index and
+            before[index][1].split(u"\n", 1)[0] !=
+            after[index][1].split(u"\n", 1)[0]):
+        return None
+    # A section runs on over its subsections, up to the next heading of
+    # the same level or higher.
+    end = index + 1
+    while index and end < len(after) and after[end][0] > level:
+        end += 1
+    text = u"".join(part for lvl, part in after[index:end])
+    if end < len(after):
+        # MediaWiki trims the section it is given and puts a blank line
+        # between it and the next one.
+        if not text.endswith(u"\n\n") or text.rstrip() + u"\n\n" != text:
+            return None
+        text = text[:-2]
+    elif text != text.rstrip():
+        return None
+    return {"section": index, "text": text}
+
 class Page(object):
     """Object represents a single page on the wiki.
-    On initiation, loads information that could be useful."""
+
+    Attributes are loaded in groups, listed in FIELDS, each the first time
+    one of its attributes is asked for, or together by load(). *fields*
+    names the groups (or attributes) load() gets, and batch loaders like
+    Site.load_pages ask for; by default that is all of them, or all but
+    the content if *load_content* is False, so that load() makes a single
+    request. The groups in OPTIONAL, which would cost a request of their
+    own, are left out unless named."""
+    FIELDS = {"info": ("exists", "title", "pageid", "namespace",
+                       "is_redirect", "is_talkpage", "fullurl",
+                       "last_revid", "protection"),
+              "revision": ("last_editor", "last_edited"),
+              "content": ("content", "templates", "links", "categories",
+                          "files", "is_excluded"),
+              "langlinks": ("langlinks",),
+              "extlinks": ("extlinks",),
+              "creator": ("creator",)}
+    CONTENT = ("revision", "content", "langlinks", "extlinks")
+    OPTIONAL = ("creator",)
+    REVISION_PROPS = ("ids", "timestamp", "user", "comment", "size", "sha1",
+                      "flags")
 
     def __init__(self, site, title="", pageid=0, follow_redirects=False,
-                 load_content=True):
+                 load_content=True, fields=None):
         self.site = site
         self._title = title
         self._pageid = pageid
-        self._do_content = load_content
         self._follow_redirects = follow_redirects
+        if fields is None:
+            fields = [group for group in self.FIELDS
+                      if group not in self.OPTIONAL and
+                      (load_content or group not in self.CONTENT)]
+        self._fields = self._groups(fields)
+        self._loaded = set()
 
         self._exists = None
         self._last_editor = None
@@ -27,73 +128,170 @@ class Page(object):
         self._is_talkpage = False
         self._last_revid = None
         self._last_edited = None
+        self._starttimestamp = None
         self._creator = None
         self._fullurl = None
-        self._is_excluded = False
+        self._is_excluded = None
         self._content = None
         self._protection = None
         self._redirect_target = None
 
         self._extlinks = []
-        self._templates = []
-        self._links = []
-        self._categories = []
-        self._files = []
+        self._revid = None
+        self._sha1 = None
+        self._templates = None
+        self._links = None
+        self._categories = None
+        self._files = None
         self._langlinks = {}
 
-        self._prefix = None
         self._namespace = 0
 
-    def load(self, res=None):
-        """Loads the attributes of the current page."""
-        self._load(res)
-
-        if self._follow_redirects and self.is_redirect:
-            self._title = self.get_redirect_target().title
-            del self._content
-            self._load()
-
-    def _load(self, res=None):
-        """Loads the attributes of this page."""
-        if self._title:
-            prefix = self._title.split(":", 1)[0]
-            if prefix != self._title:
-                try:
-                    id = self.site.name_to_id(prefix)
-                except exceptions.APIError:
-                    self._namespace = 0
-            elif prefix == self._title:
-                self._namespace = 0
+    @classmethod
+    def _groups(cls, fields):
+        """Returns the set of groups named by *fields*, a list of group or
+        attribute names."""
+        groups = set()
+        for field in fields:
+            if field not in cls.FIELDS:
+                found = [group for group, names in cls.FIELDS.iteritems()
+                         if field in names]
+                if not found:
+                    error = "Unknown field {0!r}.".format(field)
+                    raise exceptions.InvalidOptionError(error)
+                field = found[0]
+            groups.add(field)
+        return groups
+
+    @classmethod
+    def _fields_query(cls, groups):
+        """Returns a query for the attribute *groups* of one or more pages,
+        without the titles or ids. The creator is only asked for when the
+        latest revision isn't, as they come from the same module."""
+        query = {"action":"query"}
+        props = []
+        if "info" in groups:
+            props.append("info")
+            query["inprop"] = "protection|url"
+        if "revision" in groups or "content" in groups:
+            props.append("revisions")
+            query["rvprop"] = "ids|user|timestamp|sha1"
+            if "content" in groups:
+                query["rvprop"] += "|content"
+        elif "creator" in groups:
+            props.append("revisions")
+            query.update({"rvprop":"user", "rvlimit":1, "rvdir":"newer"})
+        if "langlinks" in groups:
+            props.append("langlinks")
+            query["lllimit"] = "max"
+        if "extlinks" in groups:
+            props.append("extlinks")
+            query["ellimit"] = "max"
+        query["prop"] = "|".join(props)
+        return query
+
+    def load(self, res=None, fields=None):
+        """Loads the attributes of the current page in *fields*, or those
+        the page was made with. *res* can be an already fetched API result
+        for this page, in which case no queries are made."""
+        groups = self._groups(fields) if fields else self._fields
+        with self.site.instrumentation.label("Page.load"):
+            self._load(groups, res)
+
+            if self._follow_redirects and self.is_redirect:
+                self._title = self.get_redirect_target().title
+                self._forget()
+                self._load(groups)
+
+    def _load(self, groups, res=None):
+        """Loads the attribute *groups* of this page, in one query where
+        the API allows, or from *res* if given."""
+        if res:
+            self._fill(res["query"]["pages"].values()[0], groups)
+            return
+        groups = set(groups)
+        if "content" in groups and self.site._consult_store(self._pageid):
+            groups = self._load_stored(groups)
+            if not groups:
+                return
+        queries = [groups]
+        if "creator" in groups and groups - set(["info", "creator"]):
+            # The first revision needs a query of its own.
+            groups.discard("creator")
+            queries.append(set(["creator"]))
+        for part in queries:
+            query = self._fields_query(part)
+            if self._title:
+                query["titles"] = self._title
+            elif self._pageid:
+                query["pageids"] = self._pageid
             else:
-                self._namespace = id
-
-        query = {"action":"query", "prop":"info|revisions", "inprop":
-            "protection|url", "rvprop":"user", "rvlimit":1, "rvdir":"newer"}
-        if self._title:
-            query["titles"] = self._title
-        elif self._pageid:
-            query["pageid"] = self._pageid
+                error = "No page name or id specified"
+                raise exceptions.PageError(error)
+            more = "langlinks" in part or "extlinks" in part
+            res = self.site.query(query, query_continue=more)
+            self._fill(res["query"]["pages"].values()[0], part)
+
+    def _load_stored(self, groups):
+        """Loads the attribute *groups* but the content, along with the
+        page's info and latest revision, and then the content of that
+        revision, from the site's content store if it has it and by its
+        revision id otherwise. Returns the groups still to be loaded."""
+        first = (groups - set(["content"])) | set(["info", "revision"])
+        self._load(first)
+        self.site._load_stored([self])
+        return groups - first - (self._loaded & set(["content"]))
+
+    def _require(self, group):
+        """Loads the attribute *group*, unless it already is."""
+        if group not in self._loaded:
+            self._load([group])
+
+    def _forget(self, *groups):
+        """Marks the attribute *groups*, or all of them, as out of date,
+        so that they are loaded again when next asked for."""
+        if groups:
+            self._loaded.difference_update(groups)
         else:
-            error = "No page name or id specified"
-            raise exceptions.PageError(error)
-        a = res if res else self.site.query(query, query_continue=False)
-        result = a["query"]["pages"].values()[0]
-        if "invalid" in result:
+            self._loaded.clear()
+
+    def _fill(self, data, groups):
+        """Sets the attribute *groups* of this page from *data*, this
+        page's part of a query result."""
+        if "invalid" in data:
             error = "Invalid page title {0}".format(unicode(
                 self._title))
             raise exceptions.PageError(error)
-        elif "missing" in result:
+        self._starttimestamp = strftime("%Y-%m-%dT%H:%M:%SZ", gmtime())
+        if "info" in groups:
+            self._fill_info(data)
+        if "revision" in groups or "content" in groups:
+            self._fill_revision(data, "content" in groups)
+            self._loaded.add("revision")
+        if "langlinks" in groups:
+            self._langlinks = {}
+            for langlink in data.get("langlinks", []):
+                self._langlinks[langlink["lang"]] = langlink["*"]
+        if "extlinks" in groups:
+            self._extlinks = [extlink["*"] for extlink in
+                              data.get("extlinks", [])]
+        if "creator" in groups:
+            revisions = data.get("revisions")
+            self._creator = revisions[0]["user"] if revisions else None
+        self._loaded.update(groups)
+
+    def _fill_info(self, data):
+        self._title = data.get("title", self._title)
+        if "missing" in data:
+            self._exists = False
             return
-        else:
-            self._exists = True
-
-        self._title = result["title"]
-        self._pageid = int(result["pageid"])
-        if result.get("protection", None):
+        self._exists = True
+        self._pageid = int(data["pageid"])
+        if data.get("protection", None):
             self._protection = {"move": (None, None),
                                 "create": (None, None),
                                 "edit": (None, None)}
-            for item in result["protection"]:
+            for item in data["protection"]:
                 level = item["level"]
                 expiry = item["expiry"]
                 if expiry == "infinity":
@@ -102,98 +300,124 @@ class Page(object):
                     expiry = parse(item["expiry"])
                 self._protection[item["type"]] = level, expiry
 
-        self._namespace = result["ns"]
-        self._is_redirect = "redirect" in result
+        self._namespace = data["ns"]
+        self._is_redirect = "redirect" in data
         self._is_talkpage = self._namespace % 2 == 1
-        self._fullurl = result["fullurl"]
-        self._last_revid = result["lastrevid"]
-        self._creator = result["revisions"][0]["user"]
-        self._starttimestamp = strftime("%Y-%m-%dT%H:%M:%SZ", gmtime())
-
-        #Now, find out what the current user can do to the page:
-        self._tokens = {}
-        for permission, token in self.site.tokener().items():
-            if token:
-                self._tokens[permission] = token
-            else:
-                continue
-
-        if self._do_content:
-            self._load_content()
+        self._fullurl = data["fullurl"]
+        self._last_revid = data["lastrevid"]
+
+    def _fill_revision(self, data, content):
+        revisions = data.get("revisions")
+        revision = revisions[0] if revisions else {}
+        self._revid = revision.get("revid")
+        self._sha1 = revision.get("sha1")
+        self._last_editor = revision.get("user")
+        self._last_edited = parse(revision["timestamp"]) if revision else None
+        if content:
+            self._set_content(revision.get("*"))
+            store = self.site.content_store
+            pageid = data.get("pageid", self._pageid)
+            if store is not None and pageid and self._revid and \
+                    self._content is not None:
+                store.put(pageid, self._revid, self._content)
 
     def assert_ability(self, action):
-        """Asserts whether or not the user can perform *action*."""
-        possible_actions = [i.lower() for i in self._tokens.keys()]
-        for one in possible_actions:
-            if action.lower() == one:
-                return
-            else:
-                continue
+        """Asserts whether or not the user can perform *action*, going by
+        the user's rights. The token for it is fetched as well, as the
+        action will need it."""
+        action = action.lower()
+        if self.site.has_right(action) and self.site.tokens[action]:
+            return
         error = "You do not have permission to perform `{0}`"
         raise exceptions.PermissionsError(error.format(action))
 
-    def _load_content(self):
-        """Loads the content of the current page."""
-        query = {"action":"query", "prop":"revisions|langlinks|extlinks", 
-            "titles":self._title, "rvprop":"user|content|timestamp",
-            "rvdir":"older"}
-        res = self.site.query(query, query_continue=True, 
-                prefix=("rv", "ll", "el"))
-        result = res["query"]["pages"].values()[0]
-        revisions = result["revisions"][0]
-        i = list(res["query"]["pages"])[0]
-        langlinks = res["query"]["pages"][i].get("langlinks", None)
-        extlinks = res["query"]["pages"][i].get("extlinks", None)
-        content = revisions["*"]
+    def _load_content(self, res=None):
+        """Loads the content of the current page, along with its langlinks
+        and extlinks, from *res* if given."""
+        self._load(("content", "langlinks", "extlinks"), res)
+
+    def _set_content(self, content):
+        """Sets the wikitext of the page to *content*. It is only parsed
+        once an attribute that comes from it is asked for."""
         try:
             self._content = content.decode()
         except Exception:
             self._content = content
-        b = self._title.split(":")
-        self._prefix = b[0] if not b[0] == self.title else None
-        self._last_editor = revisions["user"]
-        self._last_edited = parse(revisions["timestamp"])
-        code = mwparserfromhell.parse(self._content)
-        self._templates = code.filter_templates(recursive=True)
-        self._links = code.filter_links()
-        for link in self._links:                
-            title = str(link.title).lower()
-            if title.startswith("category:"):
-                cat = title.split(":")
-                if cat[0] == title:
-                    continue
-                self._categories.append(unicode(link.title))
-
-            elif title.startswith("image:") or title.startswith("file:") \
-                    or title.startswith("media:"):
-                self._files.append(unicode(link.title))
-        if langlinks:
-            for langlink in langlinks:
-                self._langlinks[langlink["lang"]] = langlink["*"]
-
-        if extlinks:
-            for extlink in extlinks:
-                self._extlinks.append(extlink["*"])
-
-        # Find out if we are allowed to edit the page or not.
-        user = self.site.get_username()
-        regex = "\{\{\s*(no)?bots\s*\|?((deny|allow)=(.*?))?\}\}"
-        re_compile = re.search(regex, self._content)
-        if not re_compile:
+        self._templates = self._links = None
+        self._categories = self._files = None
+        self._is_excluded = None
+
+    def _parse(self, full=True):
+        """Parses the page's content for the attributes that come from it,
+        unless that is already done. If *full* is False, the categories
+        and files will do, which the site's parse cache may have without
+        the parse tree."""
+        if self._templates is not None or \
+                (not full and self._categories is not None):
+            return
+        if self._content is None:
+            self._templates, self._links = [], []
+            self._categories, self._files = [], []
             return
-        if re_compile.group(1):
-            self._is_excluded = True
-        if user.lower() in re_compile.group(4).lower():
-            if re_compile.group(3) == "allow":
-                self._is_excluded = False
-            if re_compile.group(3) == "deny":
-                self._is_excluded = True
-        return
+        cache = self.site.parse_cache
+        if cache and self._revid and self._categories is None:
+            entry = cache.get(self._title, self._revid)
+            if entry:
+                self._categories = entry["categories"]
+                self._files = entry["files"]
+                if "tree" in entry:
+                    self._templates, self._links = entry["tree"]
+                    return
+                if not full:
+                    return
+
+        code = mwparserfromhell.parse(self._content)
+        templates = code.filter_templates(recursive=True)
+        links = code.filter_wikilinks()
+        categories, files = [], []
+        for link in links:
+            target = unicode(link.title).strip()
+            if target.startswith(u":"):
+                # [[:Category:Foo]] links to the category without adding
+                # the page to it.
+                continue
+            try:
+                title = self.site.title(target)
+            except exceptions.InvalidPageError:
+                continue
+            if title.ns == 14:
+                categories.append(title.full)
+            elif title.ns in (6, -2):
+                files.append(title.full)
+        self._templates, self._links = templates, links
+        self._categories, self._files = categories, files
+        if cache and self._revid:
+            cache.put(self._title, self._revid, len(self._content),
+                      (templates, links), categories, files)
 
     def _edit(self, text, summary, bot, minor, force, section, append, 
               prepend, create):
-        """Edits the page."""
-        token = self._tokens["edit"]
+        """Edits the page.
+
+        Unless *force* is set, a full-text edit that wouldn't change the
+        revision we have loaded is not sent at all, and one that only
+        appends, prepends or changes a single section sends just that.
+        Appending and prepending don't load the page to do so."""
+        blah = text.encode("utf8") if isinstance(text, unicode) else text
+        payload = {"text":text}
+        if not (force or section or append or prepend):
+            if self._unchanged(text, blah):
+                return {"edit":{"result":"Success", "nochange":"",
+                                "title":self._title,
+                                "pageid":self._pageid}}
+            if "content" in self._loaded and self._content:
+                payload = _minimal_edit(self._content, text) or payload
+        elif append:
+            payload = {"appendtext":text}
+        elif prepend:
+            payload = {"prependtext":text}
+
+        token = self.site.tokens["edit"]
         query = {"action":"edit", "title":self.title, "summary":summary}
         if section and (isinstance(section, (tuple, list)) or \
             section == "new"):
@@ -207,8 +431,11 @@ class Page(object):
         if minor is True:
             query["minor"] = "true"
         if not force:
-            query["basetimestamp"] = self.last_edited
-            query["starttimestamp"] = self._starttimestamp
+            if "revision" in self._loaded or not (append or prepend):
+                if self.last_edited:
+                    query["basetimestamp"] = self.last_edited
+            if self._starttimestamp:
+                query["starttimestamp"] = self._starttimestamp
             if create and (self.exists is False):
                 query["createonly"] = "true"
             elif create and (self.exists is not False):
@@ -218,23 +445,20 @@ class Page(object):
         else:
             query["recreate"] = "true"
 
-        blah = text.encode("utf8") if isinstance(text, unicode) else text
-        hashed = md5(blah).hexdigest()
-        if append:
-            query.update({"appendtext":text})
-        elif prepend:
-            query.update({"prependtext":text})
-        else:
-            query.update({"text":text})
-        query.update({"md5":hashed, "token":token})
+        sent = payload.get("text", payload.get("appendtext",
+                           payload.get("prependtext")))
+        if sent is not text:
+            blah = sent.encode("utf8") if isinstance(sent, unicode) else sent
+        query.update(payload)
+        query.update({"md5":md5(blah).hexdigest(), "token":token})
         try:
             data = self.site.query(query)
         except exceptions.APIError as error:
             if error.code in ["editconflict", "pagedeleted", "articleexists"]:
                 # These values are now outdated and need to be reloaded
-                self._content = None
-                self._last_edited = None
-                self._exists = None
+                self._forget()
+                if error.code == "editconflict":
+                    raise exceptions.EditConflictError(error.info)
                 raise exceptions.EditError(error.info)
             elif error.code in ["noedit-anon", "cantcreate-anon",
                 "noimageredirect-anon", "noedit", "cantcreate", 
@@ -251,13 +475,20 @@ class Page(object):
             raise exceptions.EditError(error.info)
 
         if data["edit"]["result"] == "Success":
-            self._content = None
-            self._last_edited = None
-            self._exists = None
+            self._forget()
             return data
 
         raise exceptions.EditError(data["edit"])
 
+    def _unchanged(self, text, encoded):
+        """Tells whether *text*, *encoded* as UTF-8, is what the loaded
+        revision of the page already holds, going by its SHA-1 if known."""
+        if "revision" not in self._loaded or not self._revid:
+            return False
+        if self._sha1:
+            return sha1(encoded).hexdigest() == self._sha1
+        return "content" in self._loaded and self._content == text
+
     def edit(self, text, summary="", bot=False, minor=False, force=False,
              section=False):
         """Replaces the page's contents with *text* with 
@@ -269,7 +500,9 @@ class Page(object):
         disregarding if the page doesn't exist or if there is an edit
         conflict.
         
-        Returns a dictionary containing the results of the edit.
+        Returns a dictionary containing the results of the edit. An edit
+        that would change nothing is not sent, and gives a result with
+        "nochange" set, like the API's.
         """
         self.assert_ability("edit")
         return self._edit(text, summary, bot, minor, force, section, 
@@ -328,7 +561,7 @@ class Page(object):
         *reason*.
         """
         self.assert_ability("move")
-        token = self._tokens(["move"])
+        token = self.site.tokens["move"]
         query = {"action":"move", "from":self.title, "to":target,
                  "reason":reason, "token":token}
         allowed = ["movetalk", "movesubpages", "noredirect", "watch", 
@@ -339,27 +572,9 @@ class Page(object):
         return self.site.query(query)
 
     def toggle_talk(self, follow_redirects=None):
-        if self.namespace < 0:
-            ns = self.site.id_to_name(self.namespace)
-            error = "Pages in the {0} namespace cannot have talk pages."
-            raise exceptions.PageError(error)
-
-        if self.is_talkpage:
-            namespace = self.namespace - 1
-        else:
-            namespace = self.namespace + 1
-
-        try:
-            new_title = self.title.split(":", 1)[1]
-        except IndexError:
-            new_title = self._title
-
-        new_prefix = self.site.id_to_name(namespace)
-        if new_prefix:
-            new_title = u":".join((new_prefix, new_title))
-        else:
-            new_title = new_title
-
+        """Returns the talk page of this page, or the subject page if
+        this is a talk page."""
+        new_title = self.site.title(self._title).toggle_talk().full
         if follow_redirects is None:
             follow_redirects = self._follow_redirects
         return Page(self.site, new_title, follow_redirects=follow_redirects)
@@ -375,13 +590,28 @@ class Page(object):
             self.redirect_target = None
             return None
         try:
-            target = re.match(re_redirect, content).group(1)
-            self.redirect_target = Page(self.site, page)
-        except IndexError:
+            target = re.match(re_redirect, content, re.I).group(1)
+            self.redirect_target = Page(self.site, target)
+        except (AttributeError, IndexError):
             error = "Something went wrong. This may be a glitch in MediaWiki."
             raise exceptions.PageError(error)
         return self.redirect_target
 
+    def revisions(self, start=None, end=None, content=False, props=None,
+                  newer=False):
+        """Yields the revisions of the page as Revision records, newest
+        first, or oldest first if *newer* is True. *start* and *end* are
+        timestamps (or datetimes) to start and stop at, as with the API's
+        rvstart and rvend. *props* lists the revision properties to get,
+        by default those in REVISION_PROPS; if *content* is True, the text
+        of each revision is fetched as well.
+
+        Revisions are fetched as many at a time as the API allows, only
+        one batch being held in memory at once, so that long histories can
+        be gone through. See Site.iter_revisions() for many pages."""
+        return self.site.iter_revisions([self], start, end, content, props,
+                                        newer)
+
     def rollback(self):
         """Reverts the last edit to the current page."""
         raise NotImplementedError()
@@ -406,7 +636,7 @@ class Page(object):
     def delete(self, reason="", unwatch=True, watch=False):
         """Deletes the current page and clears invalidated attributes."""
         self.assert_ability("delete")
-        token = self._tokens["delete"]
+        token = self.site.tokens["delete"]
         query = {"action":"delete", "title":self.title, "token":token,
                  "reason":reason}
         if watch and unwatch:
@@ -416,22 +646,20 @@ class Page(object):
             query["unwatch"] = "true"
         elif watch:
             query["watch"] = "true"
-        data = self.query(query)
-        self._content = None
-        self._last_edited = None
-        self._exists = False
+        data = self.site.query(query)
+        self._forget()
         return data
 
     def watch(self, action="watch"):
         """Adds the current page to the current user's watchlist."""
         self.assert_ability("watch")
-        token = self._tokens["watch"]
+        token = self.site.tokens["watch"]
         query = {"action":"watch", "title":self.title, "token":token}
         if action == "watch":
-            data = self.query(query)
+            data = self.site.query(query)
         elif action == "unwatch":
             query["unwatch"] = "true"
-            data = self.query(query)
+            data = self.site.query(query)
         else:
             error = "Unknown option `{0}` was specified."
             raise exceptions.InvalidOptionError(error)
@@ -439,74 +667,114 @@ class Page(object):
 
     @property
     def title(self):
+        if not self._title:
+            self._require("info")
         return self._title
 
     @property
     def pageid(self):
+        if not self._pageid:
+            self._require("info")
         return self._pageid
 
     @property
     def exists(self):
+        self._require("info")
         return self._exists
 
     @property
     def is_redirect(self):
+        self._require("info")
         return self._is_redirect
 
     @property
     def last_revid(self):
+        self._require("info")
         return self._last_revid
 
     @property
     def last_edited(self):
+        self._require("revision")
         return self._last_edited
 
+    @property
+    def last_editor(self):
+        self._require("revision")
+        return self._last_editor
+
     @property
     def creator(self):
+        self._require("creator")
         return self._creator
 
     @property
     def fullurl(self):
+        self._require("info")
         return self._fullurl
 
+    @property
+    def protection(self):
+        self._require("info")
+        return self._protection
+
     @property
     def content(self):
+        self._require("content")
         return self._content
 
     @property
     def prefix(self):
-        return self._prefix
+        return self.site.title(self.title).prefix or None
 
     @property
     def namespace(self):
-        return self._namespace
+        return self.site.title(self.title).ns
 
     @property
     def templates(self):
+        self._require("content")
+        self._parse()
         return self._templates
 
     @property
     def extlinks(self):
+        self._require("extlinks")
         return self._extlinks
 
+    @property
+    def langlinks(self):
+        self._require("langlinks")
+        return self._langlinks
+
     @property
     def links(self):
+        self._require("content")
+        self._parse()
         return self._links
 
     @property
     def categories(self):
+        self._require("content")
+        self._parse(full=False)
         return self._categories
 
     @property
     def files(self):
+        self._require("content")
+        self._parse(full=False)
         return self._files
 
     @property
     def is_excluded(self):
+        self._require("content")
+        if self._is_excluded is None:
+            checker = self.site.exclusion
+            self._is_excluded = checker.is_excluded(self._content)
         return self._is_excluded
 
     @property
     def is_talkpage(self):
+        self._require("info")
         return self._is_talkpage
 
     @property
@@ -0,0 +1,263 @@
+"""Openers that record a session with a wiki to disk, and play it back
+later without a network:
+
+    >>> site = Site(..., opener=RecordingOpener("session.jsonl"))
+    >>> # ... use site as usual, then:
+    >>> site.opener.close()
+    >>> site = Site(..., opener=ReplayOpener("session.jsonl", latency=0.1))
+
+Requests are matched on their parameters, leaving out those that change
+between sessions, such as tokens and passwords, which are never written
+to the recording. Neither are cookies, nor the tokens in replies, which
+are swapped for a placeholder. A request made several times gets the
+replies recorded for it in order, the last one being repeated once they
+run out."""
+import time
+import gzip
+import random
+from threading import Lock
+from collections import deque
+from StringIO import StringIO
+from httplib import HTTPMessage
+from urllib2 import Request, URLError, HTTPError
+from urlparse import parse_qsl, urlparse
+try:
+    import json
+except Exception:
+    import simplejson as json
+
+from .cache import make_key
+from .connection import PooledOpener
+
+__all__ = ["RecordingOpener", "ReplayOpener"]
+
+VOLATILE = ("lgpassword", "password", "retype", "starttimestamp", "md5")
+SECRET_HEADERS = ("cookie", "set-cookie", "set-cookie2", "authorization")
+REDACTED = u"redacted+\\"
+
+def _volatile(key):
+    return key in VOLATILE or key.endswith("token")
+
+def _request_params(fullurl, data):
+    if isinstance(fullurl, Request):
+        fullurl, data = fullurl.get_full_url(), fullurl.get_data()
+    url = urlparse(fullurl)
+    pairs = parse_qsl(url.query, keep_blank_values=True)
+    if isinstance(data, basestring):
+        pairs += parse_qsl(data, keep_blank_values=True)
+    elif data is not None:
+        # A MultipartBody; files are left out of the key.
+        enc = lambda s: s.encode("utf8") if isinstance(s, unicode) else str(s)
+        pairs += [(enc(key), enc(val)) for key, val in data.fields.items()]
+    params = dict((key.decode("utf8", "replace"), val.decode("utf8",
+                   "replace")) for key, val in pairs)
+    return fullurl, url.path, params
+
+def _key(path, params):
+    stable = dict((key, val) for key, val in params.iteritems()
+                  if not _volatile(key))
+    return make_key(stable, path)
+
+def _gzip(body):
+    stream = StringIO()
+    zipper = gzip.GzipFile(fileobj=stream, mode="wb")
+    zipper.write(body)
+    zipper.close()
+    return stream.getvalue()
+
+def _redact(body):
+    """Returns the JSON reply *body* with the value of every key ending in
+    "token" replaced by REDACTED, or *body* itself if it has none."""
+    if "token" not in body:
+        return body
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return body
+    found = []
+
+    def walk(node):
+        if isinstance(node, dict):
+            for key, val in node.iteritems():
+                if key.endswith("token") and isinstance(val, basestring):
+                    node[key] = REDACTED
+                    found.append(key)
+                else:
+                    walk(val)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item)
+
+    walk(data)
+    return json.dumps(data) if found else body
+
+def _headers(headers):
+    lines = "".join("{0}: {1}\r\n".format(key, val) for key, val in headers)
+    return HTTPMessage(StringIO(lines))
+
+
+class RecordedResponse(object):
+    """A reply served from memory, looking like those of PooledOpener."""
+
+    def __init__(self, url, code, msg, headers, body):
+        self.url = url
+        self.code = code
+        self.msg = msg
+        self.headers = headers
+        self._stream = StringIO(body)
+
+    def read(self, amt=None):
+        if amt is None:
+            return self._stream.read()
+        return self._stream.read(amt)
+
+    def close(self):
+        pass
+
+    def info(self):
+        return self.headers
+
+    def geturl(self):
+        return self.url
+
+    def getcode(self):
+        return self.code
+
+
+class RecordingOpener(object):
+    """Passes requests on to *opener* (a new PooledOpener by default),
+    appending every request and its reply to the file at *path* as a line
+    of JSON."""
+
+    def __init__(self, path, opener=None):
+        self.opener = opener or PooledOpener()
+        self._file = open(path, "a")
+        self._lock = Lock()
+
+    @property
+    def cookie_jar(self):
+        return getattr(self.opener, "cookie_jar", None)
+
+    @cookie_jar.setter
+    def cookie_jar(self, value):
+        self.opener.cookie_jar = value
+
+    @property
+    def addheaders(self):
+        return self.opener.addheaders
+
+    @addheaders.setter
+    def addheaders(self, value):
+        self.opener.addheaders = value
+
+    def open(self, fullurl, data=None):
+        url, path, params = _request_params(fullurl, data)
+        try:
+            reply = self.opener.open(fullurl, data)
+        except HTTPError as error:
+            body = error.read()
+            self._record(path, params, error.code, error.msg,
+                         error.hdrs, body)
+            raise HTTPError(error.filename, error.code, error.msg,
+                            error.hdrs, StringIO(body))
+        body = reply.read()
+        reply.close()
+        self._record(path, params, reply.code, reply.msg, reply.headers,
+                     body)
+        headers = reply.headers
+        return RecordedResponse(reply.geturl(), reply.code, reply.msg,
+                                headers, body)
+
+    def _record(self, path, params, code, msg, headers, body):
+        compressed = headers.get("Content-Encoding") == "gzip"
+        if compressed:
+            body = gzip.GzipFile(fileobj=StringIO(body)).read()
+        body = _redact(body)
+        entry = {"key": _key(path, params), "code": code, "msg": msg,
+                 "gzip": compressed, "headers": [
+                     (key, val) for key, val in headers.items()
+                     if key.lower() not in ("content-encoding",
+                                            "content-length") +
+                     SECRET_HEADERS]}
+        try:
+            entry["body"] = body.decode("utf8")
+        except UnicodeDecodeError:
+            entry["body64"] = body.encode("base64")
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+        if hasattr(self.opener, "close"):
+            self.opener.close()
+
+
+class ReplayOpener(object):
+    """Serves the replies recorded in the file at *path* instead of going
+    to the network.
+
+    Every reply is held back by *latency* seconds, plus a random delay of
+    up to *jitter* seconds drawn from a generator seeded with *seed*, so
+    that runs are repeatable. A request that was never recorded raises
+    URLError."""
+
+    def __init__(self, path, latency=0, jitter=0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.cookie_jar = None
+        self.addheaders = []
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._replies = {}
+        self._lock = Lock()
+        with open(path) as fp:
+            for line in fp:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._replies.setdefault(entry["key"],
+                                             deque()).append(entry)
+
+    def _next(self, key):
+        with self._lock:
+            self.requests += 1
+            replies = self._replies.get(key)
+            if not replies:
+                return None, 0
+            entry = replies.popleft() if len(replies) > 1 else replies[0]
+            delay = self.latency
+            if self.jitter:
+                delay += self._random.uniform(0, self.jitter)
+            return entry, delay
+
+    def open(self, fullurl, data=None):
+        url, path, params = _request_params(fullurl, data)
+        entry, delay = self._next(_key(path, params))
+        if entry is None:
+            raise URLError("no recorded reply for {0}".format(params))
+        if delay:
+            time.sleep(delay)
+        if "wire" not in entry:
+            # Only encode each reply once, so that replaying costs as
+            # little as possible next to the code being measured.
+            if "body" in entry:
+                body = entry["body"].encode("utf8")
+            else:
+                body = entry["body64"].decode("base64")
+            headers = list(entry["headers"])
+            if entry["gzip"]:
+                body = _gzip(body)
+                headers.append(("Content-Encoding", "gzip"))
+            headers.append(("Content-Length", str(len(body))))
+            entry["wire"] = body, headers
+        body, headers = entry["wire"]
+        headers = _headers(headers)
+        if entry["code"] >= 400:
+            raise HTTPError(url, entry["code"], entry["msg"], headers,
+                            StringIO(body))
+        return RecordedResponse(url, entry["code"], entry["msg"], headers,
+                                body)
+
+    def close(self):
+        pass
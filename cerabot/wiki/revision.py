@@ -0,0 +1,50 @@
+from dateutil.parser import parse
+
+__all__ = ["Revision"]
+
+class Revision(object):
+    """A single revision of a page, as yielded by Page.revisions(). Only
+    what was asked for is filled in; the rest is None. *timestamp* is the
+    API's string, and *time* the same as a datetime.
+
+    Revisions keep their attributes in slots rather than a dict, so that
+    long histories take as little memory as they can."""
+    __slots__ = ("title", "revid", "parentid", "timestamp", "user",
+                 "comment", "size", "sha1", "minor", "content")
+
+    def __init__(self, title, revid=None, parentid=None, timestamp=None,
+                 user=None, comment=None, size=None, sha1=None, minor=None,
+                 content=None):
+        self.title = title
+        self.revid = revid
+        self.parentid = parentid
+        self.timestamp = timestamp
+        self.user = user
+        self.comment = comment
+        self.size = size
+        self.sha1 = sha1
+        self.minor = minor
+        self.content = content
+
+    @classmethod
+    def from_api(cls, title, data, flags=False, names=None):
+        """Makes a Revision of the page *title* from *data*, one item of
+        the revisions of a query result, which has the revision's flags if
+        *flags* is True. *names*, a dict, is used to share one string
+        between the many revisions by the same user."""
+        user = data.get("user")
+        if names is not None and user is not None:
+            user = names.setdefault(user, user)
+        minor = "minor" in data if flags else None
+        return cls(title, data.get("revid"), data.get("parentid"),
+                   data.get("timestamp"), user, data.get("comment"),
+                   data.get("size"), data.get("sha1"), minor,
+                   data.get("*"))
+
+    @property
+    def time(self):
+        return parse(self.timestamp) if self.timestamp else None
+
+    def __repr__(self):
+        return "Revision(title={0!r}, revid={1!r}, user={2!r})".format(
+            self.title, self.revid, self.user)
@@ -0,0 +1,146 @@
+import time
+from threading import Lock
+
+__all__ = ["TokenBucket", "RequestScheduler", "is_write"]
+
+WRITE_ACTIONS = frozenset(["block", "createaccount", "delete", "edit",
+    "emailuser", "filerevert", "import", "managetags", "mergehistory",
+    "move", "options", "patrol", "protect", "purge", "rollback", "unblock",
+    "undelete", "upload", "userrights", "watch"])
+
+def is_write(params):
+    """Returns True if the API request made with *params* changes
+    something on the wiki, rather than just reading from it."""
+    return params.get("action") in WRITE_ACTIONS
+
+
+class TokenBucket(object):
+    """Hands out one token every 1/*rate* seconds, letting up to *burst*
+    of them pile up while unused. A *rate* of None means no limit."""
+
+    def __init__(self, rate, burst=1):
+        self._base_rate = rate
+        self._rate = rate
+        self._burst = burst
+        self._tokens = float(burst)
+        self._stamp = time.time()
+        self._lock = Lock()
+
+    def _refill(self, now):
+        if self._rate:
+            elapsed = now - self._stamp
+            self._tokens = min(self._burst,
+                               self._tokens + elapsed * self._rate)
+        self._stamp = now
+
+    def reserve(self):
+        """Takes a token and returns how many seconds the caller has to wait
+        before using it. Tokens can be taken ahead of time, so callers are
+        served in the order they asked."""
+        if not self._rate:
+            return 0
+        with self._lock:
+            now = time.time()
+            self._refill(now)
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self._rate
+
+    def scale(self, factor):
+        """Sets the rate to *factor* times the rate given at creation."""
+        if self._base_rate:
+            with self._lock:
+                self._refill(time.time())
+                self._rate = self._base_rate * factor
+
+    @property
+    def rate(self):
+        return self._rate
+
+
+class RequestScheduler(object):
+    """Decides when each API request may be sent. Reads and writes take
+    tokens from two separate buckets, so that a slow edit rate does not
+    hold reads back. Both rates are cut when the wiki reports replication
+    lag or asks us to retry later, and slowly recover while requests
+    succeed."""
+    min_factor = 0.05
+    recovery = 0.05
+
+    def __init__(self, read_rate=None, write_rate=None, read_burst=5,
+                 write_burst=1):
+        self._reads = TokenBucket(read_rate, read_burst)
+        self._writes = TokenBucket(write_rate, write_burst)
+        self._factor = 1.0
+        self._paused_until = 0
+        self._waiting = 0
+        self._lock = Lock()
+
+    @classmethod
+    def from_throttle(cls, read_throttle, write_throttle):
+        """Builds a scheduler from minimum gaps between requests, given in
+        seconds, like the ones in Site.config."""
+        read = 1.0 / read_throttle if read_throttle else None
+        write = 1.0 / write_throttle if write_throttle else None
+        return cls(read, write)
+
+    def reserve(self, write=False):
+        """Reserves a slot for a request and returns the number of seconds
+        to wait before sending it."""
+        bucket = self._writes if write else self._reads
+        delay = bucket.reserve()
+        return max(delay, self._paused_until - time.time(), 0)
+
+    def wait(self, delay):
+        """Sleeps for *delay* seconds, counting towards queue_depth."""
+        if delay <= 0:
+            return
+        with self._lock:
+            self._waiting += 1
+        try:
+            time.sleep(delay)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    def acquire(self, write=False):
+        """Waits until a request may be sent. Returns the time waited."""
+        delay = self.reserve(write)
+        self.wait(delay)
+        return delay
+
+    def backoff(self, lag=None, retry_after=None):
+        """Called when the wiki refuses a request because of *lag* seconds
+        of replication lag, or tells us to come back in *retry_after*
+        seconds. Halves both rates and holds every request until then."""
+        with self._lock:
+            self._factor = max(self.min_factor, self._factor / 2)
+            factor = self._factor
+            pause = retry_after if retry_after else lag
+            if pause:
+                until = time.time() + pause
+                self._paused_until = max(self._paused_until, until)
+        self._reads.scale(factor)
+        self._writes.scale(factor)
+
+    def success(self):
+        """Called after every request the wiki served; slowly brings the
+        rates back up after a backoff."""
+        if self._factor >= 1:
+            return
+        with self._lock:
+            self._factor = min(1.0, self._factor + self.recovery)
+            factor = self._factor
+        self._reads.scale(factor)
+        self._writes.scale(factor)
+
+    @property
+    def rate(self):
+        """Current (reads, writes) per second; None means unlimited."""
+        return self._reads.rate, self._writes.rate
+
+    @property
+    def queue_depth(self):
+        """Number of requests currently waiting for their slot."""
+        return self._waiting
@@ -0,0 +1,228 @@
+import os
+import mmap
+import zlib
+import hashlib
+from threading import RLock
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+# What a damaged blob can raise when it is decompressed.
+_CORRUPT = (zlib.error, EOFError, ValueError) + \
+    ((lzma.LZMAError,) if lzma else ())
+
+from cerabot import exceptions
+
+__all__ = ["ContentStore"]
+
+class ContentStore(object):
+    """Keeps the wikitext of page revisions on disk in *directory*, keyed
+    on page id and revision id, so that jobs going over the same pages
+    again don't have to download them again. Give it to a Site as
+    *content_store*, and pages check it for their latest revision before
+    asking the API for their content.
+
+    Texts are compressed with *compression*, "zlib" or "lzma" (which needs
+    the lzma module, or backports.lzma on Python 2), and revisions with
+    the same text, going by SHA-1, share one copy. They are appended to
+    segment files of up to *segment_size* bytes, which are read back
+    through mmap, and an index of both is appended to as we go and read
+    back in full when the store is opened. A text that can't be read back
+    as it was stored, say after a crash, is treated as not stored."""
+    INDEX = "index"
+
+    def __init__(self, directory, compression="zlib", level=6,
+                 segment_size=64 * 2 ** 20):
+        if compression not in ("zlib", "lzma"):
+            error = "Unknown compression {0!r}.".format(compression)
+            raise exceptions.InvalidOptionError(error)
+        if compression == "lzma" and lzma is None:
+            error = "lzma compression needs the lzma module."
+            raise exceptions.InvalidOptionError(error)
+        self._directory = os.path.expanduser(directory)
+        if not os.path.isdir(self._directory):
+            os.makedirs(self._directory)
+        self._compression = compression
+        self._level = level
+        self._segment_size = segment_size
+        self._revisions = {}
+        self._blobs = {}
+        self._pages = set()
+        self._maps = {}
+        self._lock = RLock()
+        self.hits = 0
+        self.misses = 0
+        self._read_index()
+        self._index = open(self._path(self.INDEX), "ab")
+        self._segment = max([0] + [blob[0] for blob in
+                                   self._blobs.itervalues()])
+        self._writer = self._open_segment(self._segment)
+
+    def _path(self, name):
+        if isinstance(name, int):
+            name = "segment-{0:04d}".format(name)
+        return os.path.join(self._directory, name)
+
+    def _open_segment(self, segment):
+        writer = open(self._path(segment), "ab")
+        writer.seek(0, os.SEEK_END)
+        return writer
+
+    def _read_index(self):
+        """Loads the index written by earlier runs. A line cut short by a
+        crash is ignored, along with anything that refers to it, and cut
+        off the file so that new lines start on a line of their own."""
+        try:
+            fp = open(self._path(self.INDEX), "r+b")
+        except IOError:
+            return
+        with fp:
+            data = fp.read()
+            end = data.rfind("\n") + 1
+            if end < len(data):
+                fp.truncate(end)
+            for line in data[:end].splitlines():
+                fields = line.split()
+                try:
+                    if fields[0] == "B" and len(fields) == 5:
+                        digest = fields[1].decode("hex")
+                        self._blobs[digest] = tuple(int(field) for field in
+                                                    fields[2:])
+                    elif fields[0] == "R" and len(fields) == 4:
+                        digest = fields[3].decode("hex")
+                        if digest in self._blobs:
+                            key = int(fields[1]), int(fields[2])
+                            self._revisions[key] = digest
+                            self._pages.add(key[0])
+                except (IndexError, TypeError, ValueError):
+                    continue
+
+    def _compress(self, data):
+        if self._compression == "lzma":
+            return "x" + lzma.compress(data)
+        return "z" + zlib.compress(data, self._level)
+
+    def _decompress(self, blob, digest):
+        """Returns the text in *blob*, or None if it is damaged and doesn't
+        decompress to the text with the SHA-1 *digest*."""
+        try:
+            if blob[:1] == "x" and lzma:
+                data = lzma.decompress(blob[1:])
+            elif blob[:1] == "z":
+                data = zlib.decompress(blob[1:])
+            else:
+                return None
+        except _CORRUPT:
+            return None
+        return data if hashlib.sha1(data).digest() == digest else None
+
+    def _map(self, segment, end):
+        """Returns a map of *segment* that reaches at least *end*."""
+        mapped = self._maps.get(segment)
+        if mapped is None or len(mapped) < end:
+            if mapped is not None:
+                mapped.close()
+            with open(self._path(segment), "rb") as fp:
+                mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = mapped
+        return mapped
+
+    def _read_blob(self, digest):
+        """Returns the stored blob with the SHA-1 *digest*, or None if its
+        segment can't be read."""
+        entry = self._blobs.get(digest)
+        if entry is None:
+            return None
+        segment, offset, length = entry
+        try:
+            return self._map(segment, offset + length)[offset:offset +
+                                                       length]
+        except (EnvironmentError, ValueError):
+            return None
+
+    def get(self, pageid, revid):
+        """Returns the text of the revision *revid* of the page *pageid*,
+        or None if it isn't stored, or its stored copy is damaged."""
+        with self._lock:
+            digest = self._revisions.get((int(pageid), int(revid)))
+            blob = self._read_blob(digest) if digest else None
+        data = self._decompress(blob, digest) if blob else None
+        with self._lock:
+            if data is None:
+                if digest:
+                    # Have put() write it again rather than trust it.
+                    self._blobs.pop(digest, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+        return data.decode("utf8")
+
+    def put(self, pageid, revid, content):
+        """Stores *content*, the text of the revision *revid* of the page
+        *pageid*. Returns the SHA-1 of the text, in hex."""
+        key = int(pageid), int(revid)
+        data = content.encode("utf8") if isinstance(content, unicode) \
+            else content
+        digest = hashlib.sha1(data).digest()
+        with self._lock:
+            if self._revisions.get(key) == digest and \
+                    digest in self._blobs:
+                return digest.encode("hex")
+            if digest not in self._blobs:
+                self._write_blob(digest, self._compress(data))
+            self._index.write("R {0} {1} {2}\n".format(key[0], key[1],
+                              digest.encode("hex")))
+            self._index.flush()
+            self._revisions[key] = digest
+            self._pages.add(key[0])
+        return digest.encode("hex")
+
+    def _write_blob(self, digest, blob):
+        """Appends *blob* to the current segment, starting a new one if it
+        is full, and adds it to the index."""
+        offset = self._writer.tell()
+        if offset and offset + len(blob) > self._segment_size:
+            self._writer.close()
+            self._segment += 1
+            self._writer = self._open_segment(self._segment)
+            offset = 0
+        self._writer.write(blob)
+        self._writer.flush()
+        entry = self._segment, offset, len(blob)
+        self._index.write("B {0} {1} {2} {3}\n".format(digest.encode("hex"),
+                          *entry))
+        self._index.flush()
+        self._blobs[digest] = entry
+
+    def has_page(self, pageid):
+        """Tells whether any revision of the page *pageid* is stored."""
+        return int(pageid) in self._pages
+
+    def __contains__(self, key):
+        pageid, revid = key
+        return (int(pageid), int(revid)) in self._revisions
+
+    def __len__(self):
+        return len(self._revisions)
+
+    def stats(self):
+        """Returns the store's hit and miss counts, how many revisions and
+        distinct texts it holds, and their size on disk."""
+        with self._lock:
+            size = sum(blob[2] for blob in self._blobs.itervalues())
+            return {"hits": self.hits, "misses": self.misses,
+                    "revisions": len(self._revisions),
+                    "texts": len(self._blobs), "bytes": size}
+
+    def close(self):
+        """Closes the store's files."""
+        with self._lock:
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+            self._writer.close()
+            self._index.close()
@@ -0,0 +1,180 @@
+import re
+from cerabot import exceptions
+
+__all__ = ["Title", "NamespaceIndex"]
+
+_SPACES = re.compile(ur"[ _\u00a0]+")
+_INVALID = re.compile(ur"[<>\[\]{}|\x00-\x1f\x7f]")
+
+class Title(object):
+    """An immutable, normalized page title: namespace *ns* and the rest of
+    the title, *text*. Titles compare and hash like their full unicode
+    form, so they can be mixed with plain strings as dict keys.
+
+    Titles are made by a NamespaceIndex, usually through Site.title(), and
+    not directly."""
+    __slots__ = ("ns", "text", "full", "_index", "__weakref__")
+
+    def __init__(self, index, ns, text):
+        prefix = index.name_of(ns)
+        full = u":".join((prefix, text)) if prefix else text
+        set_ = super(Title, self).__setattr__
+        set_("ns", ns)
+        set_("text", text)
+        set_("full", full)
+        set_("_index", index)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Title objects are immutable")
+
+    @property
+    def prefix(self):
+        """The local name of the title's namespace, empty for articles."""
+        return self._index.name_of(self.ns)
+
+    @property
+    def dbkey(self):
+        """The title with underscores instead of spaces, as in URLs."""
+        return self.full.replace(u" ", u"_")
+
+    @property
+    def is_talk(self):
+        return self.ns > 0 and self.ns % 2 == 1
+
+    def talk(self):
+        """Returns the title of the talk page belonging to this one."""
+        if self.ns < 0:
+            error = "Pages in the {0} namespace cannot have talk pages."
+            raise exceptions.PageError(error.format(self.prefix))
+        if self.is_talk:
+            return self
+        return self._index.make(self.ns + 1, self.text)
+
+    def subject(self):
+        """Returns the title of the page this talk page belongs to."""
+        if not self.is_talk:
+            return self
+        return self._index.make(self.ns - 1, self.text)
+
+    def toggle_talk(self):
+        """Returns the talk page title for a subject page title, and the
+        other way around."""
+        return self.subject() if self.is_talk else self.talk()
+
+    def __eq__(self, other):
+        if isinstance(other, Title):
+            return self.full == other.full
+        return self.full == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.full)
+
+    def __unicode__(self):
+        return self.full
+
+    def __str__(self):
+        return self.full.encode("utf8")
+
+    def __repr__(self):
+        return "Title({0!r})".format(self.full)
+
+
+class NamespaceIndex(object):
+    """A case-folded index of a site's namespace names and aliases, built
+    once from *namespaces*, a dict mapping namespace ids to lists of
+    names with the local name first, as in Site._namespaces. If *case* is
+    "first-letter", the first letter of titles is uppercased, as on most
+    wikis.
+
+    parse() interns the titles it makes, so that parsing the same title
+    twice costs a dict lookup and gives back the same object. At most
+    *max_interned* of them are kept; past that, the table starts over."""
+
+    def __init__(self, namespaces, case="first-letter", max_interned=100000):
+        self._first_letter = case == "first-letter"
+        self._names = {}
+        self._primary = {}
+        for ns_id, names in namespaces.iteritems():
+            ns_id = int(ns_id)
+            self._primary[ns_id] = names[0] if names else u""
+            for name in names:
+                self._names[self.fold(name)] = ns_id
+        self._max_interned = max_interned
+        self._parsed = {}
+        self._titles = {}
+
+    @staticmethod
+    def fold(name):
+        """Returns the form *name* is looked up by."""
+        return _SPACES.sub(u" ", name).strip().lower()
+
+    def id_of(self, name):
+        """Returns the id of the namespace called *name*, or None."""
+        return self._names.get(self.fold(name))
+
+    def name_of(self, ns_id):
+        """Returns the local name of the namespace *ns_id*. Raises KeyError
+        if there is no such namespace."""
+        return self._primary[ns_id]
+
+    def __contains__(self, ns_id):
+        return ns_id in self._primary
+
+    def __iter__(self):
+        return iter(sorted(self._primary))
+
+    def make(self, ns, text):
+        """Returns the Title for the already normalized *text* in the
+        namespace *ns*."""
+        if ns not in self._primary:
+            error = "No namespace with id {0}.".format(ns)
+            raise exceptions.InvalidPageError(error)
+        title = Title(self, ns, text)
+        if len(self._titles) >= self._max_interned:
+            self._titles.clear()
+        return self._titles.setdefault(title.full, title)
+
+    def parse(self, title, default_ns=0):
+        """Returns the Title for *title*, which is taken to be in the
+        namespace *default_ns* unless it has a namespace prefix of its
+        own. Raises InvalidPageError if it isn't a valid title."""
+        if isinstance(title, Title):
+            return title
+        key = (title, default_ns)
+        found = self._parsed.get(key)
+        if found is not None:
+            return found
+        ns, text = self._split(title, default_ns)
+        found = self.make(ns, text)
+        if len(self._parsed) >= self._max_interned:
+            self._parsed.clear()
+        self._parsed[key] = found
+        return found
+
+    def _split(self, title, default_ns):
+        """Normalizes *title*, returning its namespace id and the rest."""
+        if not isinstance(title, unicode):
+            title = title.decode("utf8")
+        text = _SPACES.sub(u" ", title).strip()
+        if text.startswith(u":"):
+            text = text[1:].lstrip()
+            default_ns = 0
+        text = text.split(u"#", 1)[0].rstrip()
+        if not text or _INVALID.search(text):
+            error = "Invalid page title {0!r}".format(title)
+            raise exceptions.InvalidPageError(error)
+        ns = default_ns
+        if u":" in text:
+            prefix, rest = text.split(u":", 1)
+            found = self._names.get(prefix.rstrip().lower())
+            if found is not None:
+                ns, text = found, rest.lstrip()
+                if not text:
+                    error = "Invalid page title {0!r}".format(title)
+                    raise exceptions.InvalidPageError(error)
+        if self._first_letter:
+            text = text[0].upper() + text[1:]
+        return ns, text
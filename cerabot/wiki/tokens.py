@@ -0,0 +1,65 @@
+from threading import RLock
+
+__all__ = ["TokenManager"]
+
+class TokenManager(object):
+    """Fetches the API tokens of a site with meta=tokens, only when they
+    are first needed, and keeps them for the rest of the session.
+
+    Tokens are asked for by the name of the action they are for, like
+    "edit" or "watch". Actions sharing a token type (most of them use the
+    "csrf" token) only cost one fetch between them."""
+    types = {"block": "csrf", "csrf": "csrf", "delete": "csrf",
+             "edit": "csrf", "email": "csrf", "import": "csrf",
+             "move": "csrf", "options": "csrf", "protect": "csrf",
+             "unblock": "csrf", "upload": "csrf", "createaccount":
+             "createaccount", "login": "login", "patrol": "patrol",
+             "rollback": "rollback", "userrights": "userrights",
+             "watch": "watch"}
+
+    def __init__(self, site):
+        self._site = site
+        self._tokens = {}
+        self._lock = RLock()
+
+    def _type(self, name):
+        return self.types.get(name, name)
+
+    def fetch(self, *names):
+        """Returns a dict of the tokens for every action in *names*, using
+        at most one request for those we don't have yet. Tokens the wiki
+        would not give us are None."""
+        with self._lock:
+            missing = set(self._type(name) for name in names)
+            missing.difference_update(self._tokens)
+            if missing:
+                query = {"action":"query", "meta":"tokens",
+                         "type":"|".join(sorted(missing))}
+                res = self._site.query(query)
+                tokens = res.get("query", {}).get("tokens", {})
+                for kind in missing:
+                    self._tokens[kind] = tokens.get(kind + "token")
+            return dict((name, self._tokens[self._type(name)])
+                        for name in names)
+
+    def get(self, name):
+        """Returns the token for the action *name*, or None."""
+        return self.fetch(name)[name]
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def refresh(self, token):
+        """Throws away *token*, which the wiki rejected, and returns a new
+        token of the same type, or None if it isn't one of ours."""
+        with self._lock:
+            for kind, value in self._tokens.items():
+                if value == token:
+                    del self._tokens[kind]
+                    return self.get(kind)
+        return None
+
+    def clear(self):
+        """Forgets every token, as after logging in or out."""
+        with self._lock:
+            self._tokens.clear()
@@ -19,7 +19,8 @@ class User(object):
         props = "blockinfo|groups|rights|editcount|registration|emailable|gender"
         query = {"action":"query", "list":"users", "ususers":self._user,
             "usprop":props}
-        res = self._site.query(query)
+        with self._site.instrumentation.label("User.load_attributes"):
+            res = self._site.query(query)
         result = res["query"]["users"][0]
 
         # If the name was entered oddly, normalize it:
@@ -68,7 +69,7 @@ class User(object):
     def email(self, text, subject, cc=True):
         if not self._emailable:
             raise exceptions.UserError("User is not allowed to be emailed.")
-        token = self._site.tokener(["email"])["email"]
+        token = self._site.tokens["email"]
         if not token:
             raise exceptions.PermissionError("Not permitted to email users.")
         query = {"action":"emailuser", "target":self.user, "text":text,
@@ -125,7 +126,7 @@ class User(object):
         args = args - valid_args
         if not args:
             raise exceptions.UserBlockError("No valid arguments specified.")
-        token_ = token if token else self._site.tokener(["block"])["block"]
+        token_ = token if token else self._site.tokens["block"]
         if not token:
             raise exceptions.PermissionsError("Not permitted to block users.")
         query = {"action":"block", "user":self.user, "expiry":expiry, "reason":
@@ -141,7 +142,7 @@ class User(object):
 
     def unblock(self, reason=""):
         """Unblocks the current user, with our reasoning being *reason*."""
-        token = self._site.tokener(["unblock"])["unblock"]
+        token = self._site.tokens["unblock"]
         if not token:
             raise exceptions.PermissionsError("Not permitted to unblock users")
         query = {"action":"unblock", "user":self.name, "token":token, "reason":
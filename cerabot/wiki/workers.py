@@ -0,0 +1,152 @@
+import sys
+from Queue import Queue
+from threading import Event, Lock, Thread
+
+__all__ = ["Future", "WorkerPool", "gather"]
+
+class Future(object):
+    """Holds the result of a call that is running in the background."""
+
+    def __init__(self):
+        self._done = Event()
+        self._lock = Lock()
+        self._result = None
+        self._error = None
+        self._callbacks = []
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_error(self, exc_info=None):
+        """Stores the exception currently being handled, or *exc_info* if
+        given, to be raised again by result()."""
+        self._error = exc_info if exc_info else sys.exc_info()
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        """Calls *callback* with this future once it is done, straight
+        away if it already is."""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """Waits for the call to finish and returns its result, raising
+        its exception if it failed."""
+        if not self._done.wait(timeout):
+            raise RuntimeError("Timed out waiting for result.")
+        if self._error:
+            raise self._error[0], self._error[1], self._error[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        """Waits for the call to finish and returns the exception it
+        raised, or None."""
+        if not self._done.wait(timeout):
+            raise RuntimeError("Timed out waiting for result.")
+        return self._error[1] if self._error else None
+
+    def exc_info(self, timeout=None):
+        """Like exception(), but returns the whole (type, value, traceback)
+        tuple, as set_error() takes it, or None."""
+        if not self._done.wait(timeout):
+            raise RuntimeError("Timed out waiting for result.")
+        return self._error
+
+
+def gather(futures):
+    """Returns a Future that is done once all of *futures* are, holding a
+    list of their results, or the first exception raised among them."""
+    futures = list(futures)
+    combined = Future()
+    if not futures:
+        combined.set_result([])
+        return combined
+    remaining = [len(futures)]
+    lock = Lock()
+
+    def on_done(future):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        for one in futures:
+            if one._error:
+                combined.set_error(one._error)
+                return
+        combined.set_result([one._result for one in futures])
+
+    for future in futures:
+        future.add_done_callback(on_done)
+    return combined
+
+
+class WorkerPool(object):
+    """A fixed number of daemon threads working through a shared queue of
+    calls. Threads are started on the first submit()."""
+
+    def __init__(self, workers=4):
+        self._workers = workers
+        self._queue = Queue()
+        self._threads = []
+        self._lock = Lock()
+
+    def _start(self):
+        with self._lock:
+            while len(self._threads) < self._workers:
+                thread = Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, func, args, kwargs = item
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                future.set_error()
+            else:
+                future.set_result(result)
+
+    def submit(self, func, *args, **kwargs):
+        """Queues ``func(*args, **kwargs)`` and returns its Future."""
+        if not self._threads:
+            self._start()
+        future = Future()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def shutdown(self, wait=True):
+        """Stops every worker once the calls already queued are done."""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            self._queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    @property
+    def workers(self):
+        return self._workers
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from cerabot import exceptions
+from cerabot.wiki.api import Site
+from cerabot.wiki.cache import make_key
+from cerabot.wiki.decoding import ResponseDecoder
+from cerabot.wiki.instrumentation import CallbackSink
+from cerabot.wiki.replay import RecordedResponse, _headers
+from cerabot.wiki.scheduler import RequestScheduler
+from tests.util import FakeSiteTestCase
+
+QUERY = {"action": "query", "list": "allpages", "aplimit": "max"}
+
+class SlowSite(Site):
+    """Holds every request back until *release* is set."""
+
+    def __init__(self, *args, **kwargs):
+        self.release = threading.Event()
+        super(SlowSite, self).__init__(*args, **kwargs)
+
+    def _send(self, *args):
+        self.release.wait(5)
+        return super(SlowSite, self)._send(*args)
+
+
+class CoalesceTest(FakeSiteTestCase):
+    fixture = {"pages": {u"A": u"a", u"B": u"b"}}
+
+    def test_followers_get_an_unchanged_copy(self):
+        site = self.make_site(SlowSite)
+        key = make_key(QUERY, False, False, None)
+        results = {}
+
+        def leader():
+            res = site.query(dict(QUERY))
+            res["mutated"] = True
+            results["leader"] = res
+
+        thread = threading.Thread(target=leader)
+        thread.start()
+        while key not in site._inflight:
+            thread.join(0.01)
+        follower = threading.Thread(target=lambda: results.setdefault(
+            "follower", site.query(dict(QUERY))))
+        follower.start()
+        while site._inflight[key][1] == 0:
+            follower.join(0.01)
+        site.release.set()
+        thread.join(5)
+        follower.join(5)
+        self.assertTrue(results["leader"]["mutated"])
+        self.assertNotIn("mutated", results["follower"])
+        self.assertEqual(len(results["follower"]["query"]["allpages"]), 2)
+        self.assertEqual(site._inflight, {})
+
+
+class ThrottleTest(FakeSiteTestCase):
+    fixture = {"pages": {u"A": u"a"}}
+
+    def test_write_wait_does_not_block_reads(self):
+        site = self.make_site(scheduler=RequestScheduler(write_rate=0.5))
+        site.scheduler.reserve(write=True)
+
+        def write():
+            try:
+                site.query({"action": "purge", "titles": u"A"})
+            except Exception:
+                pass
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        while not site.scheduler.queue_depth:
+            thread.join(0.01)
+        start = time.time()
+        site.query({"action": "query", "titles": u"A"})
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(site.scheduler.queue_depth, 1)
+        thread.join(5)
+
+
+class QueryItemsTest(FakeSiteTestCase):
+    fixture = {"pages": {u"A": u"a", u"B": u"b"}}
+
+    def setUp(self):
+        super(QueryItemsTest, self).setUp()
+        self.records = []
+        self.site.instrumentation.add_sink(CallbackSink(self.records.append))
+
+    def test_streamed_items_are_recorded(self):
+        items = list(self.site.query_items(QUERY, ["query", "allpages"]))
+        self.assertEqual([item["title"] for item in items], [u"A", u"B"])
+        self.assertEqual(len(self.records), 1)
+        self.assertGreater(self.records[0].bytes_wire, 0)
+
+    def test_stopping_early_closes_the_reply(self):
+        replies = []
+        opener = self.site.opener
+        open_ = opener.open
+
+        def recording(*args):
+            replies.append(open_(*args))
+            return replies[-1]
+        opener.open = recording
+        # Enough distinct titles that the gzipped reply outgrows what
+        # is read for the first item.
+        for i in xrange(500):
+            title = hashlib.sha512(str(i)).hexdigest()[:200]
+            self.wiki.add_page(u"Page " + title, u"")
+        self.site.decoder = ResponseDecoder(chunk_size=1024)
+        for item in self.site.query_items(QUERY, ["query", "allpages"]):
+            break
+        self.assertTrue(replies[0]._response.isclosed())
+        self.assertEqual(len(self.records), 1)
+
+    def test_fallback_finishes_its_record(self):
+        params = {"action": "query", "list": "nosuchlist"}
+        items = self.site.query_items(params, ["query", "nosuchlist"])
+        self.assertRaises(exceptions.APIError, list, items)
+        self.assertEqual([record.error for record in self.records],
+                         ["unknown_list", "unknown_list"])
+
+
+class IterQueryTest(FakeSiteTestCase):
+    fixture = {"pages": dict((u"Page {0}".format(i), u"Text")
+                             for i in xrange(7))}
+
+    def setUp(self):
+        super(IterQueryTest, self).setUp()
+        for i in xrange(4):
+            self.wiki.add_page(u"Page 0", u"Text {0}".format(i))
+
+    def titles(self, batches):
+        return [[item["title"] for item in batch["query"]["allpages"]]
+                for batch in batches]
+
+    def test_each_batch_can_be_resumed_from(self):
+        params = {"action": "query", "list": "allpages", "aplimit": 3}
+        batches = list(self.site.iter_query(params))
+        titles = self.titles(batches)
+        self.assertEqual([len(batch) for batch in titles], [3, 3, 1])
+        self.assertIn("continue", batches[0])
+        self.assertNotIn("continue", batches[-1])
+        resumed = self.site.iter_query(params, batches[0]["continue"])
+        self.assertEqual(self.titles(resumed), titles[1:])
+
+    def test_incomplete_rounds_are_merged(self):
+        params = {"action": "query", "titles": u"Page 0",
+                  "prop": "revisions", "rvlimit": 2}
+        batches = list(self.site.iter_query(params))
+        self.assertEqual(len(batches), 1)
+        page = batches[0]["query"]["pages"].values()[0]
+        self.assertEqual(len(page["revisions"]), 5)
+
+
+class SnapshotTest(FakeSiteTestCase):
+
+    def setUp(self):
+        super(SnapshotTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "site.json")
+        self.first = self.make_site(snapshot=self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(SnapshotTest, self).tearDown()
+
+    def saved(self):
+        with open(self.path, "rb") as fp:
+            return json.loads(fp.read())["saved"]
+
+    def test_fresh_snapshot_needs_no_request(self):
+        requests = self.server.requests
+        site = self.make_site(snapshot=self.path)
+        self.assertEqual(self.server.requests, requests)
+        self.assertEqual(site._name, self.first._name)
+        self.assertEqual(site._namespaces, self.first._namespaces)
+
+    def test_stale_snapshot_is_refreshed_in_the_background(self):
+        saved = self.saved()
+        site = self.make_site(snapshot=self.path,
+                              config={"snapshot_ttl": -1})
+        self.assertEqual(site._name, self.first._name)
+        deadline = time.time() + 5
+        while self.saved() == saved and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertGreater(self.saved(), saved)
+
+    def test_damaged_snapshot_falls_back_to_the_api(self):
+        with open(self.path, "wb") as fp:
+            fp.write("{\"saved\": ")
+        requests = self.server.requests
+        site = self.make_site(snapshot=self.path)
+        self.assertGreater(self.server.requests, requests)
+        self.assertEqual(site._name, self.first._name)
+        self.assertTrue(self.saved())
+
+
+class CorruptOpener(object):
+    """Claims every reply is gzipped, while its body is not."""
+
+    def __init__(self, opener):
+        self.opener = opener
+        self.cookie_jar = opener.cookie_jar
+        self.addheaders = opener.addheaders
+
+    def open(self, fullurl, data=None):
+        reply = self.opener.open(fullurl, data)
+        reply.read()
+        headers = _headers([("Content-Encoding", "gzip")])
+        return RecordedResponse(reply.geturl(), reply.code, reply.msg,
+                                headers, "not gzip at all")
+
+
+class CorruptReplyTest(FakeSiteTestCase):
+
+    def test_bad_gzip_is_an_api_error(self):
+        real = self.site.opener
+        self.site.opener = CorruptOpener(real)
+        self.assertRaises(exceptions.APIError, self.site.query, QUERY)
+        items = self.site.query_items(QUERY, ["query", "allpages"])
+        self.assertRaises(exceptions.APIError, list, items)
+        self.site.opener = real
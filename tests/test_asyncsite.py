@@ -0,0 +1,52 @@
+import shutil
+import tempfile
+
+from cerabot import exceptions
+from cerabot.wiki.asyncsite import AsyncSite
+from cerabot.wiki.store import ContentStore
+from tests.util import FakeSiteTestCase
+
+class AsyncSiteTest(FakeSiteTestCase):
+    fixture = {"pages": dict((u"Page {0}".format(i), u"Text {0}".format(i))
+                             for i in xrange(12))}
+
+    def setUp(self):
+        super(AsyncSiteTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.store = ContentStore(self.directory)
+        self.site = self.make_site(AsyncSite, workers=3,
+                                   content_store=self.store)
+
+    def tearDown(self):
+        self.site.close()
+        self.store.close()
+        shutil.rmtree(self.directory)
+        super(AsyncSiteTest, self).tearDown()
+
+    def test_query_async(self):
+        future = self.site.query_async({"action": "query", "aplimit": "max",
+                                        "list": "allpages"})
+        self.assertEqual(len(future.result(5)["query"]["allpages"]), 12)
+
+    def test_iter_list_follows_continuations(self):
+        params = {"action": "query", "list": "allpages", "aplimit": 5}
+        titles = [item["title"] for item in self.site.iter_list(params)]
+        self.assertEqual(sorted(titles), sorted(self.fixture["pages"]))
+
+    def test_load_pages_async_matches_load_pages(self):
+        self.site._title_limit = lambda: 5
+        titles = sorted(self.fixture["pages"])
+        pages = self.site.load_pages_async(titles).result(5)
+        self.assertEqual([p.content for p in pages],
+                         [self.fixture["pages"][t] for t in titles])
+        self.assertEqual(len(self.store), 12)
+        pages = self.site.load_pages_async(titles).result(5)
+        self.assertEqual(self.store.stats()["hits"], 12)
+        self.assertEqual([p.content for p in pages],
+                         [self.fixture["pages"][t] for t in titles])
+        summary = self.site.instrumentation.summary()
+        self.assertIn("Site.load_pages", summary)
+
+    def test_errors_reach_the_future(self):
+        future = self.site.load_pages_async([u"Page 1", u"Bad[Title"])
+        self.assertRaises(exceptions.PageError, future.result, 5)
@@ -0,0 +1,139 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from cerabot.wiki.cache import (DiskBackend, LRUCache, ParseCache,
+                                 ResponseCache, make_key)
+from tests.util import FakeSiteTestCase
+
+def _result(title, revid):
+    return {"query": {"pages": {"1": {"title": title, "lastrevid": revid,
+                                      "x": "x" * 50}}}}
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_evicted_values_are_handed_back(self):
+        evicted = []
+        cache = LRUCache(2, sizeof=lambda value: 1,
+                         on_evict=lambda key, value: evicted.append(key))
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        cache.pop("a")
+        self.assertEqual(evicted, ["b"])
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def put(self, cache, title, revid=1, prop="info"):
+        params = {"action": "query", "prop": prop, "titles": title}
+        key = make_key(params)
+        cache.put(key, params, _result(title, revid))
+        return key
+
+    def test_evicted_titles_are_forgotten(self):
+        cache = ResponseCache(max_bytes=300)
+        for i in xrange(20):
+            self.put(cache, u"Page {0}".format(i))
+        self.assertLess(len(cache._titles), 20)
+        self.assertEqual(set(cache._titles), set(cache._revids))
+        for title, keys in cache._titles.items():
+            self.assertTrue(all(key in cache._memory for key in keys))
+
+    def test_invalidate_unindexes_other_titles(self):
+        cache = ResponseCache()
+        params = {"action": "query", "prop": "info", "titles": u"A|B"}
+        cache.put(make_key(params), params, {})
+        cache.invalidate(u"A")
+        self.assertEqual(cache._titles, {})
+
+    def test_invalidations_are_capped(self):
+        cache = ResponseCache(max_invalidated=5)
+        for i in xrange(20):
+            cache.invalidate(u"Page {0}".format(i))
+        self.assertEqual(list(cache._invalidated),
+                         [u"Page {0}".format(i) for i in xrange(15, 20)])
+
+    def test_newer_revision_still_invalidates(self):
+        cache = ResponseCache()
+        key = self.put(cache, u"A", 1)
+        self.put(cache, u"A", 2, prop="info|revisions")
+        self.assertIsNone(cache.get(key))
+
+
+class SessionTest(FakeSiteTestCase):
+    fixture = {"pages": {u"A": u"a"},
+               "users": {u"Bot": {"password": "pw", "groups": ["sysop"]}}}
+
+    def setUp(self):
+        super(SessionTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.cache = ResponseCache(backend=DiskBackend(self.directory))
+        self.site = self.make_site(cache=self.cache)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(SessionTest, self).tearDown()
+
+    def test_userinfo_is_not_cached(self):
+        self.assertFalse(self.cache.cacheable(
+            {"action": "query", "meta": "siteinfo|userinfo"}))
+        self.assertFalse(self.cache.cacheable(
+            {"action": "query", "list": "watchlist"}))
+        self.assertTrue(self.cache.cacheable(
+            {"action": "query", "meta": "siteinfo"}))
+
+    def test_login_and_logout_start_afresh(self):
+        self.assertNotEqual(self.site.get_username(), u"Bot")
+        self.site.query({"action": "query", "titles": u"A"})
+        self.assertTrue(os.listdir(self.directory))
+        self.site.login((u"Bot", "pw"))
+        self.assertEqual(self.site.get_username(), u"Bot")
+        self.assertIn("delete", self.site.get_rights())
+        self.assertEqual(self.cache.stats()["entries"], 0)
+        self.assertEqual(os.listdir(self.directory), [])
+        self.site.logout()
+        self.assertNotEqual(self.site.get_username(), u"Bot")
+
+
+class ParseCacheTest(FakeSiteTestCase):
+    fixture = {"pages": {u"A": u"{{Stub}} [[Category:Things]] "
+                               u"[[File:A.png]] [[:Category:Other]]"}}
+
+    def setUp(self):
+        super(ParseCacheTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(ParseCacheTest, self).tearDown()
+
+    def page(self, cache):
+        page = self.make_site(parse_cache=cache).page(u"A")
+        page.load()
+        return page
+
+    def test_a_revision_is_parsed_once(self):
+        cache = ParseCache()
+        first, second = self.page(cache), self.page(cache)
+        self.assertEqual(first.categories, [u"Category:Things"])
+        self.assertIs(second.templates, first.templates)
+        self.assertEqual(second.files, [u"File:A.png"])
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.wiki.add_page(u"A", u"[[Category:Others]]")
+        self.assertEqual(self.page(cache).categories,
+                         [u"Category:Others"])
+        self.assertEqual(cache.stats()["misses"], 2)
+
+    def test_links_outlive_the_trees(self):
+        backend = DiskBackend(self.directory)
+        self.page(ParseCache(backend=backend)).templates
+        page = self.page(ParseCache(backend=backend))
+        self.assertEqual(page.categories, [u"Category:Things"])
+        self.assertEqual(page.files, [u"File:A.png"])
+        self.assertIsNone(page._templates)
+        self.assertEqual([unicode(t.name) for t in page.templates],
+                         [u"Stub"])
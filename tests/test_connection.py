@@ -0,0 +1,84 @@
+import time
+import unittest
+from httplib import BadStatusLine
+from urllib2 import URLError
+
+from cerabot.wiki.connection import ConnectionPool, PooledOpener
+from tests.util import FakeSiteTestCase
+
+class StaleConnection(object):
+    """A kept-alive connection the server has already closed."""
+
+    def __init__(self, fail_on="getresponse"):
+        self.fail_on = fail_on
+        self.requests = []
+
+    def request(self, method, selector, body=None, headers=None):
+        self.requests.append(method)
+        if self.fail_on == "request":
+            raise BadStatusLine("")
+
+    def getresponse(self):
+        raise BadStatusLine("")
+
+    def close(self):
+        pass
+
+
+class StalePool(ConnectionPool):
+    """Hands out *stale* as a reused connection, and counts the fresh ones
+    asked for, which fail as well."""
+
+    def __init__(self, stale):
+        super(StalePool, self).__init__()
+        self.stale = stale
+        self.fresh = []
+
+    def get(self, scheme, host):
+        return self.stale, True
+
+    def connect(self, scheme, host):
+        conn = StaleConnection()
+        self.fresh.append(conn)
+        return conn
+
+
+class StaleRetryTest(unittest.TestCase):
+    url = "http://wiki.invalid/w/api.php"
+
+    def open(self, data, fail_on="getresponse"):
+        pool = StalePool(StaleConnection(fail_on))
+        opener = PooledOpener(pool=pool)
+        self.assertRaises(URLError, opener.open, self.url, data)
+        return pool
+
+    def test_get_is_retried(self):
+        pool = self.open(None)
+        self.assertEqual(len(pool.fresh), 1)
+        self.assertEqual(pool.fresh[0].requests, ["GET"])
+
+    def test_sent_post_is_not_retried(self):
+        pool = self.open("action=edit&text=x")
+        self.assertEqual(pool.fresh, [])
+
+    def test_unsent_post_is_retried(self):
+        pool = self.open("action=edit&text=x", fail_on="request")
+        self.assertEqual(pool.fresh[0].requests, ["POST"])
+
+    def test_sent_query_is_retried(self):
+        pool = self.open("action=query&meta=siteinfo")
+        self.assertEqual(pool.fresh[0].requests, ["POST"])
+
+
+class IdleTimeoutTest(FakeSiteTestCase):
+    fixture = {"pages": {u"A": u"a"}}
+    server_options = {"idle_timeout": 0.3}
+
+    def test_connection_closed_by_the_server_is_not_used(self):
+        query = {"action": "query", "titles": u"A"}
+        self.site.query(query)
+        connections = self.server.connections
+        time.sleep(1)
+        self.site.query(query)
+        self.assertEqual(self.server.connections, connections + 1)
+        self.assertEqual(self.site.opener.pool.size, 1)
@@ -0,0 +1,50 @@
+from cerabot import exceptions
+from tests.util import FakeSiteTestCase, record_queries
+
+class EditQueueTest(FakeSiteTestCase):
+    fixture = {"pages": {u"A": u"a", u"Closed": u"{{nobots}}",
+                         u"Done": u"A"}}
+
+    def setUp(self):
+        super(EditQueueTest, self).setUp()
+        self.calls = []
+        self.queue = self.site.edit_queue(workers=2, retries=1)
+
+    def tearDown(self):
+        self.queue.close()
+        super(EditQueueTest, self).tearDown()
+
+    def upper(self, page):
+        self.calls.append(page.title)
+        return page.content.upper()
+
+    def conflicting(self, times):
+        """Returns a transform that has someone else edit the page first,
+        the first *times* times it is called."""
+        def transform(page):
+            if len(self.calls) < times:
+                later = u"{0}-01-01T00:00:00Z".format(2030 + len(self.calls))
+                self.wiki.add_page(page.title, page.content + u"b",
+                                   user=u"Other", timestamp=later)
+            return self.upper(page)
+        return transform
+
+    def test_conflicts_are_retried(self):
+        future = self.queue.submit(u"A", self.conflicting(1), u"Upper")
+        self.assertEqual(future.result(5)["edit"]["result"], "Success")
+        self.assertEqual(self.calls, [u"A", u"A"])
+        self.assertEqual(self.wiki.text(self.wiki.page(u"A")), u"AB")
+
+    def test_retries_run_out(self):
+        future = self.queue.submit(u"A", self.conflicting(2), u"Upper")
+        self.assertRaises(exceptions.EditConflictError, future.result, 5)
+        self.assertEqual(self.calls, [u"A", u"A"])
+
+    def test_nothing_to_do(self):
+        sent = record_queries(self.site)
+        futures = self.queue.submit_many([u"Closed", u"Done"], self.upper)
+        self.assertEqual([future.result(5) for future in futures],
+                         [None, None])
+        self.assertEqual(self.calls, [u"Done"])
+        self.assertFalse([params for params in sent
+                          if params.get("action") == "edit"])
@@ -0,0 +1,66 @@
+import unittest
+
+from cerabot.wiki.exclusion import ExclusionChecker
+from tests.util import FakeSiteTestCase
+
+class ExclusionCheckerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.checker = ExclusionChecker(u"Cera Bot", optout=["dates"])
+
+    def excluded(self, text):
+        return self.checker.is_excluded(text)
+
+    def test_plain_templates(self):
+        self.assertFalse(self.excluded(u""))
+        self.assertFalse(self.excluded(u"No templates here."))
+        self.assertFalse(self.excluded(u"{{bots}}"))
+        self.assertTrue(self.excluded(u"{{nobots}}"))
+        self.assertTrue(self.excluded(u"Text {{ NoBots }} text"))
+        self.assertFalse(self.excluded(u"{{nobots-like}}"))
+
+    def test_allow(self):
+        self.assertFalse(self.excluded(u"{{bots|allow=Other,Cera_Bot}}"))
+        self.assertFalse(self.excluded(u"{{bots|allow=all}}"))
+        self.assertTrue(self.excluded(u"{{bots|allow=Other}}"))
+        self.assertTrue(self.excluded(u"{{bots|allow=none}}"))
+
+    def test_deny(self):
+        self.assertTrue(self.excluded(u"{{bots|deny=cera bot}}"))
+        self.assertTrue(self.excluded(u"{{bots|deny=all}}"))
+        self.assertFalse(self.excluded(u"{{bots|deny=Other}}"))
+        self.assertFalse(self.excluded(u"{{bots|deny=none}}"))
+
+    def test_optout(self):
+        self.assertTrue(self.excluded(u"{{bots|optout=dates}}"))
+        self.assertTrue(self.excluded(u"{{bots|optout=all}}"))
+        self.assertFalse(self.excluded(u"{{bots|optout=links}}"))
+        other = ExclusionChecker(u"Cera Bot")
+        self.assertFalse(other.is_excluded(u"{{bots|optout=all}}"))
+
+    def test_any_template_excludes(self):
+        text = u"{{bots|allow=all}}\n{{bots|deny=Cera Bot}}"
+        self.assertTrue(self.excluded(text))
+
+    def test_check_many(self):
+        texts = {u"A": u"{{nobots}}", u"B": u"text"}
+        self.assertEqual(self.checker.check_many(texts),
+                         {u"A": True, u"B": False})
+        self.assertEqual(self.checker.check_many([u"{{nobots}}", u""]),
+                         [True, False])
+
+
+class PageExclusionTest(FakeSiteTestCase):
+    fixture = {"pages": {u"Open": u"Text.", u"Closed": u"{{nobots}}",
+                         u"Picky": u"{{bots|deny=Editor}}"},
+               "users": {u"Editor": {"password": "pw"}}}
+
+    def test_pages_use_the_logged_in_name(self):
+        titles = [u"Open", u"Closed", u"Picky"]
+        pages = self.site.load_pages(titles)
+        self.assertEqual([p.is_excluded for p in pages],
+                         [False, True, False])
+        self.site.login((u"Editor", "pw"))
+        pages = self.site.load_pages(titles)
+        self.assertEqual([p.title for p in
+                          self.site.exclusion.allowed(pages)], [u"Open"])
@@ -0,0 +1,180 @@
+import os
+import shutil
+import tempfile
+
+from cerabot import exceptions
+from cerabot.wiki.cache import ResponseCache
+from cerabot.wiki.file import File
+from tests.util import FakeSiteTestCase, record_queries
+
+DATA = "".join(chr(i % 256) for i in xrange(25))
+
+class FileTestCase(FakeSiteTestCase):
+    """Gives each test a scratch directory to upload from or download
+    into."""
+
+    def setUp(self):
+        super(FileTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(FileTestCase, self).tearDown()
+
+
+class UploadTest(FileTestCase):
+    fixture = {"files": {u"File:Old.png": {"data": DATA}},
+               "users": {u"Uploader": {"password": "pw"}}}
+
+    def setUp(self):
+        super(UploadTest, self).setUp()
+        self.path = os.path.join(self.directory, "upload.png")
+        with open(self.path, "wb") as fp:
+            fp.write(DATA[::-1])
+        self.site.login((u"Uploader", "pw"))
+        self.sent = record_queries(self.site)
+
+    def uploads(self):
+        return [params for params in self.sent
+                if params.get("action") == "upload"]
+
+    def test_unchanged_file_uses_loaded_imageinfo(self):
+        with open(self.path, "wb") as fp:
+            fp.write(DATA)
+        image = self.site.file(u"File:Old.png")
+        image.load_attributes()
+        del self.sent[:]
+        result = image.upload(self.path)
+        self.assertIn("nochange", result)
+        self.assertFalse([params for params in self.sent
+                          if params.get("prop") == "imageinfo"])
+        self.assertEqual(self.uploads(), [])
+
+    def test_small_file_in_one_request(self):
+        result = self.site.file(u"File:New.png").upload(self.path)
+        self.assertEqual(result["result"], "Success")
+        self.assertEqual(len(self.uploads()), 1)
+        self.assertEqual(self.wiki.files[u"File:New.png"]["data"],
+                         DATA[::-1])
+
+    def test_chunked_upload(self):
+        self.site.file(u"File:New.png").upload(self.path, chunk_size=10)
+        chunks = [params["offset"] for params in self.uploads()
+                  if "chunk" in params]
+        self.assertEqual(chunks, [0, 10, 20])
+        self.assertEqual(self.wiki.files[u"File:New.png"]["data"],
+                         DATA[::-1])
+
+    def test_resumed_upload(self):
+        query = self.site.query
+
+        def failing(params, *args, **kwargs):
+            if params.get("offset") == 10:
+                self.site.query = query
+                raise exceptions.APIError("Connection lost")
+            return query(params, *args, **kwargs)
+        self.site.query = failing
+        image = self.site.file(u"File:New.png")
+        try:
+            image.upload(self.path, chunk_size=10)
+        except exceptions.UploadError as error:
+            self.assertEqual(error.offset, 10)
+            filekey = error.filekey
+        else:
+            self.fail("UploadError not raised")
+        self.assertTrue(filekey)
+        del self.sent[:]
+        image.upload(self.path, chunk_size=10, filekey=filekey)
+        chunks = [params["offset"] for params in self.uploads()
+                  if "chunk" in params]
+        self.assertEqual(chunks, [10, 20])
+        self.assertEqual(self.wiki.files[u"File:New.png"]["data"],
+                         DATA[::-1])
+
+    def test_upload_invalidates_the_cache(self):
+        site = self.make_site(cache=ResponseCache())
+        site.login((u"Uploader", "pw"))
+        image = site.file(u"File:Old.png")
+        image.load_attributes()
+        image.upload(self.path)
+        image = site.file(u"File:Old.png")
+        image.load_attributes()
+        self.assertEqual(image.hashed, self.wiki.files[u"File:Old.png"][
+            "sha1"])
+
+
+class LoadFilesTest(FakeSiteTestCase):
+    fixture = {"files": dict((u"File:{0}.png".format(i),
+                              {"data": DATA[:i + 1]}) for i in xrange(6))}
+
+    def test_imageinfo_comes_with_the_page_info(self):
+        self.site._title_limit = lambda: 4
+        titles = sorted(self.fixture["files"]) + [u"File:Missing.png"]
+        titles[2] = self.site.file(titles[2])
+        requests = self.server.requests
+        files = self.site.load_files(titles)
+        self.assertEqual(self.server.requests, requests + 2)
+        self.assertIs(files[2], titles[2])
+        self.assertTrue(all(isinstance(f, File) for f in files))
+        self.assertEqual([f.size for f in files[:-1]], range(1, 7))
+        self.assertEqual(files[0].hashed,
+                         self.wiki.files[u"File:0.png"]["sha1"])
+        self.assertFalse(files[-1].exists)
+        self.assertIsNone(files[-1].url)
+        self.assertEqual(self.server.requests, requests + 2)
+
+
+class DownloadTest(FileTestCase):
+    fixture = {"files": {u"File:Good.png": {"data": DATA},
+                         u"File:Bad.png": {"data": DATA}}}
+
+    def setUp(self):
+        super(DownloadTest, self).setUp()
+        # The wiki reports a SHA-1 that the data it serves doesn't have.
+        self.wiki.files[u"File:Bad.png"]["sha1"] = "0" * 40
+        self.opened = []
+        open_ = self.site.opener.open
+
+        def recording(request, *args):
+            if not isinstance(request, basestring):
+                self.opened.append(request.get_full_url())
+            return open_(request, *args)
+        self.site.opener.open = recording
+
+    def local(self, name):
+        return os.path.join(self.directory, name)
+
+    def read(self, name):
+        with open(self.local(name), "rb") as fp:
+            return fp.read()
+
+    def test_download(self):
+        image = self.site.file(u"File:Good.png")
+        self.assertTrue(image.download(self.local("Good.png")))
+        self.assertEqual(self.read("Good.png"), DATA)
+        self.assertEqual(len(self.opened), 1)
+        self.assertEqual(os.listdir(self.directory), ["Good.png"])
+
+    def test_verified_copy_is_kept(self):
+        with open(self.local("Good.png"), "wb") as fp:
+            fp.write(DATA)
+        image = self.site.file(u"File:Good.png")
+        self.assertTrue(image.download(self.local("Good.png")))
+        self.assertEqual(self.opened, [])
+
+    def test_mismatch_leaves_the_old_copy(self):
+        with open(self.local("Bad.png"), "wb") as fp:
+            fp.write("old")
+        image = self.site.file(u"File:Bad.png")
+        self.assertRaises(exceptions.DownloadError, image.download,
+                          self.local("Bad.png"))
+        self.assertEqual(self.read("Bad.png"), "old")
+        self.assertEqual(os.listdir(self.directory), ["Bad.png"])
+
+    def test_download_files(self):
+        results = self.site.download_files(
+            [u"File:Good.png", u"File:Bad.png"], self.directory)
+        self.assertIs(results[u"File:Good.png"], True)
+        self.assertIsInstance(results[u"File:Bad.png"],
+                              exceptions.DownloadError)
+        self.assertEqual(os.listdir(self.directory), ["Good.png"])
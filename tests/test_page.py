@@ -0,0 +1,163 @@
+import unittest
+from datetime import datetime
+
+from cerabot import exceptions
+from cerabot.wiki.page import Page, _minimal_edit
+from tests.util import FakeSiteTestCase, record_queries
+
+TEXT = u"Lead.\n\n== One ==\nFirst.\n\n== Two ==\nSecond."
+
+class MinimalEditTest(unittest.TestCase):
+
+    def test_append_and_prepend(self):
+        self.assertEqual(_minimal_edit(TEXT, TEXT + u"\nMore."),
+                         {"appendtext": u"\nMore."})
+        self.assertEqual(_minimal_edit(TEXT, u"Top.\n" + TEXT),
+                         {"prependtext": u"Top.\n"})
+
+    def test_one_section(self):
+        new = TEXT.replace(u"First.", u"Changed.")
+        self.assertEqual(_minimal_edit(TEXT, new),
+                         {"section": 1, "text": u"== One ==\nChanged."})
+        new = TEXT.replace(u"Second.", u"Changed.")
+        self.assertEqual(_minimal_edit(TEXT, new),
+                         {"section": 2, "text": u"== Two ==\nChanged."})
+
+    def test_full_text_when_unsure(self):
+        both = TEXT.replace(u"First.", u"1.").replace(u"Second.", u"2.")
+        self.assertIsNone(_minimal_edit(TEXT, both))
+        retitled = TEXT.replace(u"== One ==", u"== Uno ==")
+        self.assertIsNone(_minimal_edit(TEXT, retitled))
+        commented = TEXT.replace(u"Lead.", u"<!-- Lead. -->")
+        self.assertIsNone(_minimal_edit(commented, commented.replace(
+            u"Second.", u"Changed.")))
+
+    def test_full_text_when_expanded_before_a_heading(self):
+        for markup in (u"{{Infobox}}", u"<ref>A.</ref>", u"<POEM>A</POEM>",
+                       u"<gallery>\nA.jpg\n</gallery>"):
+            old = TEXT.replace(u"Lead.", markup)
+            new = old.replace(u"Second.", u"Changed.")
+            self.assertIsNone(_minimal_edit(old, new), markup)
+
+    def test_templates_after_the_last_heading(self):
+        old = TEXT + u"\n{{Navbox}}"
+        new = old.replace(u"Second.", u"Changed.")
+        self.assertEqual(_minimal_edit(old, new), {
+            "section": 2, "text": u"== Two ==\nChanged.\n{{Navbox}}"})
+
+
+class EditTest(FakeSiteTestCase):
+    fixture = {"pages": {u"A": TEXT}}
+
+    def setUp(self):
+        super(EditTest, self).setUp()
+        self.queries = record_queries(self.site)
+        self.page = self.site.page(u"A")
+        self.page.load(fields=("info", "revision", "content"))
+
+    @property
+    def sent(self):
+        return [params for params in self.queries
+                if params.get("action") == "edit"]
+
+    def test_null_edit_is_not_sent(self):
+        result = self.page.edit(TEXT, u"Nothing")
+        self.assertIn("nochange", result["edit"])
+        self.assertEqual(self.sent, [])
+        self.assertEqual(len(self.wiki.page(u"A")["revisions"]), 1)
+
+    def test_only_the_changed_section_is_sent(self):
+        new = TEXT.replace(u"First.", u"Changed.")
+        self.page.edit(new, u"One section")
+        self.assertEqual(self.sent[0]["section"], 1)
+        self.assertNotIn(u"Second.", self.sent[0]["text"])
+        self.assertEqual(self.wiki.text(self.wiki.page(u"A")), new)
+
+    def test_full_text_with_a_template_before_a_heading(self):
+        self.page.edit(u"{{Lead}}\n" + TEXT[len(u"Lead.\n"):], u"Template")
+        self.page.load(fields=("info", "revision", "content"))
+        new = self.page.content.replace(u"Second.", u"Changed.")
+        self.page.edit(new, u"Full")
+        self.assertNotIn("section", self.sent[-1])
+        self.assertEqual(self.sent[-1]["text"], new)
+        self.assertEqual(self.wiki.text(self.wiki.page(u"A")), new)
+
+
+class LazyFieldsTest(FakeSiteTestCase):
+    fixture = {"pages": {u"A": TEXT}}
+
+    def setUp(self):
+        super(LazyFieldsTest, self).setUp()
+        self.wiki.add_page(u"A", TEXT + u"\nMore.", user=u"Second")
+        self.sent = record_queries(self.site)
+
+    def test_groups_load_on_first_use(self):
+        page = self.site.page(u"A")
+        self.assertEqual(self.sent, [])
+        self.assertTrue(page.exists)
+        self.assertEqual(self.sent[-1]["prop"], "info")
+        self.assertEqual(page.last_editor, u"Second")
+        self.assertEqual(self.sent[-1]["prop"], "revisions")
+        self.assertNotIn("content", self.sent[-1]["rvprop"])
+        page.pageid, page.last_edited
+        self.assertEqual(len(self.sent), 2)
+
+    def test_load_gets_every_group_at_once(self):
+        page = self.site.page(u"A")
+        page.load()
+        page.content, page.langlinks, page.last_editor, page.exists
+        self.assertEqual(len(self.sent), 1)
+
+    def test_creator_is_asked_for_on_its_own(self):
+        page = Page(self.site, u"A", fields=("info", "creator"))
+        page.load()
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(page.creator, u"Example")
+        page.load(fields=("revision", "creator"))
+        self.assertEqual(len(self.sent), 3)
+        self.assertEqual(self.sent[-1]["rvdir"], "newer")
+
+    def test_unknown_fields(self):
+        self.assertRaises(exceptions.InvalidOptionError, Page, self.site,
+                          u"A", fields=("nosuchfield",))
+
+
+class RevisionsTest(FakeSiteTestCase):
+    fixture = {"pages": {u"Other": u"o"}}
+
+    def setUp(self):
+        super(RevisionsTest, self).setUp()
+        for i in xrange(60):
+            self.wiki.add_page(u"History", u"Text {0}".format(i),
+                               user=(u"Even", u"Odd")[i % 2],
+                               timestamp=u"2020-01-01T00:{0:02}:00Z".format(i))
+        self.page = self.site.page(u"History")
+        self.sent = record_queries(self.site)
+
+    def test_newest_first_a_batch_at_a_time(self):
+        revisions = list(self.page.revisions(content=True))
+        self.assertEqual([r.content for r in revisions],
+                         [u"Text {0}".format(i) for i in xrange(59, -1, -1)])
+        self.assertEqual(len(self.sent), 2)
+        self.assertEqual(revisions[0].parentid, revisions[1].revid)
+        self.assertIs(revisions[0].user, revisions[2].user)
+        self.assertFalse(revisions[0].minor)
+
+    def test_range_oldest_first(self):
+        revisions = self.page.revisions(
+            start=datetime(2020, 1, 1, 0, 10), end=u"2020-01-01T00:12:00Z",
+            props=("ids", "user"), newer=True)
+        revisions = list(revisions)
+        self.assertEqual([r.user for r in revisions],
+                         [u"Even", u"Odd", u"Even"])
+        self.assertIsNone(revisions[0].timestamp)
+        self.assertIsNone(revisions[0].minor)
+
+    def test_many_pages(self):
+        other = self.wiki.page(u"Other")["pageid"]
+        revisions = list(self.site.iter_revisions(
+            [u"Missing", other, self.page], end=u"2020-01-01T00:59:00Z"))
+        self.assertEqual([r.title for r in revisions],
+                         [u"Other", u"History"])
+        self.assertEqual(revisions[1].time.replace(tzinfo=None),
+                         datetime(2020, 1, 1, 0, 59))
@@ -0,0 +1,38 @@
+import os
+import shutil
+import tempfile
+
+from cerabot.wiki.replay import RecordingOpener, ReplayOpener
+from tests.util import FakeSiteTestCase
+
+class RecordingTest(FakeSiteTestCase):
+    fixture = {"pages": {u"A": u"a"},
+               "users": {u"Editor": {"password": "secret-pw"}}}
+
+    def setUp(self):
+        super(RecordingTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "session.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(RecordingTest, self).tearDown()
+
+    def test_secrets_are_not_written(self):
+        opener = RecordingOpener(self.path)
+        site = self.make_site(opener=opener)
+        site.login((u"Editor", "secret-pw"))
+        token = site.tokens["edit"]
+        site.page(u"A").load()
+        opener.close()
+        with open(self.path) as fp:
+            recording = fp.read()
+        self.assertNotIn("secret-pw", recording)
+        self.assertNotIn(token.replace("\\", "\\\\"), recording)
+        self.assertNotIn("set-cookie", recording.lower())
+        self.assertIn("redacted", recording)
+
+        site = self.make_site(opener=ReplayOpener(self.path))
+        page = site.page(u"A")
+        page.load()
+        self.assertEqual(page.content, u"a")
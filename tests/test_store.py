@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from cerabot.wiki.store import ContentStore
+from tests.util import FakeSiteTestCase
+
+class ContentStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = ContentStore(self.directory)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def reopen(self):
+        self.store.close()
+        self.store = ContentStore(self.directory)
+
+    def test_texts_are_shared_and_kept(self):
+        self.store.put(1, 10, u"caf\xe9")
+        self.store.put(2, 20, u"caf\xe9")
+        self.store.put(1, 11, u"other")
+        self.reopen()
+        self.assertEqual(self.store.get(2, 20), u"caf\xe9")
+        self.assertEqual(self.store.get(1, 11), u"other")
+        self.assertIsNone(self.store.get(1, 12))
+        stats = self.store.stats()
+        self.assertEqual((stats["revisions"], stats["texts"]), (3, 2))
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 1))
+
+    def test_a_line_cut_short_is_dropped(self):
+        self.store.put(1, 10, u"kept")
+        self.store.close()
+        with open(os.path.join(self.directory, "index"), "ab") as fp:
+            fp.write("R 1 11 ")
+        self.store = ContentStore(self.directory)
+        self.assertNotIn((1, 11), self.store)
+        self.store.put(1, 12, u"after")
+        self.reopen()
+        self.assertEqual(self.store.get(1, 10), u"kept")
+        self.assertEqual(self.store.get(1, 12), u"after")
+
+    def test_a_damaged_text_is_a_miss(self):
+        self.store.put(1, 10, u"text")
+        self.store.close()
+        with open(os.path.join(self.directory, "segment-0000"), "r+b") as fp:
+            fp.seek(3)
+            fp.write("garbage")
+        self.store = ContentStore(self.directory)
+        self.assertIsNone(self.store.get(1, 10))
+        self.assertEqual(self.store.stats()["misses"], 1)
+        self.store.put(1, 10, u"text")
+        self.assertEqual(self.store.get(1, 10), u"text")
+
+
+class StoredLoadTest(FakeSiteTestCase):
+    fixture = {"pages": {u"A": u"a", u"B": u"b", u"C": u"c"}}
+
+    def setUp(self):
+        super(StoredLoadTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.store = ContentStore(self.directory)
+        self.site = self.make_site(content_store=self.store)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+        super(StoredLoadTest, self).tearDown()
+
+    def test_cold_load_takes_one_request(self):
+        before = self.server.requests
+        page = self.site.page(u"A")
+        page.load(fields=("info", "content"))
+        self.assertEqual(page.content, u"a")
+        self.assertEqual(self.server.requests - before, 1)
+        self.assertEqual(len(self.store), 1)
+
+    def test_only_missing_content_is_fetched(self):
+        self.site.load_pages([u"A", u"B"])
+        self.wiki.add_page(u"B", u"b2")
+        before = self.server.requests
+        pages = self.site.load_pages([u"A", u"B", u"C"])
+        self.assertEqual([p.content for p in pages], [u"a", u"b2", u"c"])
+        # One request for the revision ids, one for the two misses.
+        self.assertEqual(self.server.requests - before, 2)
+        self.assertEqual(self.store.stats()["hits"], 1)
+
+    def test_page_load_reads_the_store(self):
+        self.site.load_pages([u"A"])
+        page = self.site.page(u"A")
+        page.load(fields=("info", "content"))
+        self.assertEqual(page.content, u"a")
+        self.assertEqual(self.store.stats()["hits"], 1)
@@ -0,0 +1,61 @@
+import unittest
+
+from cerabot import exceptions
+from cerabot.wiki.title import NamespaceIndex, Title
+
+NAMESPACES = {-1: [u"Special"], 0: [u""], 1: [u"Talk"],
+              2: [u"User", u"U"], 3: [u"User talk", u"UT"],
+              6: [u"File", u"Image"], 14: [u"Category"]}
+
+class NamespaceIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = NamespaceIndex(NAMESPACES)
+
+    def parse(self, title, default_ns=0):
+        title = self.index.parse(title, default_ns)
+        return title.ns, title.full
+
+    def test_normalizes(self):
+        self.assertEqual(self.parse(u"foo_bar\u00a0 baz"),
+                         (0, u"Foo bar baz"))
+        self.assertEqual(self.parse(u"  foo  #Section"), (0, u"Foo"))
+        self.assertEqual(self.parse("caf\xc3\xa9"), (0, u"Caf\xe9"))
+
+    def test_namespace_prefixes_and_aliases(self):
+        self.assertEqual(self.parse(u"user_talk:example"),
+                         (3, u"User talk:Example"))
+        self.assertEqual(self.parse(u"UT : example"),
+                         (3, u"User talk:Example"))
+        self.assertEqual(self.parse(u"image:A.jpg"), (6, u"File:A.jpg"))
+        self.assertEqual(self.parse(u"Foo:bar"), (0, u"Foo:bar"))
+
+    def test_default_namespace(self):
+        self.assertEqual(self.parse(u"Stubs", 14), (14, u"Category:Stubs"))
+        self.assertEqual(self.parse(u"User:A", 14), (2, u"User:A"))
+        self.assertEqual(self.parse(u":Stubs", 14), (0, u"Stubs"))
+
+    def test_invalid_titles(self):
+        for title in (u"", u"#Section", u"A|B", u"A[1]", u"{{A}}",
+                      u"User:", u"A\x07"):
+            self.assertRaises(exceptions.InvalidPageError, self.index.parse,
+                              title)
+
+    def test_case_sensitive_wiki(self):
+        index = NamespaceIndex(NAMESPACES, case="case-sensitive")
+        self.assertEqual(index.parse(u"user:iPhone").full, u"User:iPhone")
+
+    def test_titles_are_interned(self):
+        title = self.index.parse(u"User:A")
+        self.assertIs(self.index.parse(u"user:A"), title)
+        self.assertIs(self.index.parse(title), title)
+        self.assertIs(title.talk(), self.index.parse(u"User talk:A"))
+        self.assertEqual(title, u"User:A")
+        self.assertIsInstance(title, Title)
+
+    def test_interned_titles_are_bounded(self):
+        index = NamespaceIndex(NAMESPACES, max_interned=10)
+        for i in xrange(25):
+            index.parse(u"Page {0}".format(i))
+        self.assertLessEqual(len(index._parsed), 10)
+        self.assertLessEqual(len(index._titles), 10)
@@ -0,0 +1,62 @@
+from cerabot import exceptions
+from cerabot.wiki.page import Page
+from tests.util import FakeSiteTestCase
+
+USERS = {u"Admin": {"password": "pw", "groups": ["sysop"]},
+         u"Editor": {"password": "pw"}}
+
+class TokenManagerTest(FakeSiteTestCase):
+    fixture = {"pages": {u"A": u"a"}, "users": USERS}
+
+    def test_actions_share_one_fetch(self):
+        self.site.login((u"Editor", "pw"))
+        before = self.server.requests
+        tokens = self.site.tokens.fetch("edit", "move", "delete")
+        self.assertEqual(len(set(tokens.values())), 1)
+        self.assertEqual(self.site.tokens["protect"], tokens["edit"])
+        self.assertEqual(self.server.requests - before, 1)
+
+    def test_login_clears_tokens(self):
+        anonymous = self.site.tokens["edit"]
+        self.site.login((u"Editor", "pw"))
+        self.assertNotEqual(self.site.tokens["edit"], anonymous)
+
+    def test_rejected_token_is_refreshed(self):
+        self.site.login((u"Editor", "pw"))
+        good = self.site.tokens["edit"]
+        self.site.tokens._tokens["csrf"] = "stale+\\"
+        page = Page(self.site, u"A")
+        page.load()
+        page.edit(u"changed", u"test")
+        self.assertEqual(self.site.tokens["edit"], good)
+        self.assertEqual(self.wiki.text(self.wiki.page(u"A")), u"changed")
+
+
+class AssertAbilityTest(FakeSiteTestCase):
+    fixture = {"pages": {u"A": u"a"}, "users": USERS}
+
+    def test_anonymous_user_cannot_delete(self):
+        page = Page(self.site, u"A")
+        page.assert_ability("edit")
+        for action in ("delete", "protect", "move"):
+            self.assertRaises(exceptions.PermissionsError,
+                              page.assert_ability, action)
+
+    def test_rights_follow_login(self):
+        page = Page(self.site, u"A")
+        self.site.login((u"Editor", "pw"))
+        page.assert_ability("move")
+        page.assert_ability("watch")
+        self.assertRaises(exceptions.PermissionsError,
+                          page.assert_ability, "delete")
+        self.site.login((u"Admin", "pw"))
+        page.assert_ability("delete")
+
+    def test_rights_are_asked_for_once(self):
+        page = Page(self.site, u"A")
+        page.assert_ability("edit")
+        before = self.server.requests
+        page.assert_ability("edit")
+        self.assertRaises(exceptions.PermissionsError,
+                          page.assert_ability, "block")
+        self.assertEqual(self.server.requests, before)
@@ -0,0 +1,51 @@
+"""Helpers shared by the tests, which run against a FakeAPIServer:
+
+    python -m unittest discover -s tests -t .
+"""
+import copy
+import unittest
+
+from cerabot.wiki.api import Site
+from cerabot.wiki.fakeapi import FakeWiki, FakeAPIServer
+
+CONFIG = {"throttle": 0, "read_throttle": 0}
+
+class FakeSiteTestCase(unittest.TestCase):
+    """Starts a FakeAPIServer serving *fixture* for every test, with a Site
+    talking to it as self.site. *server_options* are passed on to the
+    FakeAPIServer."""
+    fixture = {}
+    server_options = {}
+
+    def setUp(self):
+        self.sites = []
+        self.wiki = FakeWiki(copy.deepcopy(self.fixture))
+        self.server = FakeAPIServer(self.wiki, **self.server_options).start()
+        self.site = self.make_site()
+
+    def tearDown(self):
+        # Close kept-alive connections, so the server's threads can end.
+        for site in self.sites:
+            if hasattr(site.opener, "close"):
+                site.opener.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def make_site(self, cls=Site, **kwargs):
+        config = dict(CONFIG, **kwargs.pop("config", {}))
+        site = cls(base_url=self.server.base_url, config=config, **kwargs)
+        self.sites.append(site)
+        return site
+
+
+def record_queries(site):
+    """Makes *site* note down the parameters of each query it sends, and
+    returns the list they are added to."""
+    sent = []
+    query = site.query
+
+    def recording(params, *args, **kwargs):
+        sent.append(dict(params))
+        return query(params, *args, **kwargs)
+    site.query = recording
+    return sent